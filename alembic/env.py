@@ -1,3 +1,4 @@
+import os
 from logging.config import fileConfig
 
 from sqlalchemy import engine_from_config
@@ -8,10 +9,15 @@ from app.models import Base  # Ensure the correct path to your models
 # This is the Alembic Config object, which provides access to the values within the .ini file in use.
 config = context.config
 
-# Interpret the config file for Python logging.
-if config.config_file_name is not None:
+# Interpret the config file for Python logging, unless called from app.bootstrap inside a
+# running application whose logging is already set up
+if config.config_file_name is not None and "connection" not in config.attributes:
     fileConfig(config.config_file_name)
 
+# DATABASE_URL from the environment wins over the URL in alembic.ini
+if os.getenv("DATABASE_URL") and "connection" not in config.attributes:
+    config.set_main_option("sqlalchemy.url", os.environ["DATABASE_URL"].replace("%", "%%"))
+
 # Add your model's MetaData object here for 'autogenerate' support
 # This points to the metadata of all your models
 target_metadata = Base.metadata
@@ -47,6 +53,14 @@ def run_migrations_online() -> None:
 
     In this scenario, we need to create an Engine and associate a connection with the context.
     """
+    # app.bootstrap passes its own connection, already inside a transaction
+    connection = config.attributes.get("connection")
+    if connection is not None:
+        context.configure(connection=connection, target_metadata=target_metadata)
+        with context.begin_transaction():
+            context.run_migrations()
+        return
+
     connectable = engine_from_config(
         config.get_section(config.config_ini_section),
         prefix="sqlalchemy.",
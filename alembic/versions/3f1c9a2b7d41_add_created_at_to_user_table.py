@@ -0,0 +1,34 @@
+"""add created_at to user_table
+
+Revision ID: 3f1c9a2b7d41
+Revises: 
+Create Date: 2026-10-18 10:12:31.402118
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3f1c9a2b7d41'
+down_revision: Union[str, None] = None
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Databases bootstrapped by create_all after this change already have the column
+    columns = {column["name"] for column in sa.inspect(op.get_bind()).get_columns("user_table")}
+    if "created_at" not in columns:
+        op.add_column(
+            "user_table",
+            sa.Column("created_at", sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=False),
+        )
+    op.create_index(op.f("ix_user_table_created_at"), "user_table", ["created_at"], unique=False, if_not_exists=True)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f("ix_user_table_created_at"), table_name="user_table")
+    op.drop_column("user_table", "created_at")
@@ -0,0 +1,104 @@
+"""add contact_keys
+
+Revision ID: 8b2d4e6f1a93
+Revises: 3f1c9a2b7d41
+Create Date: 2026-10-18 11:40:07.918265
+
+"""
+import os
+import re
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql, sqlite
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8b2d4e6f1a93'
+down_revision: Union[str, None] = '3f1c9a2b7d41'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+BACKFILL_CHUNK = 10000
+
+# Normalization as of this revision (app.contacts), frozen here so the migration replays the same
+# way whatever the application code becomes
+DEFAULT_COUNTRY_CODE = os.getenv("DEFAULT_COUNTRY_CODE", "91")
+NON_DIGITS = re.compile(r"\D")
+
+
+def normalize_mobile_number(value: str):
+    value = value.strip()
+    digits = NON_DIGITS.sub("", value)
+    if value.startswith("+"):
+        return f"+{digits}"
+    if digits.startswith("00"):
+        return f"+{digits[2:]}"
+    if len(digits) == 11 and digits.startswith("0"):
+        digits = digits[1:]
+    if len(digits) == 10:
+        return f"+{DEFAULT_COUNTRY_CODE}{digits}"
+    return f"+{digits}"
+
+
+def normalize_email(value: str):
+    return value.strip().lower()
+
+contact_keys = sa.table(
+    "contact_keys",
+    sa.column("key", sa.String),
+    sa.column("kind", sa.String),
+    sa.column("user_id", sa.Integer),
+)
+
+
+def upgrade() -> None:
+    bind = op.get_bind()
+    if not sa.inspect(bind).has_table("contact_keys"):
+        op.create_table(
+            "contact_keys",
+            sa.Column("id", sa.Integer(), nullable=False),
+            sa.Column("key", sa.String(), nullable=False),
+            sa.Column("kind", sa.String(), nullable=False),
+            sa.Column("user_id", sa.Integer(), nullable=False),
+            sa.ForeignKeyConstraint(["user_id"], ["user_table.id"], ondelete="CASCADE"),
+            sa.PrimaryKeyConstraint("id"),
+            sa.UniqueConstraint("key", name="uix_contact_key"),
+        )
+        op.create_index(op.f("ix_contact_keys_id"), "contact_keys", ["id"], unique=False)
+        op.create_index(op.f("ix_contact_keys_user_id"), "contact_keys", ["user_id"], unique=False)
+
+    # Backfill in primary key order, one chunk per statement. Normalization happens in Python so it
+    # matches the application exactly; the first user of a contact that already exists under two
+    # registration types keeps the key.
+    insert = (postgresql.insert if bind.dialect.name == "postgresql" else sqlite.insert)(contact_keys)
+    insert = insert.on_conflict_do_nothing()
+    last_id = 0
+    while True:
+        rows = bind.execute(sa.text(
+            "SELECT u.id, COALESCE(s.mobile_number, b.mobile_number) AS mobile_number, p.email "
+            "FROM user_table u "
+            "LEFT JOIN social_media_data s ON u.social_media_id = s.id "
+            "LEFT JOIN platform_registration_data p ON u.platform_registration_id = p.id "
+            "LEFT JOIN basic_signup_data b ON u.basic_signup_id = b.id "
+            "WHERE u.id > :last_id AND NOT EXISTS (SELECT 1 FROM contact_keys c WHERE c.user_id = u.id) "
+            "ORDER BY u.id LIMIT :chunk"
+        ), {"last_id": last_id, "chunk": BACKFILL_CHUNK}).all()
+        if not rows:
+            break
+        values = []
+        for user_id, mobile_number, email in rows:
+            if mobile_number is not None:
+                values.append({"key": normalize_mobile_number(mobile_number), "kind": "mobile_number", "user_id": user_id})
+            elif email is not None:
+                values.append({"key": normalize_email(email), "kind": "email", "user_id": user_id})
+        if values:
+            bind.execute(insert, values)
+        last_id = rows[-1][0]
+
+
+def downgrade() -> None:
+    op.drop_index(op.f("ix_contact_keys_user_id"), table_name="contact_keys")
+    op.drop_index(op.f("ix_contact_keys_id"), table_name="contact_keys")
+    op.drop_table("contact_keys")
@@ -0,0 +1,132 @@
+"""add user_search
+
+Revision ID: 9d4b2a7c5e18
+Revises: f3a7c1e9d852
+Create Date: 2026-10-18 22:14:36.502917
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql, sqlite
+
+
+# revision identifiers, used by Alembic.
+revision: str = '9d4b2a7c5e18'
+down_revision: Union[str, None] = 'f3a7c1e9d852'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+BACKFILL_CHUNK = 10000
+REGISTRATION_TYPES = ("SOCIAL_MEDIA", "PROJECT_MANAGEMENT", "COMMON_SIGNUP")
+
+
+# Normalization as of this revision (app.search), frozen here so the migration replays the same
+# way whatever the application code becomes
+def search_text(value):
+    # Lowercase with single spaces, hashtags without their "#"
+    return " ".join(value.strip().lstrip("#").split()).lower() if value is not None else None
+
+
+def search_row(user_id, reg_type, first_name, last_name, email, hashtag):
+    return {
+        "user_id": user_id,
+        "type": reg_type,
+        "first_name": search_text(first_name),
+        "last_name": search_text(last_name),
+        "email": email.strip().lower() if email is not None else None,
+        "hashtag": search_text(hashtag),
+    }
+
+user_search = sa.table(
+    "user_search",
+    sa.column("user_id", sa.Integer),
+    sa.column("type", sa.String),
+    sa.column("first_name", sa.String),
+    sa.column("last_name", sa.String),
+    sa.column("email", sa.String),
+    sa.column("hashtag", sa.String),
+)
+
+
+def create_indexes(bind):
+    # Postgres only, SQLite searches by scanning the table
+    if bind.dialect.name != "postgresql":
+        return
+    op.create_index(
+        "ix_user_search_name_trgm", "user_search", ["name"],
+        postgresql_using="gin", postgresql_ops={"name": "gin_trgm_ops"},
+    )
+    op.create_index(
+        "ix_user_search_hashtag_trgm", "user_search", ["hashtag"],
+        postgresql_using="gin", postgresql_ops={"hashtag": "gin_trgm_ops"},
+    )
+    op.create_index("ix_user_search_email_prefix", "user_search", ["email"], postgresql_ops={"email": "text_pattern_ops"})
+
+
+def upgrade() -> None:
+    bind = op.get_bind()
+    created = not sa.inspect(bind).has_table("user_search")
+    if created:
+        if bind.dialect.name == "postgresql":
+            op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+        op.create_table(
+            "user_search",
+            sa.Column("user_id", sa.Integer(), nullable=False),
+            sa.Column(
+                "type",
+                # Postgres already has the enum type from user_table
+                sa.Enum(*REGISTRATION_TYPES, name="registrationtype").with_variant(
+                    postgresql.ENUM(*REGISTRATION_TYPES, name="registrationtype", create_type=False), "postgresql"
+                ),
+                nullable=False,
+            ),
+            sa.Column("first_name", sa.String(), nullable=False),
+            sa.Column("last_name", sa.String(), nullable=False),
+            sa.Column("name", sa.String(), sa.Computed("first_name || ' ' || last_name", persisted=True)),
+            sa.Column("email", sa.String(), nullable=True),
+            sa.Column("hashtag", sa.String(), nullable=True),
+            sa.ForeignKeyConstraint(["user_id"], ["user_table.id"], ondelete="CASCADE"),
+            sa.PrimaryKeyConstraint("user_id"),
+        )
+
+    # Backfill in primary key order, one chunk per statement, before the indexes exist: building a GIN
+    # index once is much cheaper than maintaining it row by row. Normalization happens in Python so
+    # it matches the application exactly.
+    insert = (postgresql.insert if bind.dialect.name == "postgresql" else sqlite.insert)(user_search)
+    insert = insert.on_conflict_do_nothing()
+    last_id = 0
+    while True:
+        rows = bind.execute(sa.text(
+            "SELECT u.id, u.type, "
+            "COALESCE(s.first_name, p.first_name, b.first_name) AS first_name, "
+            "COALESCE(s.last_name, p.last_name, b.last_name) AS last_name, p.email, s.hashtag "
+            "FROM user_table u "
+            "LEFT JOIN social_media_data s ON u.social_media_id = s.id "
+            "LEFT JOIN platform_registration_data p ON u.platform_registration_id = p.id "
+            "LEFT JOIN basic_signup_data b ON u.basic_signup_id = b.id "
+            "WHERE u.id > :last_id ORDER BY u.id LIMIT :chunk"
+        ), {"last_id": last_id, "chunk": BACKFILL_CHUNK}).all()
+        if not rows:
+            break
+        values = [
+            search_row(*row)
+            for row in rows
+            # Users without a detail row have nothing to search
+            if row.first_name is not None
+        ]
+        if values:
+            bind.execute(insert, values)
+        last_id = rows[-1][0]
+
+    if created:
+        create_indexes(bind)
+
+
+def downgrade() -> None:
+    if op.get_bind().dialect.name == "postgresql":
+        op.drop_index("ix_user_search_email_prefix", table_name="user_search")
+        op.drop_index("ix_user_search_hashtag_trgm", table_name="user_search")
+        op.drop_index("ix_user_search_name_trgm", table_name="user_search")
+    op.drop_table("user_search")
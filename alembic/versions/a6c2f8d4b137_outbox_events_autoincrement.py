@@ -0,0 +1,43 @@
+"""outbox_events ids never reused on SQLite
+
+Revision ID: a6c2f8d4b137
+Revises: 9d4b2a7c5e18
+Create Date: 2026-10-19 09:12:05.318274
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a6c2f8d4b137'
+down_revision: Union[str, None] = '9d4b2a7c5e18'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+# Consumers dedupe on the event id, and a SQLite INTEGER PRIMARY KEY without AUTOINCREMENT gives
+# the id of the last deleted (delivered) row to the next insert. Postgres sequences never reuse ids.
+def table_sql(bind):
+    return bind.execute(
+        sa.text("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'outbox_events'")
+    ).scalar()
+
+
+def upgrade() -> None:
+    bind = op.get_bind()
+    if bind.dialect.name != "sqlite" or "AUTOINCREMENT" in table_sql(bind).upper():
+        return
+    # Rebuilt with the rows copied ids and all; sqlite_sequence starts from the highest id left
+    with op.batch_alter_table("outbox_events", recreate="always", table_kwargs={"sqlite_autoincrement": True}):
+        pass
+
+
+def downgrade() -> None:
+    bind = op.get_bind()
+    if bind.dialect.name != "sqlite" or "AUTOINCREMENT" not in table_sql(bind).upper():
+        return
+    with op.batch_alter_table("outbox_events", recreate="always", table_kwargs={"sqlite_autoincrement": False}):
+        pass
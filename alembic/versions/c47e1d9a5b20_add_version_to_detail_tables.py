@@ -0,0 +1,36 @@
+"""add version to detail tables
+
+Revision ID: c47e1d9a5b20
+Revises: 8b2d4e6f1a93
+Create Date: 2026-10-18 17:20:44.310562
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c47e1d9a5b20'
+down_revision: Union[str, None] = '8b2d4e6f1a93'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+DETAIL_TABLES = ("social_media_data", "platform_registration_data", "basic_signup_data")
+
+
+def upgrade() -> None:
+    inspector = sa.inspect(op.get_bind())
+    for table in DETAIL_TABLES:
+        if "version" in {column["name"] for column in inspector.get_columns(table)}:
+            continue
+        # A constant server default: Postgres 11+ adds the column without rewriting the table
+        with op.batch_alter_table(table) as batch_op:
+            batch_op.add_column(sa.Column("version", sa.Integer(), server_default="1", nullable=False))
+
+
+def downgrade() -> None:
+    for table in DETAIL_TABLES:
+        with op.batch_alter_table(table) as batch_op:
+            batch_op.drop_column("version")
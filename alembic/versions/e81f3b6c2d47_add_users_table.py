@@ -0,0 +1,97 @@
+"""add single-table users
+
+Revision ID: e81f3b6c2d47
+Revises: c47e1d9a5b20
+Create Date: 2026-10-18 19:05:12.664210
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e81f3b6c2d47'
+down_revision: Union[str, None] = 'c47e1d9a5b20'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+REGISTRATION_TYPES = ("SOCIAL_MEDIA", "PROJECT_MANAGEMENT", "COMMON_SIGNUP")
+BACKFILL_CHUNK = 10000
+
+# The backfill of app.backfill as of this revision, frozen here so the migration replays the same
+# way whatever the application code becomes. Users in (:low, :high] are copied from the split
+# layout; an existing row is only overwritten when it is behind the detail row.
+BACKFILL_UPSERT = sa.text(
+    "INSERT INTO users (id, type, created_at, detail_id, first_name, last_name, mobile_number, email, password, "
+    "company_name, hashtag, dob, version) "
+    "SELECT u.id, u.type, u.created_at, COALESCE(s.id, p.id, b.id), "
+    "COALESCE(s.first_name, p.first_name, b.first_name), COALESCE(s.last_name, p.last_name, b.last_name), "
+    "COALESCE(s.mobile_number, b.mobile_number), p.email, p.password, p.company_name, s.hashtag, b.dob, "
+    "COALESCE(s.version, p.version, b.version) "
+    "FROM user_table u "
+    "LEFT JOIN social_media_data s ON u.social_media_id = s.id "
+    "LEFT JOIN platform_registration_data p ON u.platform_registration_id = p.id "
+    "LEFT JOIN basic_signup_data b ON u.basic_signup_id = b.id "
+    "WHERE u.id > :low AND u.id <= :high AND COALESCE(s.id, p.id, b.id) IS NOT NULL "
+    "ON CONFLICT (id) DO UPDATE SET type = excluded.type, created_at = excluded.created_at, "
+    "detail_id = excluded.detail_id, first_name = excluded.first_name, last_name = excluded.last_name, "
+    "mobile_number = excluded.mobile_number, email = excluded.email, password = excluded.password, "
+    "company_name = excluded.company_name, hashtag = excluded.hashtag, dob = excluded.dob, version = excluded.version "
+    "WHERE users.version < excluded.version"
+)
+# users rows in (:low, :high] whose user is gone
+BACKFILL_ORPHANS = sa.text(
+    "DELETE FROM users WHERE id > :low AND id <= :high "
+    "AND id NOT IN (SELECT id FROM user_table WHERE id > :low AND id <= :high)"
+)
+
+
+def upgrade() -> None:
+    bind = op.get_bind()
+    if not sa.inspect(bind).has_table("users"):
+        op.create_table(
+            "users",
+            sa.Column("id", sa.Integer(), nullable=False),
+            sa.Column(
+                "type",
+                # Postgres already has the enum type from user_table
+                sa.Enum(*REGISTRATION_TYPES, name="registrationtype").with_variant(
+                    postgresql.ENUM(*REGISTRATION_TYPES, name="registrationtype", create_type=False), "postgresql"
+                ),
+                nullable=False,
+            ),
+            sa.Column("created_at", sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=False),
+            sa.Column("detail_id", sa.Integer(), nullable=False),
+            sa.Column("first_name", sa.String(), nullable=False),
+            sa.Column("last_name", sa.String(), nullable=False),
+            sa.Column("mobile_number", sa.String(), nullable=True),
+            sa.Column("email", sa.String(), nullable=True),
+            sa.Column("password", sa.String(), nullable=True),
+            sa.Column("company_name", sa.String(), nullable=True),
+            sa.Column("hashtag", sa.String(), nullable=True),
+            sa.Column("dob", sa.Date(), nullable=True),
+            sa.Column("version", sa.Integer(), server_default="1", nullable=False),
+            sa.PrimaryKeyConstraint("id"),
+        )
+        op.create_index(op.f("ix_users_mobile_number"), "users", ["mobile_number"], unique=False)
+        op.create_index(op.f("ix_users_email"), "users", ["email"], unique=False)
+
+    # Backfill in primary key ranges, one INSERT ... SELECT per chunk. The app doesn't write the new
+    # table until USER_STORAGE is switched to dual, python -m app.backfill then catches up the gap.
+    top = max(
+        bind.execute(sa.text("SELECT MAX(id) FROM user_table")).scalar() or 0,
+        bind.execute(sa.text("SELECT MAX(id) FROM users")).scalar() or 0,
+    )
+    for low in range(0, top, BACKFILL_CHUNK):
+        params = {"low": low, "high": low + BACKFILL_CHUNK}
+        bind.execute(BACKFILL_UPSERT, params)
+        bind.execute(BACKFILL_ORPHANS, params)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f("ix_users_email"), table_name="users")
+    op.drop_index(op.f("ix_users_mobile_number"), table_name="users")
+    op.drop_table("users")
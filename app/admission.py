@@ -0,0 +1,432 @@
+"""Admission control for POST /add_user: rate limits, Idempotency-Key replay, single-flight.
+
+During campaign bursts clients resubmit the same signup many times in parallel. Every copy used to
+reach the database and fail on the unique constraints after writing a detail row. Three layers
+keep them out:
+
+- Token buckets per client IP and per contact key answer 429 with Retry-After.
+- An Idempotency-Key header stores the outcome of the first request and replays it to retries.
+- Registrations of one contact key run one at a time per worker, and identical submissions that
+  arrive while one is running share its outcome instead of running again.
+"""
+import asyncio
+import hashlib
+import importlib
+import json
+import logging
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+
+from fastapi import HTTPException
+from fastapi.encoders import jsonable_encoder
+
+from .cache import FakeRedis
+from .database import env_bool, env_int
+from .responses import FastJSONResponse
+
+logger = logging.getLogger(__name__)
+
+# RATE_LIMIT_BACKEND: none (default), memory (per worker), redis (shared) or module:factory
+RATE_LIMIT_BACKEND = os.getenv("RATE_LIMIT_BACKEND", "none").lower()
+# Token bucket of each client IP and of each contact key: refill per second, and burst size
+RATE_LIMIT_IP_RATE = float(os.getenv("RATE_LIMIT_IP_RATE", "5"))
+RATE_LIMIT_IP_BURST = float(os.getenv("RATE_LIMIT_IP_BURST", "20"))
+RATE_LIMIT_CONTACT_RATE = float(os.getenv("RATE_LIMIT_CONTACT_RATE", "0.1"))
+RATE_LIMIT_CONTACT_BURST = float(os.getenv("RATE_LIMIT_CONTACT_BURST", "3"))
+# Behind a proxy the client address is the first X-Forwarded-For entry
+RATE_LIMIT_TRUST_FORWARDED = env_bool("RATE_LIMIT_TRUST_FORWARDED", False)
+
+# IDEMPOTENCY_BACKEND: memory (default, per worker), redis or fakeredis, none disables the header
+IDEMPOTENCY_BACKEND = os.getenv("IDEMPOTENCY_BACKEND", "memory").lower()
+IDEMPOTENCY_TTL = env_int("IDEMPOTENCY_TTL", 24 * 3600)
+# A reservation left by a request that died is released after this many seconds
+IDEMPOTENCY_PENDING_TTL = env_int("IDEMPOTENCY_PENDING_TTL", 60)
+IDEMPOTENCY_MAX_KEYS = env_int("IDEMPOTENCY_MAX_KEYS", 100000)
+
+SINGLE_FLIGHT_ENABLED = env_bool("SINGLE_FLIGHT_ENABLED", True)
+# How long a duplicate waits for the running registration before going ahead on its own
+SINGLE_FLIGHT_TIMEOUT = float(os.getenv("SINGLE_FLIGHT_TIMEOUT", "30"))
+
+# Outcomes worth replaying: a 429 or 409 depends on timing, a 5xx should be retried for real
+REPLAYABLE_STATUS = {200, 400, 422}
+
+
+def fingerprint(data):
+    # Same body, same fingerprint, whatever the key order
+    return hashlib.sha256(json.dumps(data, sort_keys=True, separators=(",", ":"), default=str).encode()).hexdigest()
+
+
+# Rate limiting
+
+class NullRateLimiter:
+    def acquire(self, key, rate, burst):
+        return 0.0
+
+
+class MemoryRateLimiter:
+    # Token buckets in this process, least recently used ones dropped past maxsize (a dropped
+    # bucket comes back full, which only ever errs on the side of admitting)
+    def __init__(self, maxsize=100000):
+        self.maxsize = maxsize
+        self._lock = threading.Lock()
+        self._buckets = OrderedDict()  # key -> (tokens, updated_at)
+
+    def acquire(self, key, rate, burst):
+        # Take one token, returns 0.0 when allowed or the seconds until a token is available
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated_at = self._buckets.pop(key, (burst, now))
+            tokens = min(burst, tokens + (now - updated_at) * rate)
+            retry_after = 0.0 if tokens >= 1 else (1 - tokens) / rate
+            self._buckets[key] = (tokens - 1 if tokens >= 1 else tokens, now)
+            while len(self._buckets) > self.maxsize:
+                self._buckets.popitem(last=False)
+        return retry_after
+
+
+# Refill and take a token in one atomic step on the Redis server, using its clock
+TOKEN_BUCKET_SCRIPT = """
+local rate, burst = tonumber(ARGV[1]), tonumber(ARGV[2])
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'updated_at')
+local tokens = tonumber(state[1]) or burst
+local updated_at = tonumber(state[2]) or now
+tokens = math.min(burst, tokens + math.max(0, now - updated_at) * rate)
+local retry_after = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+else
+    retry_after = (1 - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'updated_at', now)
+redis.call('EXPIRE', KEYS[1], math.ceil(burst / rate) + 1)
+return tostring(retry_after)
+"""
+
+
+class RedisRateLimiter:
+    # Buckets shared by every worker. Redis errors admit the request: the limiter is a safety
+    # valve, the unique constraints still guard the data.
+    def __init__(self, client, prefix="ratelimit:"):
+        self.prefix = prefix
+        self._script = client.register_script(TOKEN_BUCKET_SCRIPT)
+
+    def acquire(self, key, rate, burst):
+        try:
+            return float(self._script(keys=[f"{self.prefix}{key}"], args=[rate, burst]))
+        except Exception:
+            logger.exception("Rate limiter unavailable, admitting request")
+            return 0.0
+
+
+def build_rate_limiter(backend=RATE_LIMIT_BACKEND):
+    if backend == "memory":
+        return MemoryRateLimiter()
+    if backend == "redis":
+        import redis
+
+        return RedisRateLimiter(redis.Redis.from_url(os.getenv("REDIS_URL", "redis://localhost:6379/0")))
+    if ":" in backend:
+        # Custom backend: "package.module:factory" returning an object with acquire(key, rate, burst)
+        module, _, factory = backend.partition(":")
+        return getattr(importlib.import_module(module), factory)()
+    return NullRateLimiter()
+
+
+# Idempotency keys
+
+class NullIdempotencyStore:
+    def reserve(self, key, fingerprint):
+        return None
+
+    def complete(self, key, record):
+        pass
+
+    def release(self, key):
+        pass
+
+
+class MemoryIdempotencyStore:
+    # Records of this worker only: a retry that lands on another worker runs again (and meets the
+    # unique constraints). Use the redis backend with more than one worker.
+    def __init__(self, ttl=IDEMPOTENCY_TTL, maxsize=IDEMPOTENCY_MAX_KEYS):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._lock = threading.Lock()
+        self._records = OrderedDict()  # key -> (expires_at, record)
+
+    def reserve(self, key, fingerprint):
+        # Claim the key for a new request (returns None), or return the record already there
+        now = time.monotonic()
+        with self._lock:
+            entry = self._records.get(key)
+            if entry is not None and entry[0] > now:
+                return entry[1]
+            self._records[key] = (now + IDEMPOTENCY_PENDING_TTL, {"fingerprint": fingerprint, "status": None})
+            self._records.move_to_end(key)
+            while len(self._records) > self.maxsize:
+                self._records.popitem(last=False)
+        return None
+
+    def complete(self, key, record):
+        with self._lock:
+            self._records[key] = (time.monotonic() + self.ttl, record)
+            self._records.move_to_end(key)
+
+    def release(self, key):
+        with self._lock:
+            self._records.pop(key, None)
+
+
+class RedisIdempotencyStore:
+    # Shared records on any client with get/set(ex=, nx=)/delete (redis-py, FakeRedis). Errors are
+    # logged and the request runs as if it had no key.
+    def __init__(self, client, ttl=IDEMPOTENCY_TTL, prefix="idempotency:"):
+        self.client = client
+        self.ttl = ttl
+        self.prefix = prefix
+
+    def reserve(self, key, fingerprint):
+        pending = json.dumps({"fingerprint": fingerprint, "status": None})
+        try:
+            if self.client.set(f"{self.prefix}{key}", pending, ex=IDEMPOTENCY_PENDING_TTL, nx=True):
+                return None
+            raw = self.client.get(f"{self.prefix}{key}")
+        except Exception:
+            logger.exception("Idempotency store unavailable")
+            return None
+        return json.loads(raw) if raw else None
+
+    def complete(self, key, record):
+        try:
+            self.client.set(f"{self.prefix}{key}", json.dumps(record), ex=self.ttl)
+        except Exception:
+            logger.exception("Idempotency store unavailable")
+
+    def release(self, key):
+        try:
+            self.client.delete(f"{self.prefix}{key}")
+        except Exception:
+            logger.exception("Idempotency store unavailable")
+
+
+def build_idempotency_store(backend=IDEMPOTENCY_BACKEND):
+    if backend == "redis":
+        import redis
+
+        return RedisIdempotencyStore(redis.Redis.from_url(os.getenv("REDIS_URL", "redis://localhost:6379/0")))
+    if backend == "fakeredis":
+        return RedisIdempotencyStore(FakeRedis())
+    if backend == "none":
+        return NullIdempotencyStore()
+    return MemoryIdempotencyStore()
+
+
+# Single-flight
+
+# Result handed to waiting duplicates when the running registration failed unexpectedly: they retry
+FLIGHT_FAILED = object()
+
+
+class SingleFlight:
+    # Registrations of one contact key run one at a time in this process. A duplicate (same body)
+    # that arrives meanwhile gets the running one's outcome; a different body for the same contact
+    # runs after it.
+    def __init__(self, timeout=SINGLE_FLIGHT_TIMEOUT):
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._flights = {}  # key -> (fingerprint, Future)
+
+    def _join(self, key, fingerprint):
+        with self._lock:
+            flight = self._flights.get(key)
+            if flight is not None:
+                return flight, False
+            flight = self._flights[key] = (fingerprint, Future())
+            return flight, True
+
+    def _land(self, key, future, result=FLIGHT_FAILED, error=None):
+        with self._lock:
+            del self._flights[key]
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
+
+    def _shared(self, leader_fingerprint, fingerprint, future):
+        # Outcome a waiting request can reuse: only for the same body, and only a definite answer
+        if leader_fingerprint != fingerprint or (future.exception() is None and future.result() is FLIGHT_FAILED):
+            return None
+        count("coalesced")
+        return future
+
+    def run(self, key, fingerprint, call):
+        while True:
+            (leader_fingerprint, future), leading = self._join(key, fingerprint)
+            if leading:
+                try:
+                    result = call()
+                except HTTPException as e:
+                    self._land(key, future, error=e)
+                    raise
+                except BaseException:
+                    self._land(key, future)
+                    raise
+                self._land(key, future, result)
+                return result
+            try:
+                future.exception(self.timeout)
+            except FutureTimeoutError:
+                return call()
+            shared = self._shared(leader_fingerprint, fingerprint, future)
+            if shared is not None:
+                return shared.result()
+
+    async def run_async(self, key, fingerprint, call):
+        while True:
+            (leader_fingerprint, future), leading = self._join(key, fingerprint)
+            if leading:
+                try:
+                    result = await call()
+                except HTTPException as e:
+                    self._land(key, future, error=e)
+                    raise
+                except BaseException:
+                    self._land(key, future)
+                    raise
+                self._land(key, future, result)
+                return result
+            try:
+                # shield: giving up on the wait must not cancel the shared future
+                await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(future)), self.timeout)
+            except HTTPException:
+                pass
+            except asyncio.TimeoutError:
+                return await call()
+            shared = self._shared(leader_fingerprint, fingerprint, future)
+            if shared is not None:
+                return shared.result()
+
+
+rate_limiter = build_rate_limiter()
+idempotency_store = build_idempotency_store()
+single_flight = SingleFlight()
+stats = {"rate_limited_ip": 0, "rate_limited_contact": 0, "replayed": 0, "coalesced": 0}
+_stats_lock = threading.Lock()
+
+
+def count(counter):
+    with _stats_lock:
+        stats[counter] += 1
+
+
+def client_address(request):
+    if RATE_LIMIT_TRUST_FORWARDED:
+        forwarded = request.headers.get("x-forwarded-for")
+        if forwarded:
+            return forwarded.split(",")[0].strip()
+    return request.client.host if request.client else "unknown"
+
+
+def enforce_rate_limit(kind, key, rate, burst):
+    retry_after = rate_limiter.acquire(f"{kind}:{key}", rate, burst)
+    if retry_after > 0:
+        count(f"rate_limited_{kind}")
+        raise HTTPException(
+            status_code=429,
+            detail="Too many registration attempts, retry later",
+            headers={"Retry-After": str(math.ceil(retry_after))},
+        )
+
+
+def limit_client(request):
+    enforce_rate_limit("ip", client_address(request), RATE_LIMIT_IP_RATE, RATE_LIMIT_IP_BURST)
+
+
+def limit_contact(contact):
+    enforce_rate_limit("contact", contact, RATE_LIMIT_CONTACT_RATE, RATE_LIMIT_CONTACT_BURST)
+
+
+def reserve_idempotency_key(idempotency_key, body_fingerprint):
+    # None when this request owns the key, otherwise the response for it (replay or error)
+    record = idempotency_store.reserve(idempotency_key, body_fingerprint)
+    if record is None:
+        return None
+    if record["fingerprint"] != body_fingerprint:
+        raise HTTPException(status_code=422, detail="Idempotency-Key was already used with a different request body")
+    if record["status"] is None:
+        raise HTTPException(status_code=409, detail="A request with this Idempotency-Key is still in progress")
+    count("replayed")
+    return FastJSONResponse(record["body"], status_code=record["status"], headers={"Idempotent-Replayed": "true"})
+
+
+def record_outcome(idempotency_key, body_fingerprint, status, body):
+    if status in REPLAYABLE_STATUS:
+        idempotency_store.complete(
+            idempotency_key, {"fingerprint": body_fingerprint, "status": status, "body": jsonable_encoder(body)}
+        )
+    else:
+        idempotency_store.release(idempotency_key)
+
+
+def admit_registration(idempotency_key, data, contact, create):
+    # Run create() (which returns the response or raises HTTPException) at most once per
+    # idempotency key, coalesced with identical registrations of the same contact in flight.
+    # Replays don't spend the contact's tokens, a 429 releases the key for the retry.
+    body_fingerprint = fingerprint(data)
+    if idempotency_key:
+        replay = reserve_idempotency_key(idempotency_key, body_fingerprint)
+        if replay is not None:
+            return replay
+    try:
+        limit_contact(contact)
+        if SINGLE_FLIGHT_ENABLED:
+            result = single_flight.run(contact, body_fingerprint, create)
+        else:
+            result = create()
+    except HTTPException as e:
+        if idempotency_key:
+            record_outcome(idempotency_key, body_fingerprint, e.status_code, {"detail": e.detail})
+        raise
+    except BaseException:
+        if idempotency_key:
+            idempotency_store.release(idempotency_key)
+        raise
+    if idempotency_key:
+        record_outcome(idempotency_key, body_fingerprint, 200, result)
+    return result
+
+
+async def admit_registration_async(idempotency_key, data, contact, create):
+    body_fingerprint = fingerprint(data)
+    if idempotency_key:
+        replay = reserve_idempotency_key(idempotency_key, body_fingerprint)
+        if replay is not None:
+            return replay
+    try:
+        limit_contact(contact)
+        if SINGLE_FLIGHT_ENABLED:
+            result = await single_flight.run_async(contact, body_fingerprint, create)
+        else:
+            result = await create()
+    except HTTPException as e:
+        if idempotency_key:
+            record_outcome(idempotency_key, body_fingerprint, e.status_code, {"detail": e.detail})
+        raise
+    except BaseException:
+        if idempotency_key:
+            idempotency_store.release(idempotency_key)
+        raise
+    if idempotency_key:
+        record_outcome(idempotency_key, body_fingerprint, 200, result)
+    return result
+
+
+def admission_stats():
+    with _stats_lock:
+        return dict(stats)
@@ -0,0 +1,203 @@
+from typing import Optional
+
+from fastapi import APIRouter, HTTPException, Depends, Header, Request, Response
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.exc import IntegrityError, SQLAlchemyError
+
+from .admission import admit_registration_async, limit_client
+from .cache import cache_call, user_cache
+from .database import get_async_db, get_async_read_db
+from .models import UserTable, RegistrationType, OutboxEvent
+from .outbox import OUTBOX_ENABLED, notify_dispatcher, user_registered
+from .passwords import hash_password_async, verify_password_async
+from .replicas import reads_from_primary
+from .search import search_entry, search_update
+from .repository import (
+    DUAL_WRITE, UNIFIED_INSERT, USER_REF_QUERY, delete_users_async, get_user_with_data_async, login_query, unified_row,
+    unified_update,
+)
+from .routes import (
+    DETAIL_MODELS, build_user_data, cached_user_response, contact_key_update, detail_update, new_contact_key, parse_if_match,
+    registration_contact, resolve_registration, unique_violation_detail, update_not_applied, user_data_response,
+    user_etag, user_response, validate_update
+)
+from .schema import LoginRequest, RegistrationDispatchError, RegistrationResponse, UserResponse
+
+# async def versions of the add/get/update/delete and login routes, mounted instead of the sync ones when DB_MODE=async
+router = APIRouter()
+
+
+@router.post("/add_user/", response_model=RegistrationResponse)
+async def register_user(
+    data: dict,
+    request: Request,
+    idempotency_key: Optional[str] = Header(None),
+    db: AsyncSession = Depends(get_async_db),
+):
+    limit_client(request)
+
+    # Determine the registration type and data schema
+    try:
+        reg_type, valid_data = resolve_registration(data)
+    except RegistrationDispatchError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    contact = registration_contact(valid_data, reg_type)
+    return await admit_registration_async(
+        idempotency_key, data, contact, lambda: create_registration(reg_type, valid_data, db)
+    )
+
+
+async def create_registration(reg_type: RegistrationType, valid_data, db: AsyncSession):
+    if reg_type == RegistrationType.PROJECT_MANAGEMENT:
+        valid_data = valid_data.model_copy(update={"password": await hash_password_async(valid_data.password)})
+
+    _, _, foreign_key = DETAIL_MODELS[reg_type]
+    try:
+        user_specific_data = build_user_data(valid_data, reg_type)
+        db.add(user_specific_data)
+        await db.flush()
+        user_entry = UserTable(
+            type=reg_type,
+            contact_key=new_contact_key(valid_data, reg_type),
+            search_entry=search_entry(reg_type, valid_data.model_dump()),
+            **{foreign_key: user_specific_data.id},
+        )
+        db.add(user_entry)
+        await db.flush()
+        if DUAL_WRITE:
+            await db.execute(
+                UNIFIED_INSERT, unified_row(user_entry.id, reg_type, user_specific_data.id, valid_data.model_dump())
+            )
+        if OUTBOX_ENABLED:
+            db.add(OutboxEvent(**user_registered(user_entry.id, reg_type, user_data_response(reg_type, user_specific_data))))
+        await db.commit()
+    except IntegrityError as e:
+        await db.rollback()
+        detail = unique_violation_detail(e, reg_type)
+        if detail:
+            raise HTTPException(status_code=400, detail=detail)
+        raise HTTPException(status_code=400, detail=f"Error creating user entry: {e}")
+    except SQLAlchemyError as e:
+        await db.rollback()
+        raise HTTPException(status_code=400, detail=f"Error creating user entry: {e}")
+
+    if OUTBOX_ENABLED:
+        notify_dispatcher()
+
+    return RegistrationResponse(
+        id=user_entry.id, type=reg_type.value, user_data=user_data_response(reg_type, user_specific_data)
+    )
+
+
+@router.post("/login/")
+async def login(data: LoginRequest, db: AsyncSession = Depends(get_async_db)):
+    user = (await db.execute(login_query(data.email))).scalars().first()
+    if not user:
+        raise HTTPException(status_code=401, detail="Invalid email or password")
+
+    user_data = user.platform_registration_data
+    matches, needs_rehash = await verify_password_async(data.password, user_data.password)
+    if not matches:
+        raise HTTPException(status_code=401, detail="Invalid email or password")
+
+    if needs_rehash:
+        user_data.password = await hash_password_async(data.password)
+        if DUAL_WRITE:
+            await db.execute(*unified_update(user.id, {"password": user_data.password}, user_data.version))
+        await db.commit()
+
+    return {"id": user.id, "type": user.type}
+
+
+@router.put("/update_user/{user_id}/")
+async def update_user(
+    user_id: int,
+    data: dict,
+    response: Response,
+    if_match: Optional[str] = Header(None),
+    db: AsyncSession = Depends(get_async_db),
+):
+    expected_version = parse_if_match(if_match)
+
+    user = (await db.execute(USER_REF_QUERY, {"user_id": user_id})).first()
+    if not user:
+        raise HTTPException(status_code=404, detail="User not found")
+
+    values = validate_update(user, data)
+    if "password" in values:
+        values["password"] = await hash_password_async(values["password"])
+
+    try:
+        version = (await db.execute(*detail_update(user, values, expected_version))).scalar()
+        if version is None:
+            await db.rollback()
+            raise update_not_applied(user, expected_version)
+
+        contact_update = contact_key_update(user, values)
+        if contact_update is not None:
+            await db.execute(contact_update)
+        search_entry_update = search_update(user.id, values)
+        if search_entry_update is not None:
+            await db.execute(search_entry_update)
+        if DUAL_WRITE:
+            await db.execute(*unified_update(user.id, values, version))
+        await db.commit()
+    except IntegrityError as e:
+        await db.rollback()
+        detail = unique_violation_detail(e, user.type)
+        raise HTTPException(status_code=400, detail=detail or f"Error updating user: {e}")
+    except SQLAlchemyError as e:
+        await db.rollback()
+        raise HTTPException(status_code=400, detail=f"Error updating user: {e}")
+
+    await cache_call(user_cache.invalidate, user_id)
+
+    response.headers["ETag"] = user_etag(version)
+    return {"message": "User updated successfully", "version": version}
+
+
+@router.delete("/delete_user/{user_id}/")
+async def delete_user(user_id: int, db: AsyncSession = Depends(get_async_db)):
+    try:
+        deleted = await delete_users_async(db, UserTable.id == user_id)
+        if not deleted:
+            await db.rollback()
+            raise HTTPException(status_code=404, detail="User not found")
+        await db.commit()
+    except SQLAlchemyError as e:
+        await db.rollback()
+        raise HTTPException(status_code=400, detail=f"Error deleting user: {e}")
+
+    await cache_call(user_cache.invalidate, user_id)
+
+    return {"message": f"User with ID {user_id} has been deleted successfully"}
+
+
+@router.get("/get_user/{user_id}/", response_model=UserResponse)
+async def get_user(user_id: int, response: Response, db: AsyncSession = Depends(get_async_read_db)):
+    if not reads_from_primary():
+        cached = await cache_call(user_cache.get, user_id)
+        if cached is not None:
+            return cached_user_response(cached)
+    cache_token = await cache_call(user_cache.read_token, user_id)
+
+    try:
+        user = await get_user_with_data_async(user_id, db)
+        if not user:
+            raise HTTPException(status_code=404, detail="User not found")
+
+        user_data = user.user_specific_data
+        if not user_data:
+            raise HTTPException(status_code=404, detail=f"No data found for user type {user.type}")
+
+        result = user_response(user, user_data)
+        if db.info.get("replica") is None:
+            await cache_call(user_cache.set, user_id, result.model_dump(mode="json"), cache_token)
+
+        response.headers["ETag"] = user_etag(user_data.version)
+        return result
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Error fetching user data: {e}")
@@ -0,0 +1,124 @@
+"""Copy users from the split layout (user_table + detail tables) into the single users table.
+
+Works through id ranges of --chunk users, each range in its own short transaction. Safe to re-run at
+any time: rows are only overwritten when the split layout holds a newer version, and users rows whose
+user is gone are removed. The alembic revision that creates the users table runs the same backfill
+once; run this after switching the app to USER_STORAGE=dual to pick up writes made in between.
+
+Usage:
+    python -m app.backfill --chunk 10000 --pause 0.05
+"""
+import argparse
+import logging
+import time
+
+from sqlalchemy import bindparam, delete, func, select
+from sqlalchemy.dialects import postgresql, sqlite
+
+from .database import SessionLocal, init_engines
+from .instrumentation import configure_logging
+from .models import UserTable, SocialMediaData, PlatformRegistrationData, BasicSignupData, User
+
+logger = logging.getLogger(__name__)
+
+BACKFILL_CHUNK = 10000
+
+# users columns filled from the split layout, in INSERT ... SELECT order
+BACKFILL_COLUMNS = (
+    "id", "type", "created_at", "detail_id", "first_name", "last_name", "mobile_number", "email", "password",
+    "company_name", "hashtag", "dob", "version",
+)
+
+
+def upsert_statement(dialect_name: str):
+    # INSERT ... SELECT of the users with ids in (:low, :high]. An existing row is only overwritten
+    # when it is behind the detail row: dual writes always carry the newest version, so they win.
+    s, p, b = SocialMediaData, PlatformRegistrationData, BasicSignupData
+    detail_id = func.coalesce(s.id, p.id, b.id)
+    source = (
+        select(
+            UserTable.id,
+            UserTable.type,
+            UserTable.created_at,
+            detail_id,
+            func.coalesce(s.first_name, p.first_name, b.first_name),
+            func.coalesce(s.last_name, p.last_name, b.last_name),
+            func.coalesce(s.mobile_number, b.mobile_number),
+            p.email,
+            p.password,
+            p.company_name,
+            s.hashtag,
+            b.dob,
+            func.coalesce(s.version, p.version, b.version),
+        )
+        .outerjoin(s, UserTable.social_media_id == s.id)
+        .outerjoin(p, UserTable.platform_registration_id == p.id)
+        .outerjoin(b, UserTable.basic_signup_id == b.id)
+        # Users without a detail row have nothing to copy
+        .where(UserTable.id > bindparam("low"), UserTable.id <= bindparam("high"), detail_id.isnot(None))
+    )
+    users = User.__table__
+    insert = (postgresql.insert if dialect_name == "postgresql" else sqlite.insert)(users)
+    insert = insert.from_select(BACKFILL_COLUMNS, source)
+    return insert.on_conflict_do_update(
+        index_elements=[users.c.id],
+        set_={column: insert.excluded[column] for column in BACKFILL_COLUMNS if column != "id"},
+        where=users.c.version < insert.excluded.version,
+    )
+
+
+def orphans_statement():
+    # users rows in (:low, :high] whose user was deleted while nothing was writing the users table
+    users = User.__table__
+    existing = select(UserTable.id).where(UserTable.id > bindparam("low"), UserTable.id <= bindparam("high"))
+    return delete(users).where(users.c.id > bindparam("low"), users.c.id <= bindparam("high"), users.c.id.not_in(existing))
+
+
+def backfill_chunk(connection, low: int, high: int):
+    # Bring users in (low, high] in line with the split layout, returns the rows inserted or updated
+    params = {"low": low, "high": high}
+    written = connection.execute(upsert_statement(connection.dialect.name), params).rowcount
+    connection.execute(orphans_statement(), params)
+    return written
+
+
+def backfill_ranges(connection, chunk: int = BACKFILL_CHUNK):
+    # (low, high] id ranges covering user_table and users as they are now
+    top = max(
+        connection.execute(select(func.max(UserTable.id))).scalar() or 0,
+        connection.execute(select(func.max(User.__table__.c.id))).scalar() or 0,
+    )
+    return [(low, low + chunk) for low in range(0, top, chunk)]
+
+
+def backfill_users(chunk: int = BACKFILL_CHUNK, pause: float = 0.0):
+    # Yields (high id, rows written) after each range commits
+    with SessionLocal() as db:
+        ranges = backfill_ranges(db.connection(), chunk)
+    for low, high in ranges:
+        with SessionLocal() as db:
+            written = backfill_chunk(db.connection(), low, high)
+            db.commit()
+        yield high, written
+        if pause:
+            time.sleep(pause)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chunk", type=int, default=BACKFILL_CHUNK, help="Users per transaction")
+    parser.add_argument("--pause", type=float, default=0.0, help="Seconds to sleep between chunks")
+    args = parser.parse_args()
+
+    configure_logging()
+    init_engines()
+    total = 0
+    started = time.perf_counter()
+    for high, written in backfill_users(args.chunk, args.pause):
+        total += written
+        logger.info("backfill_chunk", extra={"up_to_id": high, "written": written, "total": total})
+    logger.info("backfill_done", extra={"written": total, "seconds": round(time.perf_counter() - started, 1)})
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""Create the database and bring its schema to the latest alembic revision.
+
+Run once per deploy, before starting the API workers:
+
+    python -m app.bootstrap             # create-db, then migrate
+    python -m app.bootstrap create-db   # CREATE DATABASE on ADMIN_URL if it is missing (Postgres)
+    python -m app.bootstrap migrate     # create_all + stamp on an empty database, upgrade head otherwise
+"""
+import argparse
+import logging
+from pathlib import Path
+
+from alembic import command
+from alembic.config import Config
+from sqlalchemy import inspect, text
+from sqlalchemy.engine import make_url
+
+from . import models  # noqa: F401  (registers the tables on Base.metadata)
+from .database import ADMIN_URL, DATABASE_NAME, DATABASE_URL, Base, init_engines
+from .instrumentation import configure_logging
+
+logger = logging.getLogger(__name__)
+
+ALEMBIC_INI = Path(__file__).resolve().parent.parent / "alembic.ini"
+# pg_advisory_xact_lock key, serializes bootstraps started at the same time
+BOOTSTRAP_LOCK_ID = 0x756E697369676E
+
+
+def alembic_config():
+    config = Config(str(ALEMBIC_INI))
+    config.set_main_option("script_location", str(ALEMBIC_INI.parent / "alembic"))
+    # ConfigParser interpolation: a literal % in a password must be doubled
+    config.set_main_option("sqlalchemy.url", DATABASE_URL.replace("%", "%%"))
+    return config
+
+
+def create_db():
+    if make_url(DATABASE_URL).get_backend_name() != "postgresql" or not ADMIN_URL:
+        return
+    from utils.database_operation import create_database
+
+    create_database(ADMIN_URL, DATABASE_NAME)
+
+
+def migrate():
+    config = alembic_config()
+    with init_engines().begin() as connection:
+        if connection.dialect.name == "postgresql":
+            connection.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": BOOTSTRAP_LOCK_ID})
+
+        # alembic/env.py runs the migrations on this connection, inside this transaction
+        config.attributes["connection"] = connection
+        tables = set(inspect(connection).get_table_names())
+        if not tables & {"alembic_version", "user_table"}:
+            # Empty database: build the current schema directly and record it as up to date
+            Base.metadata.create_all(connection)
+            command.stamp(config, "head")
+            logger.info("Created schema and stamped alembic head")
+        else:
+            command.upgrade(config, "head")
+            logger.info("Upgraded schema to alembic head")
+
+
+def bootstrap():
+    create_db()
+    migrate()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("step", nargs="?", choices=["all", "create-db", "migrate"], default="all")
+    args = parser.parse_args()
+
+    configure_logging()
+    {"all": bootstrap, "create-db": create_db, "migrate": migrate}[args.step]()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,298 @@
+import asyncio
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+# Read-through cache of serialized GET /get_user responses, keyed by user id.
+#
+# Every fill carries the token returned by read_token() before the database read. invalidate()
+# moves the key's generation forward, so a slow read that started before an update can never
+# store (or serve) the pre-update response afterwards.
+
+
+class NullCache:
+    # In-process caches answer without I/O, RedisCache blocks on a network round trip
+    blocking = False
+
+    def get(self, key):
+        return None
+
+    def read_token(self, key):
+        return None
+
+    def set(self, key, value, token):
+        pass
+
+    def invalidate(self, key):
+        pass
+
+    def stats(self):
+        return {"backend": "none"}
+
+
+class LRUCache:
+    # In-process LRU with TTL. Only safe with a single worker: other processes never see invalidations.
+    blocking = False
+
+    def __init__(self, maxsize: int = 10000, ttl: float = 60):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> (token, expires_at, value)
+        self._invalidated = OrderedDict()  # key -> clock value of its last invalidation
+        self._clock = 0
+        self._floor = 0  # highest invalidation clock forgotten when _invalidated was pruned
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    def _is_current(self, key, token):
+        return token >= self._invalidated.get(key, self._floor)
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            token, expires_at, value = entry
+            if expires_at < time.monotonic() or not self._is_current(key, token):
+                del self._entries[key]
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def read_token(self, key):
+        with self._lock:
+            return self._clock
+
+    def set(self, key, value, token):
+        with self._lock:
+            if not self._is_current(key, token):
+                return
+            self._entries[key] = (token, time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, key):
+        with self._lock:
+            self._clock += 1
+            self._invalidated[key] = self._clock
+            self._invalidated.move_to_end(key)
+            self._entries.pop(key, None)
+            self.invalidations += 1
+            while len(self._invalidated) > self.maxsize:
+                _, clock = self._invalidated.popitem(last=False)
+                self._floor = max(self._floor, clock)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "backend": "memory",
+                "size": len(self._entries),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "invalidations": self.invalidations,
+            }
+
+
+class RedisCache:
+    # Shared cache on any client with get/set(ex=)/delete/mget/incr/expire (redis-py, FakeRedis).
+    # Errors are logged and treated as misses so Redis being down never fails a request.
+    blocking = True
+
+    def __init__(self, client, ttl: float = 60, prefix: str = "user:"):
+        self.client = client
+        self.ttl = int(ttl)
+        self.prefix = prefix
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.stale = 0
+        self.invalidations = 0
+        self.errors = 0
+        # key -> monotonic time after which its failed invalidation no longer matters
+        self._pending = {}
+
+    def _count(self, counter):
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def _keys(self, key):
+        return f"{self.prefix}{key}", f"{self.prefix}gen:{key}"
+
+    def _unsettled(self, key):
+        # Invalidations that failed are retried before the cache is used again. Until one goes through,
+        # its key is neither read nor filled here: the entry it was meant to drop may still be in Redis.
+        # After a TTL that entry has expired on its own.
+        if not self._pending:
+            return False
+        now = time.monotonic()
+        with self._lock:
+            pending = list(self._pending.items())
+        for pending_key, expires_at in pending:
+            if expires_at < now or self._invalidate(pending_key):
+                with self._lock:
+                    if self._pending.get(pending_key) == expires_at:
+                        del self._pending[pending_key]
+        return key in self._pending
+
+    def get(self, key):
+        if self._unsettled(key):
+            self._count("misses")
+            return None
+        try:
+            raw, generation = self.client.mget(self._keys(key))
+        except Exception:
+            logger.exception("User cache read failed")
+            self._count("errors")
+            return None
+        if raw is None:
+            self._count("misses")
+            return None
+        entry = json.loads(raw)
+        if entry["gen"] != int(generation or 0):
+            self._count("stale")
+            self._count("misses")
+            return None
+        self._count("hits")
+        return entry["value"]
+
+    def read_token(self, key):
+        try:
+            return int(self.client.get(self._keys(key)[1]) or 0)
+        except Exception:
+            logger.exception("User cache read failed")
+            self._count("errors")
+            return None
+
+    def set(self, key, value, token):
+        if token is None or self._unsettled(key):
+            return
+        try:
+            self.client.set(self._keys(key)[0], json.dumps({"gen": token, "value": value}), ex=self.ttl)
+        except Exception:
+            logger.exception("User cache write failed")
+            self._count("errors")
+
+    def _invalidate(self, key):
+        value_key, generation_key = self._keys(key)
+        # Bumping the generation is what makes older entries unusable, the delete only frees memory.
+        # The generation outlives any entry written with the previous one.
+        try:
+            self.client.incr(generation_key)
+            self.client.expire(generation_key, self.ttl * 2)
+            self.client.delete(value_key)
+        except Exception:
+            logger.exception("User cache invalidation failed", extra={"key": key})
+            self._count("errors")
+            return False
+        self._count("invalidations")
+        return True
+
+    def invalidate(self, key):
+        # Runs after the write has committed, so a failure doesn't fail the request. The key is
+        # bypassed and the invalidation retried instead (see _unsettled)
+        if not self._invalidate(key):
+            with self._lock:
+                self._pending[key] = time.monotonic() + self.ttl
+
+    def stats(self):
+        with self._lock:
+            return {
+                "backend": "redis",
+                "hits": self.hits,
+                "misses": self.misses,
+                "stale": self.stale,
+                "invalidations": self.invalidations,
+                "errors": self.errors,
+                "pending_invalidations": len(self._pending),
+            }
+
+
+class FakeRedis:
+    # Minimal in-memory stand-in for the redis-py client, for local runs and tests
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._data = {}  # key -> (value, expires_at or None)
+
+    def _live(self, key):
+        entry = self._data.get(key)
+        if entry and entry[1] is not None and entry[1] < time.monotonic():
+            del self._data[key]
+            return None
+        return entry
+
+    def get(self, key):
+        with self._lock:
+            entry = self._live(key)
+            return entry[0] if entry else None
+
+    def mget(self, keys):
+        with self._lock:
+            return [entry[0] if entry else None for entry in map(self._live, keys)]
+
+    def set(self, key, value, ex=None, nx=False):
+        with self._lock:
+            if nx and self._live(key):
+                return None
+            self._data[key] = (value, time.monotonic() + ex if ex else None)
+            return True
+
+    def delete(self, *keys):
+        with self._lock:
+            return sum(self._data.pop(key, None) is not None for key in keys)
+
+    def incr(self, key):
+        with self._lock:
+            entry = self._live(key)
+            value = int(entry[0]) + 1 if entry else 1
+            self._data[key] = (str(value).encode(), entry[1] if entry else None)
+            return value
+
+    def expire(self, key, seconds):
+        with self._lock:
+            entry = self._live(key)
+            if entry:
+                self._data[key] = (entry[0], time.monotonic() + seconds)
+            return entry is not None
+
+
+def build_user_cache():
+    # USER_CACHE_BACKEND: none (default), memory (single worker only), redis or fakeredis
+    backend = os.getenv("USER_CACHE_BACKEND", "none").lower()
+    ttl = float(os.getenv("USER_CACHE_TTL", "60"))
+    if backend == "memory":
+        return LRUCache(maxsize=int(os.getenv("USER_CACHE_SIZE", "10000")), ttl=ttl)
+    if backend == "redis":
+        import redis
+
+        return RedisCache(redis.Redis.from_url(os.getenv("REDIS_URL", "redis://localhost:6379/0")), ttl=ttl)
+    if backend == "fakeredis":
+        return RedisCache(FakeRedis(), ttl=ttl)
+    return NullCache()
+
+
+user_cache = build_user_cache()
+
+
+async def cache_call(method, *args):
+    # For the async routes: a blocking cache (Redis) runs on a worker thread, not on the event loop
+    if user_cache.blocking:
+        return await asyncio.to_thread(method, *args)
+    return method(*args)
@@ -0,0 +1,36 @@
+import os
+import re
+
+# Country code assumed for national numbers without one
+DEFAULT_COUNTRY_CODE = os.getenv("DEFAULT_COUNTRY_CODE", "91")
+
+NON_DIGITS = re.compile(r"\D")
+
+
+def normalize_mobile_number(value: str):
+    # Canonical E.164: "+91 98765-43210", "0091 9876543210" and "9876543210" all become "+919876543210"
+    value = value.strip()
+    digits = NON_DIGITS.sub("", value)
+    if value.startswith("+"):
+        return f"+{digits}"
+    if digits.startswith("00"):
+        return f"+{digits[2:]}"
+    if len(digits) == 11 and digits.startswith("0"):
+        digits = digits[1:]
+    if len(digits) == 10:
+        return f"+{DEFAULT_COUNTRY_CODE}{digits}"
+    return f"+{digits}"
+
+
+def normalize_email(value: str):
+    return value.strip().lower()
+
+
+NORMALIZERS = {
+    "mobile_number": normalize_mobile_number,
+    "email": normalize_email,
+}
+
+
+def contact_key(kind: str, value: str):
+    return NORMALIZERS[kind](value)
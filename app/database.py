@@ -1,8 +1,13 @@
 from sqlalchemy import create_engine
+from sqlalchemy.engine import make_url
+from sqlalchemy.pool import NullPool
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
-from utils.database_operation import create_database
+from sqlalchemy.orm import Session, sessionmaker
+from sqlalchemy.sql.dml import UpdateBase
+from .pool import TimedAsyncAdaptedQueuePool, TimedQueuePool, separately_timed
+from .replicas import ReplicaSet, ReplicaTarget, mark_write, reads_from_primary
 import os
+from uuid import uuid4
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -12,17 +17,214 @@ DATABASE_NAME = os.getenv("DATABASE_NAME")
 DATABASE_URL = os.getenv("DATABASE_URL")
 ADMIN_URL = os.getenv("ADMIN_URL")
 
-# Create the database if it doesn't exist
-create_database(ADMIN_URL, DATABASE_NAME)
+# "sync" serves the API from def handlers on the threadpool, "async" from async def handlers on AsyncSession
+DB_MODE = os.getenv("DB_MODE", "sync").lower()
 
-# SQLAlchemy setup
-engine = create_engine(DATABASE_URL)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+# Where users live: "split" reads and writes user_table plus one detail table per type, "dual" also
+# writes every change to the single users table, "unified" writes both and serves reads from users
+USER_STORAGE = os.getenv("USER_STORAGE", "split").lower()
+
+# Async driver URL, derived from DATABASE_URL when not set explicitly
+ASYNC_DRIVERS = {"postgresql": "postgresql+asyncpg", "sqlite": "sqlite+aiosqlite"}
+
+
+def to_async_url(url: str):
+    scheme, _, rest = url.partition("://")
+    return f"{ASYNC_DRIVERS.get(scheme.split('+')[0], scheme)}://{rest}"
+
+
+ASYNC_DATABASE_URL = os.getenv("ASYNC_DATABASE_URL") or (to_async_url(DATABASE_URL) if DATABASE_URL else None)
+
+# Comma-separated read replicas of DATABASE_URL, serving the GET routes (see app.replicas); their
+# async URLs are derived the same way
+DATABASE_REPLICA_URLS = [url.strip() for url in os.getenv("DATABASE_REPLICA_URLS", "").split(",") if url.strip()]
+
+
+def env_int(name: str, default: int):
+    value = os.getenv(name)
+    return int(value) if value not in (None, "") else default
+
+
+def env_bool(name: str, default: bool):
+    value = os.getenv(name)
+    return value.lower() in ("1", "true", "yes", "on") if value not in (None, "") else default
+
+
+# Connection pool settings
+DB_POOL_SIZE = env_int("DB_POOL_SIZE", 5)
+DB_MAX_OVERFLOW = env_int("DB_MAX_OVERFLOW", 10)
+DB_POOL_TIMEOUT = env_int("DB_POOL_TIMEOUT", 30)
+DB_POOL_RECYCLE = env_int("DB_POOL_RECYCLE", -1)
+DB_POOL_PRE_PING = env_bool("DB_POOL_PRE_PING", False)
+# Server-side statement_timeout in milliseconds, 0 leaves the server default
+DB_STATEMENT_TIMEOUT_MS = env_int("DB_STATEMENT_TIMEOUT_MS", 0)
+# Set when an external pooler (PgBouncer) sits in front of Postgres: no client-side pool and
+# no server-side prepared statements, which don't survive transaction pooling
+DB_EXTERNAL_POOLER = env_bool("DB_EXTERNAL_POOLER", False)
+# Total connections the API may hold on Postgres, across all workers and engines; 0 for no cap.
+# Each worker gets an equal share and its pool_size / max_overflow are cut down to fit it.
+DB_CONNECTION_BUDGET = env_int("DB_CONNECTION_BUDGET", 0)
+# Worker processes sharing the budget. python -m app.server sets it for its workers, uvicorn and
+# gunicorn read it as their default worker count too.
+WEB_CONCURRENCY = env_int("WEB_CONCURRENCY", 1)
+# Run app.bootstrap in the app lifespan; convenient for local SQLite, leave off when several workers
+# share a database and run `python -m app.bootstrap` once before starting them
+DB_MIGRATE_ON_STARTUP = env_bool("DB_MIGRATE_ON_STARTUP", False)
+
+
+def pool_limits(workers: int = WEB_CONCURRENCY, budget: int = DB_CONNECTION_BUDGET):
+    # (pool_size, max_overflow) of each engine of a worker. In async mode a worker has two engines
+    # (the sync one serves bulk registration and the outbox), both get the same share.
+    engines = 2 if DB_MODE == "async" else 1
+    if not budget:
+        return DB_POOL_SIZE, DB_MAX_OVERFLOW
+    share = budget // (workers * engines)
+    if share < 1:
+        raise ValueError(
+            f"DB_CONNECTION_BUDGET={budget} cannot give {workers} workers x {engines} engines a connection each"
+        )
+    pool_size = min(DB_POOL_SIZE, share)
+    return pool_size, min(DB_MAX_OVERFLOW, share - pool_size)
+
+
+def engine_options(url: str, is_async: bool = False):
+    backend = make_url(url).get_backend_name()
+    options = {"pool_pre_ping": DB_POOL_PRE_PING}
+    connect_args = {}
+
+    if DB_EXTERNAL_POOLER:
+        options["poolclass"] = NullPool
+        if is_async and backend == "postgresql":
+            # asyncpg prepares statements by default, psycopg2 never does
+            connect_args["statement_cache_size"] = 0
+            connect_args["prepared_statement_cache_size"] = 0
+            connect_args["prepared_statement_name_func"] = lambda: f"__asyncpg_{uuid4()}__"
+    else:
+        pool_size, max_overflow = pool_limits()
+        options.update({
+            "poolclass": TimedAsyncAdaptedQueuePool if is_async else TimedQueuePool,
+            "pool_size": pool_size,
+            "max_overflow": max_overflow,
+            "pool_timeout": DB_POOL_TIMEOUT,
+            "pool_recycle": DB_POOL_RECYCLE,
+        })
+
+    if DB_STATEMENT_TIMEOUT_MS and backend == "postgresql":
+        if is_async:
+            connect_args["server_settings"] = {"statement_timeout": str(DB_STATEMENT_TIMEOUT_MS)}
+        else:
+            connect_args["options"] = f"-c statement_timeout={DB_STATEMENT_TIMEOUT_MS}"
+
+    if connect_args:
+        options["connect_args"] = connect_args
+    return options
+
+
+class RoutingSession(Session):
+    # Sessions opened with info={"replica_reads": True} (get_read_db) send their reads to a replica,
+    # the same one for the whole session. Flushes and INSERT/UPDATE/DELETE always go to the primary
+    # (the session's bind) and make the client read from the primary for a while.
+    uses_async_engine = False
+
+    def get_bind(self, mapper=None, *, clause=None, **kw):
+        primary = super().get_bind(mapper, clause=clause, **kw)
+        if replicas is None:
+            return primary
+        if self._flushing or isinstance(clause, UpdateBase):
+            mark_write()
+            return primary
+        if not self.info.get("replica_reads"):
+            return primary
+        if "replica" not in self.info:
+            self.info["replica"] = replicas.choose(sticky=reads_from_primary())
+        target = self.info["replica"]
+        if target is None:
+            return primary
+        return target.async_engine.sync_engine if self.uses_async_engine else target.engine
+
+
+class AsyncRoutingSession(RoutingSession):
+    # The sync session behind an AsyncSession: binds are the sync_engine of async engines
+    uses_async_engine = True
+
+
+# Engines are built by init_engines() (app lifespan, bootstrap command, scripts) so that importing
+# this module never opens a connection; creating the database and tables is app.bootstrap's job
+engine = None
+# expire_on_commit=False keeps committed objects readable without a refresh SELECT
+SessionLocal = sessionmaker(class_=RoutingSession, autocommit=False, autoflush=False, expire_on_commit=False)
 Base = declarative_base()
 
+# The async engine is only built in async mode so sync deployments don't need asyncpg
+async_engine = None
+AsyncSessionLocal = None
+
+# ReplicaSet of DATABASE_REPLICA_URLS, None without replicas
+replicas = None
+
+
+def replica_engine_options(url: str, is_async: bool = False):
+    # Same pool settings as the primary (the connection budget is per server), own pool counters
+    options = engine_options(url, is_async)
+    if options["poolclass"] in (TimedQueuePool, TimedAsyncAdaptedQueuePool):
+        options["poolclass"] = separately_timed(options["poolclass"])
+    return options
+
+
+def init_replicas():
+    targets = []
+    for number, url in enumerate(DATABASE_REPLICA_URLS, start=1):
+        replica_async_engine = None
+        if DB_MODE == "async":
+            from sqlalchemy.ext.asyncio import create_async_engine
+
+            async_url = to_async_url(url)
+            replica_async_engine = create_async_engine(async_url, **replica_engine_options(async_url, is_async=True))
+        targets.append(ReplicaTarget(f"replica{number}", create_engine(url, **replica_engine_options(url)), replica_async_engine))
+    replica_set = ReplicaSet(targets)
+    replica_set.count_statements(engine, "primary")
+    if async_engine is not None:
+        replica_set.count_statements(async_engine.sync_engine, "primary")
+    return replica_set
+
+
+def init_engines():
+    global engine, async_engine, AsyncSessionLocal, replicas
+    if engine is None:
+        engine = create_engine(DATABASE_URL, **engine_options(DATABASE_URL))
+        SessionLocal.configure(bind=engine)
+
+        if DB_MODE == "async":
+            from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+            async_engine = create_async_engine(ASYNC_DATABASE_URL, **engine_options(ASYNC_DATABASE_URL, is_async=True))
+            AsyncSessionLocal = async_sessionmaker(
+                async_engine, sync_session_class=AsyncRoutingSession, autoflush=False, expire_on_commit=False
+            )
+
+        if DATABASE_REPLICA_URLS:
+            replicas = init_replicas()
+    return engine
+
 def get_db():
     db = SessionLocal()
     try:
         yield db
     finally:
         db.close()
+
+def get_read_db():
+    # For routes that only read: a replica when one is configured and healthy
+    db = SessionLocal(info={"replica_reads": True})
+    try:
+        yield db
+    finally:
+        db.close()
+
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
+
+async def get_async_read_db():
+    async with AsyncSessionLocal(info={"replica_reads": True}) as db:
+        yield db
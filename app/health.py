@@ -0,0 +1,112 @@
+"""Liveness and readiness for load balancers and orchestrators.
+
+GET /health answers as long as the worker's event loop does. GET /ready answers 503 while the
+worker should get no traffic: it is shutting down, its pool timed out handing out connections,
+or the database does not answer. Probes are cheap: requests checking connections out of the pool
+since the last probe, without a disconnect error, already show the database is reachable, so it
+is only pinged when the pool has been idle, at most once per READY_CHECK_INTERVAL.
+"""
+import logging
+import os
+import signal
+import threading
+import time
+
+from sqlalchemy import event
+
+logger = logging.getLogger(__name__)
+
+READY_CHECK_INTERVAL = float(os.getenv("READY_CHECK_INTERVAL", "5"))
+# On SIGTERM, answer 503 on /ready but keep serving this long before uvicorn stops accepting,
+# so the load balancer takes the worker out of rotation first. 0 stops right away.
+SHUTDOWN_DRAIN_SECONDS = float(os.getenv("SHUTDOWN_DRAIN_SECONDS", "0"))
+# After the last request, how long shutdown waits for checked-out connections before disposing the pools
+SHUTDOWN_POOL_TIMEOUT = float(os.getenv("SHUTDOWN_POOL_TIMEOUT", "10"))
+
+
+def pool_counters(engines):
+    # Checkouts and checkout timeouts of the engines' timed pools (NullPool has no counters)
+    snapshots = [engine.pool.metrics.snapshot() for engine in engines if hasattr(engine.pool, "metrics")]
+    return sum(snapshot["checkouts"] for snapshot in snapshots), sum(snapshot["checkout_timeouts"] for snapshot in snapshots)
+
+
+class Readiness:
+    def __init__(self, interval=READY_CHECK_INTERVAL):
+        self.interval = interval
+        self.draining = False
+        self._lock = threading.Lock()
+        self._checkouts = 0
+        self._timeouts = 0
+        self._disconnected = False
+        self._pinged_at = None
+        self._ping_error = None
+
+    def watch(self, engine):
+        # A disconnect seen by any statement forces a ping on the next probe
+        event.listen(engine, "handle_error", self._on_error)
+
+    def _on_error(self, context):
+        if context.is_disconnect:
+            self._disconnected = True
+
+    def check(self, engine, pool_engines=()):
+        # None when ready, otherwise the reason. engine is pinged when needed, pool_engines (the
+        # async engine, same database) only add their pool counters.
+        if self.draining:
+            return "shutting down"
+        engines = (engine, *pool_engines)
+        checkouts, timeouts = pool_counters(engines)
+        with self._lock:
+            exhausted = timeouts > self._timeouts
+            self._timeouts = timeouts
+            if exhausted:
+                self._checkouts = checkouts
+                return "connection pool exhausted: checkouts timed out since the last probe"
+            if checkouts > self._checkouts and not self._disconnected:
+                # Requests got connections since the last probe and none of them lost it
+                self._checkouts = checkouts
+                self._ping_error = None
+                return None
+            if not self._disconnected and self._pinged_at is not None and time.monotonic() - self._pinged_at < self.interval:
+                return self._ping_error
+            self._ping_error = self._ping(engine)
+            self._pinged_at = time.monotonic()
+            self._disconnected = False
+            # The ping's own checkout is not request activity
+            self._checkouts, _ = pool_counters(engines)
+            return self._ping_error
+
+    def _ping(self, engine):
+        # The dialect's own liveness check on a pooled connection, no statement events or ORM
+        try:
+            with engine.connect() as connection:
+                engine.dialect.do_ping(connection.connection.dbapi_connection)
+            return None
+        except Exception as e:
+            logger.warning("readiness_ping_failed", extra={"error": str(e)})
+            return f"database unreachable: {type(e).__name__}"
+
+
+readiness = Readiness()
+
+
+def install_drain_handler(delay=SHUTDOWN_DRAIN_SECONDS):
+    # Wraps the server's SIGTERM handler (installed before the lifespan starts): the first SIGTERM
+    # marks the worker as draining and hands over to the server after delay seconds
+    if delay <= 0 or threading.current_thread() is not threading.main_thread():
+        return
+    server_handler = signal.getsignal(signal.SIGTERM)
+    if not callable(server_handler):
+        return
+
+    def handle_sigterm(signum, frame):
+        if readiness.draining:
+            server_handler(signum, frame)
+            return
+        readiness.draining = True
+        logger.info("draining", extra={"seconds": delay})
+        timer = threading.Timer(delay, server_handler, (signum, frame))
+        timer.daemon = True
+        timer.start()
+
+    signal.signal(signal.SIGTERM, handle_sigterm)
@@ -0,0 +1,283 @@
+import contextvars
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import time
+from bisect import bisect_left
+
+from sqlalchemy import event
+
+logger = logging.getLogger(__name__)
+
+INSTRUMENTATION_ENABLED = os.getenv("INSTRUMENTATION_ENABLED", "true").lower() in ("1", "true", "yes", "on")
+# Statements slower than this are logged with their fingerprint, 0 disables slow-query logging
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "500"))
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+STATEMENT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+
+# Logging
+
+# Attributes every LogRecord has, anything else came in through extra= and is emitted as a field
+RESERVED_LOG_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        entry.update({key: value for key, value in vars(record).items() if key not in RESERVED_LOG_ATTRS})
+        if record.exc_info:
+            entry["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+def configure_logging():
+    # LOG_LEVEL=DEBUG turns on per-request diagnostics, LOG_FORMAT=text for human-readable output.
+    # Like logging.basicConfig, does nothing when the root logger already has handlers: logging set
+    # up by a test runner or an application embedding this one is left as it is.
+    root = logging.getLogger()
+    if root.handlers:
+        return
+    handler = logging.StreamHandler()
+    if os.getenv("LOG_FORMAT", "json").lower() == "json":
+        handler.setFormatter(JsonFormatter())
+    else:
+        handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s [%(name)s] %(message)s"))
+    root.addHandler(handler)
+    root.setLevel(os.getenv("LOG_LEVEL", "INFO").upper())
+
+
+# Metrics
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.total += value
+        self.count += 1
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.request_latency = {}  # (method, route, status) -> Histogram
+        self.request_statements = {}  # (method, route) -> Histogram
+        self.request_db_time = {}  # (method, route) -> Histogram
+        self.statements_total = 0
+        self.db_seconds_total = 0.0
+        self.slow_statements_total = 0
+        self.failed_statements_total = 0
+
+    def observe_request(self, method, route, status, seconds, stats):
+        with self._lock:
+            self.request_latency.setdefault((method, route, status), Histogram(LATENCY_BUCKETS)).observe(seconds)
+            self.request_statements.setdefault((method, route), Histogram(STATEMENT_BUCKETS)).observe(stats.statements)
+            self.request_db_time.setdefault((method, route), Histogram(LATENCY_BUCKETS)).observe(stats.db_seconds)
+
+    def observe_statement(self, seconds, slow, failed=False):
+        with self._lock:
+            self.statements_total += 1
+            self.db_seconds_total += seconds
+            if slow:
+                self.slow_statements_total += 1
+            if failed:
+                self.failed_statements_total += 1
+
+
+metrics = MetricsRegistry()
+
+
+def _labels(**labels):
+    return ",".join(f'{key}="{str(value)}"' for key, value in labels.items())
+
+
+def _render_histograms(lines, name, help_text, histograms, label_names):
+    lines.append(f"# HELP {name} {help_text}")
+    lines.append(f"# TYPE {name} histogram")
+    for label_values, histogram in sorted(histograms.items()):
+        labels = _labels(**dict(zip(label_names, label_values)))
+        cumulative = 0
+        for bound, count in zip(histogram.buckets + ("+Inf",), histogram.counts):
+            cumulative += count
+            lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+        lines.append(f"{name}_sum{{{labels}}} {histogram.total}")
+        lines.append(f"{name}_count{{{labels}}} {histogram.count}")
+
+
+def _render_gauges(lines, name, help_text, kind, samples):
+    lines.append(f"# HELP {name} {help_text}")
+    lines.append(f"# TYPE {name} {kind}")
+    for labels, value in samples:
+        lines.append(f"{name}{{{_labels(**labels)}}} {value}" if labels else f"{name} {value}")
+
+
+def render_metrics(pools=None, cache_stats=None, outbox_stats=None, admission_stats=None, replica_stats=None):
+    # Prometheus text exposition format. pools maps an engine label to its pool_status() dict.
+    lines = []
+    with metrics._lock:
+        _render_histograms(lines, "http_request_duration_seconds", "Request latency by route.",
+                           metrics.request_latency, ("method", "route", "status"))
+        _render_histograms(lines, "db_statements_per_request", "SQL statements issued per request.",
+                           metrics.request_statements, ("method", "route"))
+        _render_histograms(lines, "db_time_per_request_seconds", "Time spent in SQL per request.",
+                           metrics.request_db_time, ("method", "route"))
+        _render_gauges(lines, "db_statements_total", "SQL statements executed.", "counter",
+                       [({}, metrics.statements_total)])
+        _render_gauges(lines, "db_time_seconds_total", "Time spent executing SQL.", "counter",
+                       [({}, metrics.db_seconds_total)])
+        _render_gauges(lines, "db_slow_statements_total", "Statements slower than SLOW_QUERY_MS.", "counter",
+                       [({}, metrics.slow_statements_total)])
+        _render_gauges(lines, "db_failed_statements_total", "Statements that raised (unique violations included).", "counter",
+                       [({}, metrics.failed_statements_total)])
+
+    for key in ("checked_out", "overflow", "checkout_wait_seconds_total", "checkout_wait_seconds_max", "checkout_timeouts"):
+        samples = [({"engine": label}, status[key]) for label, status in (pools or {}).items() if key in status]
+        if samples:
+            kind = "counter" if key in ("checkout_wait_seconds_total", "checkout_timeouts") else "gauge"
+            _render_gauges(lines, f"db_pool_{key}", f"Connection pool {key.replace('_', ' ')}.", kind, samples)
+
+    for key, value in (cache_stats or {}).items():
+        if isinstance(value, (int, float)):
+            _render_gauges(lines, f"user_cache_{key}", f"User cache {key}.", "gauge", [({}, value)])
+
+    for key, value in (outbox_stats or {}).items():
+        _render_gauges(lines, f"outbox_events_{key}_total", f"Outbox events {key} by this worker.", "counter", [({}, value)])
+
+    for key, value in (admission_stats or {}).items():
+        _render_gauges(lines, f"registrations_{key}_total", f"POST /add_user requests {key.replace('_', ' ')}.", "counter", [({}, value)])
+
+    if replica_stats:
+        _render_gauges(lines, "db_target_statements_total", "SQL statements executed per database target.", "counter",
+                       [({"target": label}, value) for label, value in sorted(replica_stats["statements"].items())])
+        replicas = sorted(replica_stats["replicas"].items())
+        _render_gauges(lines, "db_replica_reads_total", "Read sessions routed to each replica.", "counter",
+                       [({"replica": label}, replica["reads"]) for label, replica in replicas])
+        _render_gauges(lines, "db_replica_healthy", "1 while the replica passes its health checks.", "gauge",
+                       [({"replica": label}, int(replica["healthy"])) for label, replica in replicas])
+        _render_gauges(lines, "db_replica_fallback_reads_total", "Reads sent to the primary because no replica was healthy.",
+                       "counter", [({}, replica_stats["fallback_reads"])])
+        _render_gauges(lines, "db_replica_sticky_reads_total", "Reads sent to the primary after the client's own write.",
+                       "counter", [({}, replica_stats["sticky_reads"])])
+
+    return "\n".join(lines) + "\n"
+
+
+# Per-request SQL accounting
+
+class RequestStats:
+    __slots__ = ("statements", "db_seconds")
+
+    def __init__(self):
+        self.statements = 0
+        self.db_seconds = 0.0
+
+
+# Set by the middleware; threadpool handlers see the same object because anyio copies the context
+current_request_stats = contextvars.ContextVar("current_request_stats", default=None)
+
+NUMBER_LITERAL = re.compile(r"\b\d+(\.\d+)?\b")
+STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+PLACEHOLDER_LIST = re.compile(r"\((\s*(\?|%\(\w+\)s|\$\d+|:\w+|__\[POSTCOMPILE_\w+\])\s*,?)+\)")
+WHITESPACE = re.compile(r"\s+")
+
+
+def statement_fingerprint(statement: str):
+    # Same shape of query -> same fingerprint: literals and IN lists collapsed, whitespace normalized
+    normalized = STRING_LITERAL.sub("?", statement)
+    normalized = NUMBER_LITERAL.sub("?", normalized)
+    normalized = PLACEHOLDER_LIST.sub("(?)", normalized)
+    normalized = WHITESPACE.sub(" ", normalized).strip()
+    return hashlib.sha1(normalized.encode()).hexdigest()[:12], normalized
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_start_time", []).append(time.perf_counter())
+
+
+def _count_statement(elapsed, slow, failed=False):
+    metrics.observe_statement(elapsed, slow, failed)
+
+    stats = current_request_stats.get()
+    if stats is not None:
+        stats.statements += 1
+        stats.db_seconds += elapsed
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info["query_start_time"].pop()
+    slow = SLOW_QUERY_MS > 0 and elapsed * 1000 >= SLOW_QUERY_MS
+    _count_statement(elapsed, slow)
+
+    if slow:
+        fingerprint, normalized = statement_fingerprint(statement)
+        logger.warning(
+            "slow_query",
+            extra={"fingerprint": fingerprint, "duration_ms": round(elapsed * 1000, 2), "statement": normalized},
+        )
+
+
+def _handle_error(context):
+    # A statement that raised never reaches after_cursor_execute: count it and drop its start time
+    starts = context.connection.info.get("query_start_time") if context.connection is not None else None
+    if context.execution_context is not None and starts:
+        _count_statement(time.perf_counter() - starts.pop(), False, failed=True)
+
+
+def instrument_engine(engine):
+    # Sync engine, or async_engine.sync_engine
+    if not INSTRUMENTATION_ENABLED or event.contains(engine, "before_cursor_execute", _before_cursor_execute):
+        return
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+    event.listen(engine, "handle_error", _handle_error)
+
+
+class InstrumentationMiddleware:
+    # Plain ASGI middleware: per-route latency histogram, per-request SQL count/time and Server-Timing
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not INSTRUMENTATION_ENABLED:
+            await self.app(scope, receive, send)
+            return
+
+        stats = RequestStats()
+        token = current_request_stats.set(stats)
+        started = time.perf_counter()
+        status = 500
+
+        async def send_with_timing(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                app_ms = (time.perf_counter() - started) * 1000
+                server_timing = (
+                    f'app;dur={app_ms:.2f}, db;dur={stats.db_seconds * 1000:.2f};desc="{stats.statements} queries"'
+                )
+                message["headers"] = list(message.get("headers", [])) + [(b"server-timing", server_timing.encode())]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            current_request_stats.reset(token)
+            # Route template keeps label cardinality bounded, unmatched paths share one label
+            route = scope.get("route")
+            metrics.observe_request(
+                scope["method"], getattr(route, "path", "<unmatched>"), status, time.perf_counter() - started, stats
+            )
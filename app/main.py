@@ -1,12 +1,147 @@
-from fastapi import FastAPI, Depends
-from sqlalchemy.orm import Session
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+
+from fastapi import FastAPI, APIRouter
+from fastapi.responses import JSONResponse, PlainTextResponse
 from app.routes import router as registration_router
 
-from app.database import engine
-from app.models import Base
+from app import database
+from app.database import DATABASE_REPLICA_URLS, DB_MIGRATE_ON_STARTUP, DB_MODE, init_engines
+from app.pool import pool_status, wait_for_checkins
+from app.health import SHUTDOWN_POOL_TIMEOUT, install_drain_handler, readiness
+from app.cache import user_cache
+from app.passwords import start_executor, shutdown_executor
+from app.outbox import outbox_stats, start_dispatcher, stop_dispatcher
+from app.admission import admission_stats
+from app.replicas import ReplicaRoutingMiddleware
+from app.instrumentation import InstrumentationMiddleware, configure_logging, instrument_engine, render_metrics
+
+logger = logging.getLogger(__name__)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # In each worker process, not at import: importing the app leaves logging alone
+    configure_logging()
+    # Engines are created here rather than at import so workers start without touching the database
+    engine = init_engines()
+    instrument_engine(engine)
+    readiness.watch(engine)
+    if database.async_engine is not None:
+        instrument_engine(database.async_engine.sync_engine)
+        readiness.watch(database.async_engine.sync_engine)
+    if database.replicas is not None:
+        for target in database.replicas.targets:
+            for replica_engine in target.engines():
+                instrument_engine(replica_engine)
+        # Health checks of the replicas, reads fall back to the primary while none is healthy
+        database.replicas.start()
+    if DB_MIGRATE_ON_STARTUP:
+        from app.bootstrap import migrate
+        migrate()
+
+    # Start the password hashing workers before taking traffic, stop them on shutdown
+    start_executor()
+    # Outbox dispatcher thread, when OUTBOX_ENABLED and OUTBOX_DISPATCHER=app
+    start_dispatcher()
+    # SHUTDOWN_DRAIN_SECONDS: fail readiness on SIGTERM, keep serving a while before stopping
+    install_drain_handler()
+    yield
+    # The server has stopped accepting and waited for in-flight requests (--graceful-timeout)
+    readiness.draining = True
+    stop_dispatcher()
+    shutdown_executor()
+    if database.replicas is not None:
+        database.replicas.stop()
+
+    # Close the pools once every connection is back, so no transaction is cut off mid-way
+    engines = [engine] + ([database.async_engine.sync_engine] if database.async_engine is not None else [])
+    for pool_engine in engines:
+        still_out = await asyncio.to_thread(wait_for_checkins, pool_engine, SHUTDOWN_POOL_TIMEOUT)
+        if still_out:
+            logger.warning("connections_still_checked_out", extra={"connections": still_out})
+    engine.dispose()
+    if database.async_engine is not None:
+        await database.async_engine.dispose()
+    if database.replicas is not None:
+        for target in database.replicas.targets:
+            target.engine.dispose()
+            if target.async_engine is not None:
+                await target.async_engine.dispose()
 
-app = FastAPI()
+
+app = FastAPI(lifespan=lifespan)
+app.add_middleware(InstrumentationMiddleware)
+if DATABASE_REPLICA_URLS:
+    # Read-your-writes cookie, see app.replicas
+    app.add_middleware(ReplicaRoutingMiddleware)
+
+if DB_MODE == "async":
+    from app.async_routes import router as async_registration_router
+    app.include_router(async_registration_router)
+
+    # Keep only the sync routes that have no async version (bulk registration)
+    async_paths = {route.path for route in async_registration_router.routes}
+    registration_router = APIRouter(
+        routes=[route for route in registration_router.routes if route.path not in async_paths]
+    )
 
 app.include_router(registration_router)
 
-Base.metadata.create_all(bind=engine)
+
+def pool_statuses():
+    pools = {"sync": pool_status(database.engine)}
+    if database.async_engine is not None:
+        pools["async"] = pool_status(database.async_engine.sync_engine)
+    for target in database.replicas.targets if database.replicas is not None else ():
+        pools[target.label] = pool_status(target.engine)
+        if target.async_engine is not None:
+            pools[f"{target.label}_async"] = pool_status(target.async_engine.sync_engine)
+    return pools
+
+
+def replica_stats():
+    return database.replicas.stats() if database.replicas is not None else {}
+
+
+@app.get("/health")
+async def health():
+    # Liveness: the worker's event loop answers
+    return {"status": "ok"}
+
+
+@app.get("/ready")
+def ready():
+    # Readiness: pool counters, and a database ping at most every READY_CHECK_INTERVAL seconds
+    async_engines = [database.async_engine.sync_engine] if database.async_engine is not None else []
+    reason = readiness.check(database.engine, async_engines)
+    if reason is not None:
+        return JSONResponse({"status": "unavailable", "reason": reason}, status_code=503)
+    return {"status": "ready"}
+
+
+@app.get("/pool_metrics/")
+def get_pool_metrics():
+    # Pool saturation (checked out, overflow) and checkout wait time
+    return pool_statuses()
+
+
+@app.get("/cache_metrics/")
+def get_cache_metrics():
+    # Hit/miss/eviction counters of the GET /get_user cache
+    return user_cache.stats()
+
+
+@app.get("/replica_metrics/")
+def get_replica_metrics():
+    # Statements per target (primary, replicas), read sessions per replica, fallbacks and sticky reads
+    return replica_stats()
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def get_metrics():
+    # Prometheus scrape endpoint: route latency, per-request SQL counts/time, pool, cache, outbox and admission counters
+    return PlainTextResponse(
+        render_metrics(pool_statuses(), user_cache.stats(), outbox_stats(), admission_stats(), replica_stats()), media_type="text/plain; version=0.0.4"
+    )
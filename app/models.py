@@ -1,9 +1,11 @@
-import re
-from sqlalchemy import Column, Integer, String, Enum, Date, ForeignKey, UniqueConstraint
+from datetime import datetime, timezone
+from types import SimpleNamespace
+from sqlalchemy import (
+    DDL, Column, Computed, Integer, Index, String, Enum, Date, DateTime, ForeignKey, JSON, UniqueConstraint, event, func
+)
 from sqlalchemy.orm import relationship
 from .database import Base
 import enum
-from sqlalchemy.orm import validates
 
 
 
@@ -18,6 +20,7 @@ class UserTable(Base):
 
     id = Column(Integer, primary_key=True, index=True)
     type = Column(Enum(RegistrationType), nullable=False)  # Use Enum here
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False, index=True)
     
     social_media_id = Column(Integer, ForeignKey('social_media_data.id', ondelete='CASCADE'))
     platform_registration_id = Column(Integer, ForeignKey('platform_registration_data.id', ondelete='CASCADE'))
@@ -27,6 +30,8 @@ class UserTable(Base):
     social_media_data = relationship("SocialMediaData", back_populates="user", uselist=False, cascade="all, delete")
     platform_registration_data = relationship("PlatformRegistrationData", back_populates="user", uselist=False, cascade="all, delete")
     basic_signup_data = relationship("BasicSignupData", back_populates="user", uselist=False, cascade="all, delete")
+    contact_key = relationship("ContactKey", back_populates="user", uselist=False, cascade="all, delete-orphan")
+    search_entry = relationship("UserSearch", back_populates="user", uselist=False, cascade="all, delete-orphan")
 
     @property
     def user_specific_data(self):
@@ -40,6 +45,7 @@ class UserTable(Base):
         return None
 
 
+# Field checks (mobile number length, email format) run in app.validation before these rows are built
 class SocialMediaData(Base):
     __tablename__ = "social_media_data"
     id = Column(Integer, primary_key=True, index=True)
@@ -47,6 +53,8 @@ class SocialMediaData(Base):
     first_name = Column(String, nullable=False)
     last_name = Column(String, nullable=False)
     hashtag = Column(String, nullable=True)
+    # Bumped by every update, exposed as the ETag for If-Match
+    version = Column(Integer, nullable=False, default=1, server_default="1")
 
     # Relationship back to UserTable
     user = relationship("UserTable", back_populates="social_media_data")
@@ -54,12 +62,6 @@ class SocialMediaData(Base):
     __table_args__ = (
         UniqueConstraint('mobile_number', name='uix_mobile_number_type'),
     )
-    @validates('mobile_number')
-    def validate_mobile_number(self, key, value):
-        if len(value) != 10:
-            raise ValueError('Invalid mobile number length')
-        return value
-
 
 
 class PlatformRegistrationData(Base):
@@ -71,17 +73,13 @@ class PlatformRegistrationData(Base):
         email = Column(String, nullable=False)
         password = Column(String, nullable=False)
         company_name = Column(String, nullable=True)
+        version = Column(Integer, nullable=False, default=1, server_default="1")
 
         # Relationship back to UserTable
         user = relationship("UserTable", back_populates="platform_registration_data")
         __table_args__ = (
             UniqueConstraint('email', name='uix_email_type'),
         )
-        @validates('email')
-        def validate_email(self, key, value):
-            if not re.match(r'^[\w\.-]+@[\w\.-]+\.\w+$', value):
-                raise ValueError('Invalid email format')
-            return value
 
 
 class BasicSignupData(Base):
@@ -92,6 +90,7 @@ class BasicSignupData(Base):
     first_name = Column(String, nullable=False)
     last_name = Column(String, nullable=False)
     dob = Column(Date, nullable=True)
+    version = Column(Integer, nullable=False, default=1, server_default="1")
 
     # Relationship back to UserTable
     user = relationship("UserTable", back_populates="basic_signup_data")
@@ -99,8 +98,115 @@ class BasicSignupData(Base):
         UniqueConstraint('mobile_number', name='uix_basic_mobile_number_type'),
     )
 
-    @validates('mobile_number')
-    def validate_mobile_number(self, key, value):
-        if len(value) != 10:
-            raise ValueError('Invalid mobile number length')
-        return value
+
+class ContactKey(Base):
+    # Normalized mobile number (E.164) or email of every user, whatever the registration type.
+    # The unique index makes "does this contact exist anywhere" a single lookup and stops the
+    # same contact from registering again under another type.
+    __tablename__ = "contact_keys"
+
+    id = Column(Integer, primary_key=True, index=True)
+    key = Column(String, nullable=False)
+    kind = Column(String, nullable=False)  # "mobile_number" or "email"
+    user_id = Column(Integer, ForeignKey('user_table.id', ondelete='CASCADE'), nullable=False, index=True)
+
+    user = relationship("UserTable", back_populates="contact_key")
+    __table_args__ = (
+        UniqueConstraint('key', name='uix_contact_key'),
+    )
+
+
+class UserSearch(Base):
+    # Searchable text of every user, whatever the registration type, lowercased (see app.search).
+    # Written in the same transaction as the user, like the contact key. On Postgres, pg_trgm GIN
+    # indexes serve substring matches on the name and hashtag and a pattern_ops B-tree serves email
+    # prefixes; SQLite has no trigram index and scans the table.
+    __tablename__ = "user_search"
+
+    user_id = Column(Integer, ForeignKey('user_table.id', ondelete='CASCADE'), primary_key=True)
+    type = Column(Enum(RegistrationType), nullable=False)
+    first_name = Column(String, nullable=False)
+    last_name = Column(String, nullable=False)
+    name = Column(String, Computed("first_name || ' ' || last_name", persisted=True))
+    email = Column(String, nullable=True)
+    hashtag = Column(String, nullable=True)
+
+    user = relationship("UserTable", back_populates="search_entry")
+    __table_args__ = (
+        Index("ix_user_search_name_trgm", "name", postgresql_using="gin", postgresql_ops={"name": "gin_trgm_ops"}).ddl_if(dialect="postgresql"),
+        Index("ix_user_search_hashtag_trgm", "hashtag", postgresql_using="gin", postgresql_ops={"hashtag": "gin_trgm_ops"}).ddl_if(dialect="postgresql"),
+        Index("ix_user_search_email_prefix", "email", postgresql_ops={"email": "text_pattern_ops"}).ddl_if(dialect="postgresql"),
+    )
+
+
+# gin_trgm_ops comes with the pg_trgm extension
+event.listen(
+    UserSearch.__table__, "before_create", DDL("CREATE EXTENSION IF NOT EXISTS pg_trgm").execute_if(dialect="postgresql")
+)
+
+
+class User(Base):
+    # Single-table layout (USER_STORAGE=dual or unified): one row per user, shared columns plus the
+    # type-specific ones side by side, NULL where a type doesn't use them. Single table inheritance
+    # maps each row to the subclass of its type.
+    __tablename__ = "users"
+
+    id = Column(Integer, primary_key=True)  # same id as the user's user_table row
+    type = Column(Enum(RegistrationType), nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+    # Id of the detail row in the split layout, so user_data["id"] is the same whichever layout is read
+    detail_id = Column(Integer, nullable=False)
+    first_name = Column(String, nullable=False)
+    last_name = Column(String, nullable=False)
+    mobile_number = Column(String, nullable=True, index=True)
+    email = Column(String, nullable=True, index=True)
+    password = Column(String, nullable=True)
+    company_name = Column(String, nullable=True)
+    hashtag = Column(String, nullable=True)
+    dob = Column(Date, nullable=True)
+    version = Column(Integer, nullable=False, default=1, server_default="1")
+
+    __mapper_args__ = {"polymorphic_on": type}
+
+    # Columns of the type's detail table, besides id and version
+    detail_fields = ()
+
+    @property
+    def user_specific_data(self):
+        # Same attributes as the detail row of the split layout
+        return SimpleNamespace(
+            id=self.detail_id, version=self.version, **{field: getattr(self, field) for field in self.detail_fields}
+        )
+
+
+class SocialMediaUser(User):
+    __mapper_args__ = {"polymorphic_identity": RegistrationType.SOCIAL_MEDIA}
+    detail_fields = ("mobile_number", "first_name", "last_name", "hashtag")
+
+
+class PlatformRegistrationUser(User):
+    __mapper_args__ = {"polymorphic_identity": RegistrationType.PROJECT_MANAGEMENT}
+    detail_fields = ("first_name", "last_name", "email", "password", "company_name")
+
+
+class BasicSignupUser(User):
+    __mapper_args__ = {"polymorphic_identity": RegistrationType.COMMON_SIGNUP}
+    detail_fields = ("mobile_number", "first_name", "last_name", "dob")
+
+
+class OutboxEvent(Base):
+    # Transactional outbox: events are inserted in the same transaction as the change they describe
+    # and removed by the dispatcher (app.outbox) once a sink has accepted them
+    __tablename__ = "outbox_events"
+    # Consumers dedupe on the id: without AUTOINCREMENT SQLite hands the id of a delivered (deleted)
+    # event to the next one
+    __table_args__ = {"sqlite_autoincrement": True}
+
+    id = Column(Integer, primary_key=True)
+    event_type = Column(String, nullable=False)
+    payload = Column(JSON, nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+    # Failed deliveries are retried from available_at on, attempts counts the failures so far
+    available_at = Column(DateTime(timezone=True), nullable=False, default=lambda: datetime.now(timezone.utc), index=True)
+    attempts = Column(Integer, nullable=False, default=0, server_default="0")
+    last_error = Column(String, nullable=True)
@@ -0,0 +1,283 @@
+"""Transactional outbox: side effects of a registration (welcome messages, CRM sync, analytics).
+
+Routes insert an OutboxEvent in the transaction that creates the user, so an event exists exactly
+when the user does. The dispatcher drains the table in batches and hands every event to the sink;
+delivered events are deleted, failed ones are retried with exponential backoff until
+OUTBOX_MAX_ATTEMPTS. Delivery is at least once: consumers dedupe on the event id.
+
+The dispatcher runs as a thread in every app worker (OUTBOX_DISPATCHER=app), or on its own:
+
+    OUTBOX_DISPATCHER=external uvicorn app.main:app ...
+    python -m app.outbox            # dispatch until SIGINT/SIGTERM
+    python -m app.outbox --once     # drain what is due and exit
+"""
+import argparse
+import importlib
+import json
+import logging
+import os
+import queue
+import signal
+import threading
+import urllib.request
+from datetime import datetime, timedelta, timezone
+
+from fastapi.encoders import jsonable_encoder
+from sqlalchemy import delete, select, update
+
+from .database import SessionLocal, env_bool, env_int, init_engines
+from .instrumentation import configure_logging
+from .models import OutboxEvent
+
+logger = logging.getLogger(__name__)
+
+# Routes only write events when enabled; OUTBOX_SINK: log, file, queue, http or module:factory
+OUTBOX_ENABLED = env_bool("OUTBOX_ENABLED", False)
+OUTBOX_SINK = os.getenv("OUTBOX_SINK", "log")
+# "app" runs the dispatcher inside each API worker, "external" leaves it to python -m app.outbox
+OUTBOX_DISPATCHER = os.getenv("OUTBOX_DISPATCHER", "app").lower()
+OUTBOX_BATCH_SIZE = env_int("OUTBOX_BATCH_SIZE", 100)
+OUTBOX_POLL_SECONDS = float(os.getenv("OUTBOX_POLL_SECONDS", "1"))
+OUTBOX_MAX_ATTEMPTS = env_int("OUTBOX_MAX_ATTEMPTS", 10)
+OUTBOX_BACKOFF_SECONDS = float(os.getenv("OUTBOX_BACKOFF_SECONDS", "1"))
+OUTBOX_BACKOFF_MAX_SECONDS = float(os.getenv("OUTBOX_BACKOFF_MAX_SECONDS", "600"))
+# How long a claimed event stays invisible to other dispatchers; keep it above the time a batch
+# takes to deliver (OUTBOX_BATCH_SIZE x the sink's timeout at worst), or events are sent twice
+OUTBOX_LEASE_SECONDS = float(os.getenv("OUTBOX_LEASE_SECONDS", "300"))
+
+USER_REGISTERED = "user.registered"
+
+
+# Events
+
+def user_registered(user_id: int, reg_type, user_data):
+    # OutboxEvent values, user_data is the response's user_data (no password)
+    return {
+        "event_type": USER_REGISTERED,
+        "payload": jsonable_encoder({"user_id": user_id, "type": reg_type, "user_data": user_data}),
+    }
+
+
+def event_message(event: OutboxEvent):
+    # What sinks receive; id is stable across redeliveries and never reused (AUTOINCREMENT on SQLite)
+    return {
+        "id": event.id,
+        "type": event.event_type,
+        "created_at": jsonable_encoder(event.created_at),
+        "attempt": event.attempts + 1,
+        "payload": event.payload,
+    }
+
+
+# Sinks: deliver(message) returns once the event is accepted and raises otherwise
+
+class LogSink:
+    def deliver(self, message):
+        logger.info("outbox_event", extra={"event": message})
+
+
+class FileSink:
+    # One JSON line per delivery, for local runs and tests
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def deliver(self, message):
+        with self._lock, open(self.path, "a") as output:
+            output.write(json.dumps(message) + "\n")
+
+
+class QueueSink:
+    # In-process queue.Queue, consumers (tests) read outbox.sink.queue
+    def __init__(self):
+        self.queue = queue.Queue()
+
+    def deliver(self, message):
+        self.queue.put(message)
+
+
+class HttpSink:
+    # POSTs each event as JSON, any non-2xx answer is a failed delivery
+    def __init__(self, url, timeout):
+        self.url = url
+        self.timeout = timeout
+
+    def deliver(self, message):
+        request = urllib.request.Request(
+            self.url, data=json.dumps(message).encode(), headers={"Content-Type": "application/json"}, method="POST"
+        )
+        with urllib.request.urlopen(request, timeout=self.timeout):
+            pass
+
+
+def build_sink(name=OUTBOX_SINK):
+    if name == "file":
+        return FileSink(os.getenv("OUTBOX_FILE", "outbox.jsonl"))
+    if name == "queue":
+        return QueueSink()
+    if name == "http":
+        return HttpSink(os.environ["OUTBOX_HTTP_URL"], float(os.getenv("OUTBOX_HTTP_TIMEOUT", "5")))
+    if ":" in name:
+        # Custom sink: "package.module:factory", called without arguments
+        module, _, factory = name.partition(":")
+        return getattr(importlib.import_module(module), factory)()
+    return LogSink()
+
+
+# Dispatcher
+
+def backoff(attempts: int):
+    return timedelta(seconds=min(OUTBOX_BACKOFF_SECONDS * 2 ** (attempts - 1), OUTBOX_BACKOFF_MAX_SECONDS))
+
+
+class OutboxDispatcher:
+    def __init__(
+        self, sink, batch_size=OUTBOX_BATCH_SIZE, poll_seconds=OUTBOX_POLL_SECONDS, max_attempts=OUTBOX_MAX_ATTEMPTS,
+        lease_seconds=OUTBOX_LEASE_SECONDS,
+    ):
+        self.sink = sink
+        self.batch_size = batch_size
+        self.poll_seconds = poll_seconds
+        self.max_attempts = max_attempts
+        self.lease_seconds = lease_seconds
+        self.delivered = 0
+        self.failed = 0
+        self.dead = 0
+        self._wake = threading.Event()
+        self._stopping = threading.Event()
+        self._thread = None
+
+    def dispatch_batch(self):
+        # Deliver up to batch_size due events, returns how many were taken. The events are claimed in
+        # one short transaction and settled in another: no lock or transaction is held while the sink
+        # works. SKIP LOCKED lets several dispatchers (one per worker) share the table on Postgres.
+        now = datetime.now(timezone.utc)
+        with SessionLocal() as db:
+            events = db.execute(
+                select(OutboxEvent)
+                .where(OutboxEvent.available_at <= now, OutboxEvent.attempts < self.max_attempts)
+                .order_by(OutboxEvent.id)
+                .limit(self.batch_size)
+                .with_for_update(skip_locked=True)
+            ).scalars().all()
+            # Leased: other dispatchers skip them until the lease runs out, which redelivers the
+            # events of a dispatcher that died before settling them
+            claimed = [(event.id, event.attempts, event_message(event)) for event in events]
+            for event in events:
+                event.available_at = now + timedelta(seconds=self.lease_seconds)
+            db.commit()
+
+        delivered, failed = [], []
+        for event_id, attempts, message in claimed:
+            try:
+                self.sink.deliver(message)
+                delivered.append(event_id)
+            except Exception as e:
+                failed.append((event_id, attempts + 1, f"{type(e).__name__}: {e}"[:500]))
+
+        if delivered or failed:
+            settled_at = datetime.now(timezone.utc)
+            with SessionLocal() as db:
+                if delivered:
+                    db.execute(delete(OutboxEvent).where(OutboxEvent.id.in_(delivered)), execution_options={"synchronize_session": False})
+                for event_id, attempts, error in failed:
+                    db.execute(
+                        update(OutboxEvent)
+                        .where(OutboxEvent.id == event_id)
+                        .values(attempts=attempts, available_at=settled_at + backoff(attempts), last_error=error),
+                        execution_options={"synchronize_session": False},
+                    )
+                db.commit()
+        # Counted once settled: a crash before this point means redelivery, not loss
+        self.delivered += len(delivered)
+        for event_id, attempts, error in failed:
+            self.failed += 1
+            if attempts >= self.max_attempts:
+                # Left in the table for inspection, never picked up again
+                self.dead += 1
+                logger.error("outbox_event_dead", extra={"event_id": event_id, "error": error})
+            else:
+                logger.warning("outbox_delivery_failed", extra={"event_id": event_id, "attempts": attempts, "error": error})
+        return len(claimed)
+
+    def drain(self):
+        # Dispatch until nothing is due
+        while self.dispatch_batch() == self.batch_size:
+            pass
+
+    def run(self):
+        while not self._stopping.is_set():
+            try:
+                if self.dispatch_batch() == self.batch_size:
+                    continue
+            except Exception:
+                logger.exception("outbox_dispatch_error")
+            # Idle until the next poll, or until a registration commits an event
+            self._wake.wait(self.poll_seconds)
+            self._wake.clear()
+
+    def notify(self):
+        self._wake.set()
+
+    def start(self):
+        self._thread = threading.Thread(target=self.run, name="outbox-dispatcher", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=10):
+        self._stopping.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def stats(self):
+        return {"delivered": self.delivered, "failed": self.failed, "dead": self.dead}
+
+
+dispatcher = None
+sink = None
+
+
+def start_dispatcher():
+    global dispatcher, sink
+    if OUTBOX_ENABLED and OUTBOX_DISPATCHER == "app" and dispatcher is None:
+        sink = build_sink()
+        dispatcher = OutboxDispatcher(sink)
+        dispatcher.start()
+
+
+def stop_dispatcher():
+    global dispatcher
+    if dispatcher is not None:
+        dispatcher.stop()
+        dispatcher = None
+
+
+def notify_dispatcher():
+    # Called after a commit that added events: delivery starts now instead of at the next poll
+    if dispatcher is not None:
+        dispatcher.notify()
+
+
+def outbox_stats():
+    return dispatcher.stats() if dispatcher is not None else {}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--once", action="store_true", help="Drain the events that are due, then exit")
+    args = parser.parse_args()
+
+    configure_logging()
+    init_engines()
+    runner = OutboxDispatcher(build_sink())
+    if args.once:
+        runner.drain()
+    else:
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            signal.signal(signum, lambda *_: runner.stop(timeout=0))
+        runner.run()
+    logger.info("outbox_dispatcher_stopped", extra=runner.stats())
+
+
+if __name__ == "__main__":
+    main()
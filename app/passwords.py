@@ -0,0 +1,109 @@
+import asyncio
+import base64
+import hashlib
+import hmac
+import multiprocessing
+import os
+import secrets
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+# scrypt cost parameters, changing them makes existing hashes get rehashed on the next login
+SCRYPT_N = int(os.getenv("PASSWORD_SCRYPT_N", str(2 ** 14)))
+SCRYPT_R = int(os.getenv("PASSWORD_SCRYPT_R", "8"))
+SCRYPT_P = int(os.getenv("PASSWORD_SCRYPT_P", "1"))
+SALT_BYTES = 16
+KEY_BYTES = 32
+
+# Hashing runs in a bounded process pool so it never holds the event loop or the GIL of the
+# request workers. 0 hashes inline in the calling thread.
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", str(min(4, os.cpu_count() or 1))))
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _b64(raw: bytes):
+    return base64.b64encode(raw).decode("ascii")
+
+
+def _scrypt(password: str, salt: bytes, n: int, r: int, p: int):
+    return hashlib.scrypt(password.encode(), salt=salt, n=n, r=r, p=p, maxmem=256 * n * r + 2 ** 20, dklen=KEY_BYTES)
+
+
+def _hash(password: str, n: int, r: int, p: int):
+    salt = secrets.token_bytes(SALT_BYTES)
+    return f"scrypt${n}${r}${p}${_b64(salt)}${_b64(_scrypt(password, salt, n, r, p))}"
+
+
+def _verify(password: str, stored: str):
+    # Returns (matches, needs_rehash). Values without the scrypt$ prefix are legacy plain text.
+    if not stored.startswith("scrypt$"):
+        return hmac.compare_digest(password.encode(), stored.encode()), True
+    _, n, r, p, salt, key = stored.split("$")
+    n, r, p = int(n), int(r), int(p)
+    matches = hmac.compare_digest(_scrypt(password, base64.b64decode(salt), n, r, p), base64.b64decode(key))
+    return matches, (n, r, p) != (SCRYPT_N, SCRYPT_R, SCRYPT_P)
+
+
+def get_executor():
+    global _executor
+    if PASSWORD_HASH_WORKERS <= 0:
+        return None
+    with _executor_lock:
+        if _executor is None:
+            # spawn: forking a process that already runs threads (uvicorn, the DB pool) is unsafe
+            _executor = ProcessPoolExecutor(
+                max_workers=PASSWORD_HASH_WORKERS, mp_context=multiprocessing.get_context("spawn")
+            )
+        return _executor
+
+
+def start_executor():
+    # Spawn every worker up front so the first logins don't pay for process start-up
+    executor = get_executor()
+    if executor is not None:
+        for future in [executor.submit(abs, 0) for _ in range(PASSWORD_HASH_WORKERS)]:
+            future.result()
+
+
+def shutdown_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown()
+            _executor = None
+
+
+def hash_password(password: str):
+    executor = get_executor()
+    if executor is None:
+        return _hash(password, SCRYPT_N, SCRYPT_R, SCRYPT_P)
+    return executor.submit(_hash, password, SCRYPT_N, SCRYPT_R, SCRYPT_P).result()
+
+
+def hash_passwords(passwords):
+    # Spread a batch (bulk registration) over every worker
+    executor = get_executor()
+    count = len(passwords)
+    args = (passwords, [SCRYPT_N] * count, [SCRYPT_R] * count, [SCRYPT_P] * count)
+    if executor is None:
+        return list(map(_hash, *args))
+    return list(executor.map(_hash, *args, chunksize=max(1, count // (PASSWORD_HASH_WORKERS * 4))))
+
+
+def verify_password(password: str, stored: str):
+    executor = get_executor()
+    if executor is None:
+        return _verify(password, stored)
+    return executor.submit(_verify, password, stored).result()
+
+
+async def hash_password_async(password: str):
+    executor = get_executor()
+    return await asyncio.get_running_loop().run_in_executor(executor, _hash, password, SCRYPT_N, SCRYPT_R, SCRYPT_P)
+
+
+async def verify_password_async(password: str, stored: str):
+    executor = get_executor()
+    return await asyncio.get_running_loop().run_in_executor(executor, _verify, password, stored)
@@ -0,0 +1,87 @@
+import threading
+import time
+
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+
+
+class PoolMetrics:
+    # Checkout wait counters of one pool class (the sync and async engines each have their own)
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.checkouts = 0
+        self.checkout_timeouts = 0
+        self.wait_seconds_total = 0.0
+        self.wait_seconds_max = 0.0
+
+    def record_wait(self, seconds: float, timed_out: bool = False):
+        with self._lock:
+            self.checkouts += 1
+            self.wait_seconds_total += seconds
+            self.wait_seconds_max = max(self.wait_seconds_max, seconds)
+            if timed_out:
+                self.checkout_timeouts += 1
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "checkouts": self.checkouts,
+                "checkout_timeouts": self.checkout_timeouts,
+                "checkout_wait_seconds_total": self.wait_seconds_total,
+                "checkout_wait_seconds_max": self.wait_seconds_max,
+            }
+
+
+class TimedPoolMixin:
+    # Times how long a checkout waits for a free connection (queue wait plus connect for new ones)
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except Exception:
+            self.metrics.record_wait(time.perf_counter() - started, timed_out=True)
+            raise
+        self.metrics.record_wait(time.perf_counter() - started)
+        return connection
+
+
+class TimedQueuePool(TimedPoolMixin, QueuePool):
+    metrics = PoolMetrics()
+
+
+class TimedAsyncAdaptedQueuePool(TimedPoolMixin, AsyncAdaptedQueuePool):
+    metrics = PoolMetrics()
+
+
+def separately_timed(poolclass):
+    # Subclass with counters of its own, for the pools of another server (a read replica) so their
+    # waits and timeouts don't mix with the primary's, which the readiness probe relies on
+    return type(poolclass.__name__, (poolclass,), {"metrics": PoolMetrics()})
+
+
+def pool_status(engine):
+    # Saturation gauges for an engine's pool, plus its checkout wait counters when it is timed
+    pool = engine.pool
+    status = {"pool_class": type(pool).__name__}
+    if isinstance(pool, QueuePool):
+        status.update({
+            "size": pool.size(),
+            "checked_in": pool.checkedin(),
+            "checked_out": pool.checkedout(),
+            "overflow": max(pool.overflow(), 0),
+        })
+    if isinstance(pool, TimedPoolMixin):
+        status.update(pool.metrics.snapshot())
+    return status
+
+
+def wait_for_checkins(engine, timeout: float):
+    # Shutdown: give connections still checked out (requests cut off by the graceful timeout, the
+    # outbox dispatcher's last batch) up to timeout seconds to come back before the pool is disposed.
+    # Returns how many were still out.
+    pool = engine.pool
+    if not isinstance(pool, QueuePool):
+        return 0
+    deadline = time.monotonic() + timeout
+    while pool.checkedout() and time.monotonic() < deadline:
+        time.sleep(0.05)
+    return pool.checkedout()
@@ -0,0 +1,84 @@
+"""Bulk user deletion (GDPR purges) in bounded batches.
+
+Every batch deletes at most --batch-size users with their detail rows, contact keys and search rows in its own
+short transaction, so locks are held briefly and replicas keep up; --pause sleeps between batches.
+
+Usage:
+    python -m app.purge --ids-file ids.txt
+    python -m app.purge --type SOCIAL_MEDIA --created-before 2020-01-01 --batch-size 5000 --pause 0.1
+"""
+import argparse
+import itertools
+import logging
+import time
+from datetime import datetime
+
+from sqlalchemy import select
+
+from .cache import user_cache
+from .database import SessionLocal, init_engines
+from .instrumentation import configure_logging
+from .models import RegistrationType, UserTable
+from .repository import PURGE_BATCH_SIZE, delete_users, filter_users
+
+logger = logging.getLogger(__name__)
+
+
+def purge_users(ids=None, reg_type=None, created_after=None, created_before=None, batch_size=PURGE_BATCH_SIZE, pause=0.0):
+    # Yields the ids deleted by each batch. With ids, batches are slices of the list; with filters,
+    # each batch deletes the lowest batch_size matching ids until a batch comes back short.
+    if ids is not None:
+        batches = (UserTable.id.in_(ids[start:start + batch_size]) for start in range(0, len(ids), batch_size))
+    else:
+        next_batch = filter_users(select(UserTable.id), reg_type, created_after, created_before)
+        next_batch = next_batch.order_by(UserTable.id).limit(batch_size)
+        batches = itertools.repeat(UserTable.id.in_(next_batch.scalar_subquery()))
+
+    for where in batches:
+        with SessionLocal() as db:
+            deleted = delete_users(db, where)
+            db.commit()
+        for user_id in deleted:
+            user_cache.invalidate(user_id)
+        if deleted:
+            yield deleted
+        if ids is None and len(deleted) < batch_size:
+            return
+        if pause:
+            time.sleep(pause)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--ids-file", help="File with one user id per line")
+    parser.add_argument("--type", choices=[reg_type.value for reg_type in RegistrationType])
+    parser.add_argument("--created-after", type=datetime.fromisoformat)
+    parser.add_argument("--created-before", type=datetime.fromisoformat)
+    parser.add_argument("--batch-size", type=int, default=PURGE_BATCH_SIZE)
+    parser.add_argument("--pause", type=float, default=0.0, help="Seconds to sleep between batches")
+    args = parser.parse_args()
+
+    filters = (args.type, args.created_after, args.created_before)
+    if (args.ids_file is None) == all(value is None for value in filters):
+        parser.error("give either --ids-file or at least one of --type, --created-after, --created-before")
+
+    ids = None
+    if args.ids_file:
+        with open(args.ids_file) as ids_file:
+            ids = [int(line) for line in ids_file if line.strip()]
+
+    configure_logging()
+    init_engines()
+    total = 0
+    started = time.perf_counter()
+    for deleted in purge_users(
+        ids, RegistrationType(args.type) if args.type else None, args.created_after, args.created_before,
+        args.batch_size, args.pause,
+    ):
+        total += len(deleted)
+        logger.info("purge_batch", extra={"deleted": len(deleted), "total": total})
+    logger.info("purge_done", extra={"deleted": total, "seconds": round(time.perf_counter() - started, 1)})
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,204 @@
+"""Read replicas for GET traffic.
+
+With DATABASE_REPLICA_URLS set, read routes open their session through get_read_db and their
+queries go to one of the replicas, round-robin over the healthy ones. Everything else stays on the
+primary:
+
+- write routes (get_db), and any flush or INSERT/UPDATE/DELETE even in a read session;
+- every read when no replica is healthy. A background thread pings each replica every
+  REPLICA_CHECK_INTERVAL seconds, and a disconnect seen by a query takes it out of rotation at once;
+- reads of a client that wrote in the last REPLICA_STICKY_SECONDS. A request that wrote answers
+  with a short-lived cookie, and requests carrying it read from the primary, so a client always
+  sees its own writes even when the replicas lag behind.
+
+GET /get_user caches only what it read from the primary, and a client inside its sticky window skips
+the cache.
+
+GET /replica_metrics/ reports statements per target, reads per replica, fallbacks and sticky reads.
+"""
+import contextvars
+import logging
+import os
+import threading
+import time
+from collections import Counter
+
+from sqlalchemy import event
+
+logger = logging.getLogger(__name__)
+
+REPLICA_CHECK_INTERVAL = float(os.getenv("REPLICA_CHECK_INTERVAL", "5"))
+# How long after a write the same client keeps reading from the primary; keep it above the usual replica lag
+REPLICA_STICKY_SECONDS = int(os.getenv("REPLICA_STICKY_SECONDS", "5"))
+REPLICA_STICKY_COOKIE = os.getenv("REPLICA_STICKY_COOKIE", "db_primary_until")
+
+
+class ReplicaTarget:
+    # One replica: the sync engine (sync routes and health pings) and, in async mode, its async engine
+    def __init__(self, label: str, engine, async_engine=None):
+        self.label = label
+        self.engine = engine
+        self.async_engine = async_engine
+        self.healthy = True
+        self.error = None
+
+    def engines(self):
+        return [self.engine] + ([self.async_engine.sync_engine] if self.async_engine is not None else [])
+
+
+class ReplicaSet:
+    def __init__(self, targets, check_interval: float = REPLICA_CHECK_INTERVAL):
+        self.targets = targets
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._next = 0
+        self._stopping = threading.Event()
+        self._thread = None
+        self.statements = Counter()  # target label -> statements executed
+        self.reads = Counter()  # replica label -> read sessions routed to it
+        self.fallback_reads = 0
+        self.sticky_reads = 0
+        for target in targets:
+            for engine in target.engines():
+                self.count_statements(engine, target.label)
+                event.listen(engine, "handle_error", lambda context, target=target: self._on_error(target, context))
+
+    def count_statements(self, engine, label: str):
+        # The primary's engines are counted too, under "primary"
+        def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            with self._lock:
+                self.statements[label] += 1
+
+        event.listen(engine, "after_cursor_execute", after_cursor_execute)
+
+    def _on_error(self, target, context):
+        if context.is_disconnect and target.healthy:
+            target.healthy = False
+            target.error = "disconnected"
+            logger.warning("replica_down", extra={"replica": target.label, "error": str(context.original_exception)})
+
+    def choose(self, sticky: bool = False):
+        # Replica for a read session, None to read from the primary
+        with self._lock:
+            if sticky:
+                self.sticky_reads += 1
+                return None
+            healthy = [target for target in self.targets if target.healthy]
+            if not healthy:
+                self.fallback_reads += 1
+                return None
+            target = healthy[self._next % len(healthy)]
+            self._next += 1
+            self.reads[target.label] += 1
+            return target
+
+    def check(self):
+        # Ping every replica with the dialect's liveness check, as the readiness probe does for the primary
+        for target in self.targets:
+            try:
+                with target.engine.connect() as connection:
+                    target.engine.dialect.do_ping(connection.connection.dbapi_connection)
+                error = None
+            except Exception as e:
+                error = f"{type(e).__name__}: {e}"
+            if error is None and not target.healthy:
+                logger.info("replica_up", extra={"replica": target.label})
+            elif error is not None and target.healthy:
+                logger.warning("replica_down", extra={"replica": target.label, "error": error})
+            target.healthy = error is None
+            target.error = error
+
+    def run(self):
+        while not self._stopping.wait(self.check_interval):
+            self.check()
+
+    def start(self):
+        self.check()
+        self._thread = threading.Thread(target=self.run, name="replica-health", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def stats(self):
+        with self._lock:
+            return {
+                "statements": dict(self.statements),
+                "replicas": {
+                    target.label: {"healthy": target.healthy, "error": target.error, "reads": self.reads[target.label]}
+                    for target in self.targets
+                },
+                "fallback_reads": self.fallback_reads,
+                "sticky_reads": self.sticky_reads,
+            }
+
+
+# Read-your-writes
+
+class RoutingState:
+    __slots__ = ("sticky", "wrote")
+
+    def __init__(self, sticky: bool = False):
+        self.sticky = sticky  # the client wrote recently: read from the primary
+        self.wrote = False  # this request sent a write to the primary
+
+
+# Set by the middleware; threadpool handlers and AsyncSession's greenlets see the same object
+current_routing_state = contextvars.ContextVar("current_routing_state", default=None)
+
+
+def mark_write():
+    state = current_routing_state.get()
+    if state is not None:
+        state.wrote = True
+
+
+def reads_from_primary():
+    state = current_routing_state.get()
+    return state is not None and state.sticky
+
+
+def sticky_until(cookie_header: str):
+    # Expiry of the sticky cookie in a Cookie header, 0 when absent or malformed
+    for part in cookie_header.split(";"):
+        name, _, value = part.strip().partition("=")
+        if name == REPLICA_STICKY_COOKIE:
+            try:
+                return int(value)
+            except ValueError:
+                return 0
+    return 0
+
+
+class ReplicaRoutingMiddleware:
+    # Plain ASGI middleware: reads the sticky cookie into the routing state, and sets it on the
+    # response of a request that wrote
+    def __init__(self, app, sticky_seconds: int = REPLICA_STICKY_SECONDS):
+        self.app = app
+        self.sticky_seconds = sticky_seconds
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        cookie_header = next((value.decode("latin-1") for name, value in scope["headers"] if name == b"cookie"), "")
+        state = RoutingState(sticky=bool(cookie_header) and sticky_until(cookie_header) > time.time())
+        token = current_routing_state.set(state)
+
+        async def send_with_cookie(message):
+            if message["type"] == "http.response.start" and state.wrote:
+                cookie = (
+                    f"{REPLICA_STICKY_COOKIE}={int(time.time()) + self.sticky_seconds}; "
+                    f"Max-Age={self.sticky_seconds}; Path=/; HttpOnly; SameSite=Lax"
+                )
+                message["headers"] = list(message.get("headers", [])) + [(b"set-cookie", cookie.encode())]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_cookie)
+        finally:
+            current_routing_state.reset(token)
@@ -0,0 +1,264 @@
+from functools import lru_cache
+
+from sqlalchemy import bindparam, delete, func, insert, select, update
+from sqlalchemy.orm import contains_eager, joinedload
+from sqlalchemy.orm.attributes import set_committed_value
+
+from .contacts import contact_key
+from .database import USER_STORAGE
+from .models import (
+    UserTable, SocialMediaData, PlatformRegistrationData, BasicSignupData, ContactKey, RegistrationType, User,
+    SocialMediaUser, PlatformRegistrationUser, BasicSignupUser, UserSearch,
+)
+from .replicas import mark_write
+
+# Writes go to the users table too in "dual" and "unified" mode, reads only come from it in "unified"
+DUAL_WRITE = USER_STORAGE in ("dual", "unified")
+READ_UNIFIED = USER_STORAGE == "unified"
+
+# Eager-load every detail relationship with LEFT OUTER JOINs: the user and its detail row
+# come back from a single SELECT and user.user_specific_data never lazy-loads
+USER_DATA_OPTIONS = (
+    joinedload(UserTable.social_media_data),
+    joinedload(UserTable.platform_registration_data),
+    joinedload(UserTable.basic_signup_data),
+)
+
+
+def user_with_data_query(user_id: int):
+    if READ_UNIFIED:
+        # One row holds everything, no join needed
+        return select(User).where(User.id == user_id)
+    return select(UserTable).options(*USER_DATA_OPTIONS).where(UserTable.id == user_id)
+
+
+def get_user_with_data(user_id: int, db):
+    return db.execute(user_with_data_query(user_id)).scalars().first()
+
+
+async def get_user_with_data_async(user_id: int, db):
+    return (await db.execute(user_with_data_query(user_id))).scalars().first()
+
+
+def login_query(email: str):
+    # The platform user of an email, looked up through its normalized contact key (unique index),
+    # so the address matches whatever case or spacing it was registered with
+    return (
+        select(UserTable)
+        .join(ContactKey, ContactKey.user_id == UserTable.id)
+        .join(UserTable.platform_registration_data)
+        .options(contains_eager(UserTable.platform_registration_data))
+        .where(ContactKey.key == contact_key("email", email), ContactKey.kind == "email")
+    )
+
+
+# Just the type and detail foreign keys, enough to target the detail row of an update.
+# Built once with a bind parameter: execute it with {"user_id": ...}
+USER_REF_QUERY = select(
+    UserTable.id,
+    UserTable.type,
+    UserTable.social_media_id,
+    UserTable.platform_registration_id,
+    UserTable.basic_signup_id,
+).where(UserTable.id == bindparam("user_id"))
+
+
+# For many users at once: one IN query per detail table instead of a three-way join. Written out
+# rather than selectinload, which splits its IN lists into chunks of 500 keys
+DETAIL_RELATIONSHIPS = (
+    ("social_media_data", SocialMediaData, "social_media_id"),
+    ("platform_registration_data", PlatformRegistrationData, "platform_registration_id"),
+    ("basic_signup_data", BasicSignupData, "basic_signup_id"),
+)
+
+
+def load_details(users, db):
+    # Fills every detail relationship of the users, so user_specific_data never lazy-loads
+    for relationship, model, foreign_key in DETAIL_RELATIONSHIPS:
+        detail_ids = {getattr(user, foreign_key) for user in users} - {None}
+        details = {}
+        if detail_ids:
+            details = {detail.id: detail for detail in db.execute(select(model).where(model.id.in_(detail_ids))).scalars()}
+        for user in users:
+            set_committed_value(user, relationship, details.get(getattr(user, foreign_key)))
+    return users
+
+
+def get_users_by_ids(user_ids, db):
+    # One query for UserTable plus at most one per detail table, keyed by user id
+    if READ_UNIFIED:
+        users = db.execute(select(User).where(User.id.in_(set(user_ids)))).scalars().all()
+    else:
+        users = load_details(db.execute(select(UserTable).where(UserTable.id.in_(set(user_ids)))).scalars().all(), db)
+    return {user.id: user for user in users}
+
+
+def filter_users(stmt, reg_type=None, created_after=None, created_before=None):
+    if reg_type is not None:
+        stmt = stmt.where(UserTable.type == reg_type)
+    if created_after is not None:
+        stmt = stmt.where(UserTable.created_at > created_after)
+    if created_before is not None:
+        stmt = stmt.where(UserTable.created_at < created_before)
+    return stmt
+
+
+def list_users(db, after_id: int = 0, limit: int = 100, reg_type=None, created_after=None):
+    # Keyset pagination on the primary key: each page is an index range scan, whatever the offset
+    stmt = select(UserTable).options(*USER_DATA_OPTIONS).where(UserTable.id > after_id)
+    stmt = filter_users(stmt, reg_type, created_after).order_by(UserTable.id).limit(limit)
+    return db.execute(stmt).scalars().all()
+
+
+# Flat export row: shared columns are coalesced across the three detail tables, password is never exported
+EXPORT_COLUMNS = (
+    "id", "type", "created_at", "first_name", "last_name", "mobile_number", "email", "company_name", "hashtag", "dob",
+)
+
+
+def export_users_query(reg_type=None, created_after=None):
+    stmt = (
+        select(
+            UserTable.id,
+            UserTable.type,
+            UserTable.created_at,
+            func.coalesce(SocialMediaData.first_name, PlatformRegistrationData.first_name, BasicSignupData.first_name).label("first_name"),
+            func.coalesce(SocialMediaData.last_name, PlatformRegistrationData.last_name, BasicSignupData.last_name).label("last_name"),
+            func.coalesce(SocialMediaData.mobile_number, BasicSignupData.mobile_number).label("mobile_number"),
+            PlatformRegistrationData.email,
+            PlatformRegistrationData.company_name,
+            SocialMediaData.hashtag,
+            BasicSignupData.dob,
+        )
+        .outerjoin(SocialMediaData, UserTable.social_media_id == SocialMediaData.id)
+        .outerjoin(PlatformRegistrationData, UserTable.platform_registration_id == PlatformRegistrationData.id)
+        .outerjoin(BasicSignupData, UserTable.basic_signup_id == BasicSignupData.id)
+    )
+    return filter_users(stmt, reg_type, created_after).order_by(UserTable.id)
+
+
+# Detail table of each UserTable foreign key. The foreign keys point from user_table to the detail
+# rows, so deleting a user has to remove its detail row (and contact key and search row) explicitly.
+DETAIL_FOREIGN_KEYS = (
+    (SocialMediaData, "social_media_id"),
+    (PlatformRegistrationData, "platform_registration_id"),
+    (BasicSignupData, "basic_signup_id"),
+)
+
+# Rows removed per transaction by purge_users: short transactions keep row locks and WAL bursts small
+PURGE_BATCH_SIZE = 1000
+
+
+def deleted_users_returning(where):
+    return (
+        delete(UserTable)
+        .where(where)
+        .returning(UserTable.id, *(getattr(UserTable, foreign_key) for _, foreign_key in DETAIL_FOREIGN_KEYS))
+    )
+
+
+def delete_users_cte(where):
+    # Postgres: one statement. The user rows are deleted in a data-modifying CTE that returns their
+    # detail keys, sibling CTEs delete the detail rows, contact keys and search rows, and the ids come back.
+    deleted_users = deleted_users_returning(where).cte("deleted_users")
+    stmt = select(deleted_users.c.id)
+    for model, foreign_key in DETAIL_FOREIGN_KEYS:
+        stmt = stmt.add_cte(
+            delete(model).where(model.id.in_(select(deleted_users.c[foreign_key]))).cte(f"deleted_{model.__tablename__}")
+        )
+    if DUAL_WRITE:
+        stmt = stmt.add_cte(delete(User.__table__).where(User.id.in_(select(deleted_users.c.id))).cte("deleted_users_unified"))
+    stmt = stmt.add_cte(
+        delete(UserSearch).where(UserSearch.user_id.in_(select(deleted_users.c.id))).cte("deleted_user_search")
+    )
+    return stmt.add_cte(
+        delete(ContactKey).where(ContactKey.user_id.in_(select(deleted_users.c.id))).cte("deleted_contact_keys")
+    )
+
+
+def dependent_deletes(rows):
+    # Dialects without data-modifying CTEs (SQLite): after DELETE ... RETURNING on user_table,
+    # one DELETE per table for the returned keys
+    statements = []
+    for model, foreign_key in DETAIL_FOREIGN_KEYS:
+        detail_ids = [getattr(row, foreign_key) for row in rows if getattr(row, foreign_key) is not None]
+        if detail_ids:
+            statements.append(delete(model).where(model.id.in_(detail_ids)))
+    if rows:
+        statements.append(delete(ContactKey).where(ContactKey.user_id.in_([row.id for row in rows])))
+        statements.append(delete(UserSearch).where(UserSearch.user_id.in_([row.id for row in rows])))
+        if DUAL_WRITE:
+            statements.append(delete(User.__table__).where(User.id.in_([row.id for row in rows])))
+    return statements
+
+
+# Core deletes: nothing is loaded in the session, so skip the ORM's in-session synchronization
+CORE_DELETE = {"synchronize_session": False}
+
+
+def uses_delete_cte(db):
+    # Data-modifying CTEs are Postgres only; tests switch this off to run the other path there too
+    return db.get_bind().dialect.name == "postgresql"
+
+
+def delete_users(db, where):
+    # Delete the matching users with their detail rows, contact keys and search rows, returns the deleted ids.
+    # The caller commits.
+    if uses_delete_cte(db):
+        # A SELECT as far as RoutingSession.get_bind can tell, so the write is marked here: the
+        # client then reads from the primary and no longer sees the users on a lagging replica
+        mark_write()
+        return db.execute(delete_users_cte(where)).scalars().all()
+    rows = db.execute(deleted_users_returning(where), execution_options=CORE_DELETE).all()
+    for statement in dependent_deletes(rows):
+        db.execute(statement, execution_options=CORE_DELETE)
+    return [row.id for row in rows]
+
+
+async def delete_users_async(db, where):
+    if uses_delete_cte(db):
+        mark_write()
+        return (await db.execute(delete_users_cte(where))).scalars().all()
+    rows = (await db.execute(deleted_users_returning(where), execution_options=CORE_DELETE)).all()
+    for statement in dependent_deletes(rows):
+        await db.execute(statement, execution_options=CORE_DELETE)
+    return [row.id for row in rows]
+
+
+# Single-table class of each registration type
+UNIFIED_MODELS = {
+    RegistrationType.SOCIAL_MEDIA: SocialMediaUser,
+    RegistrationType.PROJECT_MANAGEMENT: PlatformRegistrationUser,
+    RegistrationType.COMMON_SIGNUP: BasicSignupUser,
+}
+
+# Core INSERT into users, for single rows and executemany alike
+UNIFIED_INSERT = insert(User.__table__)
+
+
+def unified_row(user_id: int, reg_type, detail_id: int, values: dict, version: int = 1):
+    # users row of a new user, values holds the detail columns of its type
+    return {
+        "id": user_id,
+        "type": reg_type,
+        "detail_id": detail_id,
+        "version": version,
+        **{field: values.get(field) for field in UNIFIED_MODELS[reg_type].detail_fields},
+    }
+
+
+@lru_cache(maxsize=None)
+def unified_update_statement(fields: tuple):
+    users = User.__table__
+    return (
+        update(users)
+        .where(users.c.id == bindparam("user_id"))
+        .values({field: bindparam(f"new_{field}") for field in fields} | {"version": bindparam("new_version")})
+    )
+
+
+def unified_update(user_id: int, values: dict, version: int):
+    # Mirror of a detail row update: same values, and the version the detail row now has
+    params = {f"new_{field}": value for field, value in values.items()}
+    params.update(user_id=user_id, new_version=version)
+    return unified_update_statement(tuple(sorted(values))), params
@@ -0,0 +1,16 @@
+from fastapi.responses import JSONResponse
+
+try:
+    import orjson
+except ImportError:  # optional, JSONResponse's json.dumps is used without it
+    orjson = None
+
+
+class FastJSONResponse(JSONResponse):
+    # For content that is already plain JSON data (cached responses, idempotency replays): it goes
+    # straight to bytes, without the jsonable_encoder walk or a response model validation. Routes
+    # returning ORM data declare a response_model instead, which pydantic serializes itself.
+    def render(self, content) -> bytes:
+        if orjson is None:
+            return super().render(content)
+        return orjson.dumps(content)
@@ -1,26 +1,218 @@
-from fastapi import APIRouter, HTTPException, Depends
-from pydantic import ValidationError
+import csv
+import io
+import json
+import logging
+from datetime import date, datetime
+from fastapi import APIRouter, HTTPException, Depends, Header, Query, Request, Response
+from fastapi.responses import StreamingResponse
+from functools import lru_cache
+from sqlalchemy import bindparam, insert, update
 from sqlalchemy.orm import Session
-from typing import Union
+from typing import List, Optional, Union
 
-from .database import get_db
-from sqlalchemy.exc import SQLAlchemyError
+from .admission import admit_registration, limit_client
+from .cache import user_cache
+from .contacts import contact_key
+from .database import SessionLocal, get_db, get_read_db
+from .outbox import OUTBOX_ENABLED, notify_dispatcher, user_registered
+from .purge import purge_users
+from .replicas import reads_from_primary
+from .search import (
+    MAX_SEARCH_LENGTH, MIN_SEARCH_LENGTH, SEARCH_FIELDS, parse_search_cursor, search_cursor, search_entry, search_query,
+    search_row, search_text, search_update,
+)
+from .passwords import hash_password, hash_passwords, verify_password
+from .repository import (
+    DUAL_WRITE, EXPORT_COLUMNS, UNIFIED_INSERT, USER_REF_QUERY, delete_users, export_users_query, get_user_with_data,
+    get_users_by_ids, list_users, login_query, unified_row, unified_update,
+)
+from sqlalchemy.exc import IntegrityError, SQLAlchemyError
 from .models import (
-    UserTable, SocialMediaData, PlatformRegistrationData, BasicSignupData, RegistrationType
+    UserTable, SocialMediaData, PlatformRegistrationData, BasicSignupData, RegistrationType, ContactKey, OutboxEvent,
+    UserSearch,
 )
+from .responses import FastJSONResponse
+from .validation import errors_detail, field_error, validate_records
 from .schema import (
-    SocialMediaSignup, PlatformRegistration, BasicSignup, UserResponse
+    LoginRequest, PurgeRequest, SocialMediaSignup, PlatformRegistration, BasicSignup, RegistrationTypeEnum,
+    RegistrationDispatchError, UpdateValidationError, USER_DATA_MODELS, FoundUser, MissingUser, RegistrationResponse,
+    SearchPage, SearchResult, UserBatch, UserListItem, UserPage, UserResponse, parse_registration, parse_update
 )
 
 router = APIRouter()
+logger = logging.getLogger(__name__)
 
-# Helper function to create type-specific data
-def create_user_data(data: Union[SocialMediaSignup, PlatformRegistration, BasicSignup], reg_type: RegistrationType, db: Session):
-    print(reg_type, "reg_type")
+# Detail model, unique contact column and UserTable foreign key per registration type
+DETAIL_MODELS = {
+    RegistrationType.SOCIAL_MEDIA: (SocialMediaData, "mobile_number", "social_media_id"),
+    RegistrationType.PROJECT_MANAGEMENT: (PlatformRegistrationData, "email", "platform_registration_id"),
+    RegistrationType.COMMON_SIGNUP: (BasicSignupData, "mobile_number", "basic_signup_id"),
+}
+
+# Response model of each registration type's user_data, it leaves out the password and version
+# (the version is returned as the ETag instead)
+USER_DATA_RESPONSES = {RegistrationType(reg_type.value): model for reg_type, model in USER_DATA_MODELS.items()}
+
+# Max number of ids accepted by GET /users
+MAX_BATCH_IDS = 5000
+
+# Max number of users accepted by POST /add_users, larger imports are split by the client
+MAX_BULK_USERS = 1000
+
+# Max page size of the GET /users listing and rows fetched per round trip by the export
+MAX_PAGE_SIZE = 1000
+EXPORT_CHUNK_SIZE = 1000
+
+# Max number of ids accepted by POST /users/purge, larger purges go through python -m app.purge
+MAX_PURGE_IDS = 100000
+
+# Max page size of GET /users/search
+MAX_SEARCH_PAGE_SIZE = 100
+
+# Max number of keys bound into a single IN (...) uniqueness lookup
+UNIQUE_LOOKUP_CHUNK = 5000
+
+
+def user_data_response(reg_type: RegistrationType, user_data):
+    # Typed user_data of a detail row (ORM object, users row or plain dict), the password hash never leaves the server
+    return USER_DATA_RESPONSES[reg_type].model_validate(user_data)
+
+
+def user_response(user, user_data):
+    return UserResponse(
+        id=user.id, type=user.type.value, version=user_data.version, user_data=user_data_response(user.type, user_data)
+    )
+
+
+def cached_user_response(cached: dict):
+    # Cached responses are stored as JSON data already, they skip the response model
+    response = FastJSONResponse(cached)
+    # Entries cached before versions existed carry no ETag until they expire
+    if "version" in cached:
+        response.headers["ETag"] = user_etag(cached["version"])
+    return response
+
+
+def resolve_registration(data: dict, check_fields: bool = True):
+    # Determine the registration type and data schema, raises RegistrationDispatchError if nothing
+    # matches or the data is invalid
+    reg_type, valid_data = parse_registration(data, check_fields)
+    return RegistrationType(reg_type.value), valid_data
+
+
+# Unique constraints on the detail tables and the error reported when they are violated.
+# Postgres reports the constraint name, SQLite only reports "table.column".
+UNIQUE_CONSTRAINT_ERRORS = {
+    "uix_mobile_number_type": ("social_media_data.mobile_number", "User with this mobile number already exists"),
+    "uix_email_type": ("platform_registration_data.email", "User with this email already exists"),
+    "uix_basic_mobile_number_type": ("basic_signup_data.mobile_number", "User with this mobile number already exists"),
+}
+CONTACT_KEY_CONSTRAINT = ("uix_contact_key", "contact_keys.key")
+
+
+def duplicate_contact_detail(reg_type: RegistrationType):
+    _, unique_column, _ = DETAIL_MODELS[reg_type]
+    return f"User with this {unique_column.replace('_', ' ')} already exists"
+
+
+def unique_violation_detail(error: IntegrityError, reg_type: RegistrationType):
+    # Map an IntegrityError to the user-facing duplicate message, None if it is not a known unique violation
+    constraint_name = getattr(getattr(error.orig, "diag", None), "constraint_name", None)
+    message = str(error.orig)
+    if constraint_name == CONTACT_KEY_CONSTRAINT[0] or CONTACT_KEY_CONSTRAINT[1] in message:
+        return duplicate_contact_detail(reg_type)
+    for name, (column, detail) in UNIQUE_CONSTRAINT_ERRORS.items():
+        if constraint_name == name or column in message:
+            return detail
+    return None
+
+
+def registration_contact(valid_data, reg_type: RegistrationType):
+    # Normalized contact key of a signup, what uniqueness, rate limits and coalescing go by
+    _, unique_column, _ = DETAIL_MODELS[reg_type]
+    return contact_key(unique_column, getattr(valid_data, unique_column))
+
+
+def new_contact_key(valid_data, reg_type: RegistrationType):
+    _, unique_column, _ = DETAIL_MODELS[reg_type]
+    return ContactKey(key=registration_contact(valid_data, reg_type), kind=unique_column)
+
+
+def contact_key_update(user: UserTable, data: dict):
+    # UPDATE keeping the user's contact key in step with a changed mobile number or email, None if unchanged
+    _, unique_column, _ = DETAIL_MODELS[user.type]
+    if unique_column not in data:
+        return None
+    return (
+        update(ContactKey)
+        .where(ContactKey.user_id == user.id)
+        .values(key=contact_key(unique_column, data[unique_column]))
+    )
+
+
+def user_etag(version: int):
+    return f'"{version}"'
+
+
+def parse_if_match(if_match: Optional[str]):
+    # Expected detail version from an If-Match header, None when absent or "*"
+    if if_match is None or if_match.strip() == "*":
+        return None
+    try:
+        return int(if_match.strip().removeprefix("W/").strip('"'))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="If-Match must be an ETag returned by GET /get_user")
+
+
+def validate_update(user, data: dict):
+    # Fields of the update, checked against the partial model and the field checks
+    try:
+        values = parse_update(RegistrationTypeEnum(user.type.value), data)
+        if not values:
+            raise UpdateValidationError("No fields to update")
+        return values
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@lru_cache(maxsize=None)
+def detail_update_statement(reg_type: RegistrationType, fields: tuple, conditional: bool):
+    # Built once per (type, updated fields, If-Match) combination, a few dozen at most.
+    # Bind names are prefixed: SQLAlchemy reserves the column names for the SET clause
+    model, _, _ = DETAIL_MODELS[reg_type]
+    stmt = (
+        update(model)
+        .where(model.id == bindparam("detail_id"))
+        .values({field: bindparam(f"new_{field}") for field in fields} | {"version": model.version + 1})
+        .returning(model.version)
+        # Nothing of this row is loaded in the session, skip the ORM's in-session sync
+        .execution_options(synchronize_session=False)
+    )
+    if conditional:
+        stmt = stmt.where(model.version == bindparam("expected_version"))
+    return stmt
+
+
+def detail_update(user, values: dict, expected_version: Optional[int]):
+    # Single UPDATE ... RETURNING version on the user's detail row; with an expected version it only
+    # matches while nobody else has written in between. Returns the statement and its parameters.
+    _, _, foreign_key = DETAIL_MODELS[user.type]
+    stmt = detail_update_statement(user.type, tuple(sorted(values)), expected_version is not None)
+    params = {f"new_{field}": value for field, value in values.items()}
+    params.update(detail_id=getattr(user, foreign_key), expected_version=expected_version)
+    return stmt, params
+
+
+def update_not_applied(user, expected_version: Optional[int]):
+    # The detail UPDATE matched no row: a stale If-Match, or a user without detail data
+    if expected_version is not None:
+        return HTTPException(status_code=412, detail="User was modified since the given ETag, fetch it again")
+    return HTTPException(status_code=404, detail=f"No data found for user type {user.type}")
+
+
+# Helper function to build the type-specific row, shared by the sync and async routes
+def build_user_data(data: Union[SocialMediaSignup, PlatformRegistration, BasicSignup], reg_type: RegistrationType):
     if reg_type == RegistrationType.SOCIAL_MEDIA:
-        existing_user = db.query(SocialMediaData).filter(SocialMediaData.mobile_number == data.mobile_number).first()
-        if existing_user:
-            raise HTTPException(status_code=400, detail="User with this mobile number already exists")
         user_data = SocialMediaData(
             mobile_number=data.mobile_number,
             first_name=data.first_name,
@@ -28,9 +220,6 @@ def create_user_data(data: Union[SocialMediaSignup, PlatformRegistration, BasicS
             hashtag=data.hashtag,
         )
     elif reg_type == RegistrationType.PROJECT_MANAGEMENT:
-        existing_user = db.query(PlatformRegistrationData).filter(PlatformRegistrationData.email == data.email).first()
-        if existing_user:
-            raise HTTPException(status_code=400, detail="User with this email already exists")
         user_data = PlatformRegistrationData(
             first_name=data.first_name,
             last_name=data.last_name,
@@ -39,9 +228,6 @@ def create_user_data(data: Union[SocialMediaSignup, PlatformRegistration, BasicS
             company_name=data.company_name,
         )
     elif reg_type == RegistrationType.COMMON_SIGNUP:
-        existing_user = db.query(BasicSignupData).filter(BasicSignupData.mobile_number == data.mobile_number).first()
-        if existing_user:
-            raise HTTPException(status_code=400, detail="User with this mobile number already exists")
         user_data = BasicSignupData(
             mobile_number=data.mobile_number,
             first_name=data.first_name,
@@ -50,205 +236,551 @@ def create_user_data(data: Union[SocialMediaSignup, PlatformRegistration, BasicS
         )
     else:
         raise HTTPException(status_code=400, detail=f'Invalid registration type or data is not correct')
-    
-    # Add the user data to the session
+    return user_data
+
+
+# Helper function to create type-specific data
+def create_user_data(data: Union[SocialMediaSignup, PlatformRegistration, BasicSignup], reg_type: RegistrationType, db: Session):
+    user_data = build_user_data(data, reg_type)
+
+    # Flush only: the INSERT ... RETURNING fills in the id, the caller owns the commit
     db.add(user_data)
-    db.commit()  # Commit the data to make it persistent
-    db.refresh(user_data)  # Refresh the object to get the id
-    
-    print(user_data.id, "user_specific_data_id")  # This should print the id after commit and refresh
-    
+    db.flush()
+
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("user_data_created", extra={"reg_type": reg_type.value, "user_specific_data_id": user_data.id})
+
     return user_data
 
-@router.post("/add_user/")
-def register_user(data: dict, db: Session = Depends(get_db)):
-    reg_type = None
-    valid_data = None
-    user_entry = None
-    user_specific_data = None
+@router.post("/add_user/", response_model=RegistrationResponse)
+def register_user(
+    data: dict,
+    request: Request,
+    idempotency_key: Optional[str] = Header(None),
+    db: Session = Depends(get_db),
+):
+    limit_client(request)
 
     # Determine the registration type and data schema
     try:
-        valid_data = SocialMediaSignup(**data)
-        reg_type = RegistrationType.SOCIAL_MEDIA
-    except ValidationError:
-        pass
+        reg_type, valid_data = resolve_registration(data)
+    except RegistrationDispatchError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
-    if not reg_type:
-        try:
-            valid_data = PlatformRegistration(**data)
-            reg_type = RegistrationType.PROJECT_MANAGEMENT
-        except ValidationError:
-            pass
+    contact = registration_contact(valid_data, reg_type)
+    # Replayed for a known Idempotency-Key, shared with an identical signup already running
+    return admit_registration(idempotency_key, data, contact, lambda: create_registration(reg_type, valid_data, db))
 
-    if not reg_type:
-        try:
-            valid_data = BasicSignup(**data)
-            reg_type = RegistrationType.COMMON_SIGNUP
-        except ValidationError:
-            pass
 
-    if not reg_type:
-        raise HTTPException(status_code=400, detail="Invalid registration type")
+def create_registration(reg_type: RegistrationType, valid_data, db: Session):
+    if reg_type == RegistrationType.PROJECT_MANAGEMENT:
+        valid_data = valid_data.model_copy(update={"password": hash_password(valid_data.password)})
 
+    _, _, foreign_key = DETAIL_MODELS[reg_type]
     try:
-        # Create the UserTable entry
-        user_entry = UserTable(type=reg_type)
+        # Detail row and UserTable row are written in one transaction, uniqueness is enforced
+        # by the database constraints instead of a SELECT beforehand
+        user_specific_data = create_user_data(valid_data, reg_type, db)
+        user_entry = UserTable(
+            type=reg_type,
+            contact_key=new_contact_key(valid_data, reg_type),
+            search_entry=search_entry(reg_type, valid_data.model_dump()),
+            **{foreign_key: user_specific_data.id},
+        )
         db.add(user_entry)
-        db.commit()  # Commit the UserTable entry
-        
-        # Create the user-specific data entry based on the registration type
-        try:
-            user_specific_data = create_user_data(valid_data, reg_type, db)
-            print(user_specific_data, "user_specific_data")
-            print(user_specific_data.id, "user_specific_data_id")
-        except Exception as e:
-            # Rollback user table creation and raise the exception
-            db.delete(user_entry)  # Delete the user entry if user-specific data creation fails
-            db.commit()  # Commit the deletion
-            raise HTTPException(status_code=400, detail=f"Error creating specific data: {e}")
-
-        # Set the correct foreign key based on the registration type
-        if reg_type == RegistrationType.SOCIAL_MEDIA:
-            user_entry.social_media_id = user_specific_data.id
-        elif reg_type == RegistrationType.PROJECT_MANAGEMENT:
-            user_entry.platform_registration_id = user_specific_data.id
-        elif reg_type == RegistrationType.COMMON_SIGNUP:
-            user_entry.basic_signup_id = user_specific_data.id
-
-        # Commit the changes after both UserTable and user-specific data are created
+        db.flush()
+        if DUAL_WRITE:
+            db.execute(UNIFIED_INSERT, unified_row(user_entry.id, reg_type, user_specific_data.id, valid_data.model_dump()))
+        if OUTBOX_ENABLED:
+            # Side effects are queued in this transaction and delivered by the outbox dispatcher
+            db.add(OutboxEvent(**user_registered(user_entry.id, reg_type, user_data_response(reg_type, user_specific_data))))
+        db.commit()
+    except IntegrityError as e:
+        db.rollback()
+        detail = unique_violation_detail(e, reg_type)
+        if detail:
+            raise HTTPException(status_code=400, detail=detail)
+        raise HTTPException(status_code=400, detail=f"Error creating user entry: {e}")
+    except SQLAlchemyError as e:
+        db.rollback()
+        raise HTTPException(status_code=400, detail=f"Error creating user entry: {e}")
+
+    if OUTBOX_ENABLED:
+        notify_dispatcher()
+
+    # Prepare and return the response
+    return RegistrationResponse(
+        id=user_entry.id, type=reg_type.value, user_data=user_data_response(reg_type, user_specific_data)
+    )
+
+
+@router.post("/login/")
+def login(data: LoginRequest, db: Session = Depends(get_db)):
+    user = db.execute(login_query(data.email)).scalars().first()
+    if not user:
+        raise HTTPException(status_code=401, detail="Invalid email or password")
+
+    user_data = user.platform_registration_data
+
+    matches, needs_rehash = verify_password(data.password, user_data.password)
+    if not matches:
+        raise HTTPException(status_code=401, detail="Invalid email or password")
+
+    # Upgrade hashes made with older cost parameters (or legacy plain text) while we have the password
+    if needs_rehash:
+        user_data.password = hash_password(data.password)
+        if DUAL_WRITE:
+            db.execute(*unified_update(user.id, {"password": user_data.password}, user_data.version))
         db.commit()
-        db.refresh(user_entry)
-        db.refresh(user_specific_data)
 
+    return {"id": user.id, "type": user.type}
+
+
+def find_existing_keys(model, column: str, keys, db: Session):
+    # One set-based lookup per chunk instead of a .first() per row
+    existing = set()
+    keys = list(keys)
+    for start in range(0, len(keys), UNIQUE_LOOKUP_CHUNK):
+        chunk = keys[start:start + UNIQUE_LOOKUP_CHUNK]
+        rows = db.query(getattr(model, column)).filter(getattr(model, column).in_(chunk)).all()
+        existing.update(row[0] for row in rows)
+    return existing
+
+
+def bulk_error(index: int, detail: str, errors):
+    # Result of a rejected row: the one-line detail and the per-field errors
+    return {"index": index, "status": "error", "detail": detail, "errors": errors}
+
+
+def reject_existing(pending, existing, results):
+    # Rows whose contact key is already registered get a duplicate error, the others are kept
+    kept = {}
+    for reg_type, rows in pending.items():
+        _, unique_column, _ = DETAIL_MODELS[reg_type]
+        kept[reg_type] = []
+        for index, row, key in rows:
+            if key in existing:
+                detail = duplicate_contact_detail(reg_type)
+                results[index] = bulk_error(index, detail, [field_error(unique_column, detail)])
+            else:
+                kept[reg_type].append((index, row, key))
+    return kept
+
+
+def insert_bulk_rows(pending, db: Session):
+    # Multi-row INSERT ... RETURNING per table, ids come back in parameter order. Returns
+    # (index, user id, type) of every row; the caller commits.
+    created = []
+    for reg_type, rows in pending.items():
+        if not rows:
+            continue
+        model, unique_column, foreign_key = DETAIL_MODELS[reg_type]
+        detail_ids = db.execute(
+            insert(model).returning(model.id, sort_by_parameter_order=True),
+            [row for _, row, _ in rows],
+        ).scalars().all()
+        user_ids = db.execute(
+            insert(UserTable).returning(UserTable.id, sort_by_parameter_order=True),
+            [{"type": reg_type, foreign_key: detail_id} for detail_id in detail_ids],
+        ).scalars().all()
+        db.execute(
+            insert(ContactKey),
+            [{"key": key, "kind": unique_column, "user_id": user_id} for (_, _, key), user_id in zip(rows, user_ids)],
+        )
+        db.execute(
+            insert(UserSearch),
+            [search_row(user_id, reg_type, row) for (_, row, _), user_id in zip(rows, user_ids)],
+        )
+        if DUAL_WRITE:
+            db.execute(
+                UNIFIED_INSERT,
+                [
+                    unified_row(user_id, reg_type, detail_id, row)
+                    for (_, row, _), user_id, detail_id in zip(rows, user_ids, detail_ids)
+                ],
+            )
+        if OUTBOX_ENABLED:
+            db.execute(
+                insert(OutboxEvent),
+                [
+                    user_registered(user_id, reg_type, user_data_response(reg_type, {**row, "id": detail_id}))
+                    for (_, row, _), user_id, detail_id in zip(rows, user_ids, detail_ids)
+                ],
+            )
+        created += [(index, user_id, reg_type) for (index, _, _), user_id in zip(rows, user_ids)]
+    return created
+
+
+@router.post("/add_users/")
+def register_users_bulk(data: List[dict], db: Session = Depends(get_db)):
+    if len(data) > MAX_BULK_USERS:
+        raise HTTPException(status_code=413, detail=f"At most {MAX_BULK_USERS} users can be registered at once")
+    results = [None] * len(data)
+    pending = {reg_type: [] for reg_type in DETAIL_MODELS}
+
+    # Classify every row, the field checks then run a column at a time over each type's rows
+    parsed = {reg_type: [] for reg_type in DETAIL_MODELS}
+    for index, item in enumerate(data):
+        try:
+            reg_type, valid_data = resolve_registration(item, check_fields=False)
+        except RegistrationDispatchError as e:
+            results[index] = bulk_error(index, str(e), e.errors)
+            continue
+        parsed[reg_type].append((index, valid_data.model_dump()))
+
+    valid = []
+    for reg_type, rows in parsed.items():
+        invalid = validate_records([row for _, row in rows])
+        for position, (index, row) in enumerate(rows):
+            errors = invalid.get(position)
+            if errors:
+                results[index] = bulk_error(index, f"Invalid {reg_type.value} registration: {errors_detail(errors)}", errors)
+            else:
+                valid.append((index, reg_type, row))
+
+    # Drop duplicates inside the batch itself, the first row of a contact wins
+    seen = set()
+    for index, reg_type, row in sorted(valid, key=lambda entry: entry[0]):
+        _, unique_column, _ = DETAIL_MODELS[reg_type]
+        key = contact_key(unique_column, row[unique_column])
+        if key in seen:
+            detail = f"Duplicate {unique_column} in request"
+            results[index] = bulk_error(index, detail, [field_error(unique_column, detail)])
+            continue
+        seen.add(key)
+        pending[reg_type].append((index, row, key))
 
+    try:
+        # One set-based lookup over the contact keys of every registration type. It only reads, so
+        # its transaction ends here: the write transaction below spans the INSERTs and nothing else.
+        existing = find_existing_keys(ContactKey, "key", seen, db)
+        db.commit()
     except SQLAlchemyError as e:
-        # Rollback and delete the user entry if something goes wrong
-        if user_entry:
-            db.delete(user_entry)  # Delete the user entry if there was an error
+        db.rollback()
+        raise HTTPException(status_code=400, detail=f"Error creating users: {e}")
+    pending = reject_existing(pending, existing, results)
+
+    # Hash the whole batch across the password workers, before the write transaction opens
+    password_rows = pending[RegistrationType.PROJECT_MANAGEMENT]
+    if password_rows:
+        password_hashes = hash_passwords([row["password"] for _, row, _ in password_rows])
+        for (_, row, _), password_hash in zip(password_rows, password_hashes):
+            row["password"] = password_hash
+
+    while True:
+        try:
+            created = insert_bulk_rows(pending, db)
+            # Every table is written in the same transaction
             db.commit()
-        raise HTTPException(status_code=400, detail=f"Error creating user entry: {e}")
+            break
+        except IntegrityError as e:
+            db.rollback()
+            # A concurrent registration took some of the contacts since the lookup: those rows are
+            # rejected as duplicates and the rest retried. Every round drops at least one row.
+            try:
+                taken = find_existing_keys(ContactKey, "key", [key for rows in pending.values() for _, _, key in rows], db)
+                db.commit()
+            except SQLAlchemyError:
+                db.rollback()
+                taken = set()
+            if not taken:
+                raise HTTPException(status_code=400, detail=f"Error creating users: {e}")
+            pending = reject_existing(pending, taken, results)
+        except SQLAlchemyError as e:
+            db.rollback()
+            raise HTTPException(status_code=400, detail=f"Error creating users: {e}")
 
-    # Prepare and return the response
-    response = {
-        "id": user_entry.id,
-        "type": user_entry.type,
-        "user_data": user_specific_data
+    for index, user_id, reg_type in created:
+        results[index] = {"index": index, "status": "created", "id": user_id, "type": reg_type}
+
+    if OUTBOX_ENABLED:
+        notify_dispatcher()
+
+    return {
+        "created": sum(1 for result in results if result["status"] == "created"),
+        "failed": sum(1 for result in results if result["status"] == "error"),
+        "results": results,
     }
-    return response
+
+
+@router.get("/contacts/exists/")
+def contact_exists(mobile_number: Optional[str] = None, email: Optional[str] = None, db: Session = Depends(get_read_db)):
+    # Single unique-index lookup across every registration type
+    if (mobile_number is None) == (email is None):
+        raise HTTPException(status_code=400, detail="Provide exactly one of mobile_number or email")
+    kind, value = ("mobile_number", mobile_number) if mobile_number is not None else ("email", email)
+    key = contact_key(kind, value)
+    user_id = db.query(ContactKey.user_id).filter(ContactKey.key == key).scalar()
+    return {"key": key, "exists": user_id is not None, "user_id": user_id}
 
 
 @router.put("/update_user/{user_id}/")
-def update_user(user_id: int, data: dict, db: Session = Depends(get_db)):
+def update_user(
+    user_id: int,
+    data: dict,
+    response: Response,
+    if_match: Optional[str] = Header(None),
+    db: Session = Depends(get_db),
+):
+    expected_version = parse_if_match(if_match)
+
+    # Only the type and detail key are needed to target the row
+    user = db.execute(USER_REF_QUERY, {"user_id": user_id}).first()
+    if not user:
+        raise HTTPException(status_code=404, detail="User not found")
+
+    values = validate_update(user, data)
+    if "password" in values:
+        values["password"] = hash_password(values["password"])
+
     try:
-    # Retrieve user record
-        user = db.query(UserTable).filter(UserTable.id == user_id).first()
-        if not user:
-            raise HTTPException(status_code=404, detail="User not found")
-        
-        # Define allowed fields for each registration type
-        allowed_fields_by_type = {
-            RegistrationType.SOCIAL_MEDIA: {"first_name", "last_name", "mobile_number", "hashtag"},
-            RegistrationType.PROJECT_MANAGEMENT: {"first_name", "last_name", "email", "password", "company_name"},
-            RegistrationType.COMMON_SIGNUP: {"first_name", "last_name", "mobile_number", "dob"}
-        }
-        
-        # Get allowed fields for the current user type
-        allowed_fields = allowed_fields_by_type.get(user.type, set())
-        
-        # Identify any extra fields in the request that are not allowed for the user type
-        extra_fields = [key for key in data.keys() if key not in allowed_fields]
-        if extra_fields:
-            raise HTTPException(
-                status_code=400,
-                detail=f"Invalid fields provided: {extra_fields}. Allowed fields: {list(allowed_fields)}"
-            )
-        
-        # Fetch type-specific data
-        if user.type == RegistrationType.SOCIAL_MEDIA:
-            user_data = db.query(SocialMediaData).filter(SocialMediaData.id == user.social_media_id).first()
-        elif user.type == RegistrationType.PROJECT_MANAGEMENT:
-            user_data = db.query(PlatformRegistrationData).filter(PlatformRegistrationData.id == user.platform_registration_id).first()
-        elif user.type == RegistrationType.COMMON_SIGNUP:
-            user_data = db.query(BasicSignupData).filter(BasicSignupData.id == user.basic_signup_id).first()
-        else:
-            raise HTTPException(status_code=400, detail="Unsupported registration type")
-        
-        if not user_data:
-            raise HTTPException(status_code=404, detail=f"No data found for user type {user.type}")
-        
-        # Update the fields in the user_data model
-        for key, value in data.items():
-            if hasattr(user_data, key):
-                setattr(user_data, key, value)
-        
-        # Commit the changes and refresh the user data
+        version = db.execute(*detail_update(user, values, expected_version)).scalar()
+        if version is None:
+            db.rollback()
+            raise update_not_applied(user, expected_version)
+
+        contact_update = contact_key_update(user, values)
+        if contact_update is not None:
+            db.execute(contact_update)
+        search_entry_update = search_update(user.id, values)
+        if search_entry_update is not None:
+            db.execute(search_entry_update)
+        if DUAL_WRITE:
+            db.execute(*unified_update(user.id, values, version))
         db.commit()
-        db.refresh(user_data)
-        
-        return {"message": "User updated successfully"}
-    except Exception as e:
+    except IntegrityError as e:
+        db.rollback()
+        detail = unique_violation_detail(e, user.type)
+        raise HTTPException(status_code=400, detail=detail or f"Error updating user: {e}")
+    except SQLAlchemyError as e:
+        db.rollback()
         raise HTTPException(status_code=400, detail=f"Error updating user: {e}")
 
+    user_cache.invalidate(user_id)
+
+    response.headers["ETag"] = user_etag(version)
+    return {"message": "User updated successfully", "version": version}
+
 @router.delete("/delete_user/{user_id}/")
 def delete_user(user_id: int, db: Session = Depends(get_db)):
     try:
-        # Retrieve the user record
-        user = db.query(UserTable).filter(UserTable.id == user_id).first()
-        if not user:
+        # User, detail row, contact key and search row in one statement on Postgres, nothing is loaded first
+        deleted = delete_users(db, UserTable.id == user_id)
+        if not deleted:
+            db.rollback()
             raise HTTPException(status_code=404, detail="User not found")
-        
-        # Delete type-specific data first
-        if user.type == RegistrationType.SOCIAL_MEDIA:
-            user_data = db.query(SocialMediaData).filter(SocialMediaData.id == user.social_media_id).first()
-        elif user.type == RegistrationType.PROJECT_MANAGEMENT:
-            user_data = db.query(PlatformRegistrationData).filter(PlatformRegistrationData.id == user.platform_registration_id).first()
-        elif user.type == RegistrationType.COMMON_SIGNUP:
-            user_data = db.query(BasicSignupData).filter(BasicSignupData.id == user.basic_signup_id).first()
-        else:
-            raise HTTPException(status_code=400, detail="Unsupported registration type")
-        
-        # Delete the type-specific data
-        if user_data:
-            db.delete(user_data)
-        
-        # Delete the main user entry
-        db.delete(user)
         db.commit()
-        
-        return {"message": f"User with ID {user_id} has been deleted successfully"}
-    except Exception as e:
+    except SQLAlchemyError as e:
+        db.rollback()
         raise HTTPException(status_code=400, detail=f"Error deleting user: {e}")
 
-@router.get("/get_user/{user_id}/")
-def get_user(user_id: int, db: Session = Depends(get_db)):
+    user_cache.invalidate(user_id)
+
+    return {"message": f"User with ID {user_id} has been deleted successfully"}
+
+@router.get("/get_user/{user_id}/", response_model=UserResponse)
+def get_user(user_id: int, response: Response, db: Session = Depends(get_read_db)):
+    # A client that just wrote reads the primary: the cache may still hold what it overwrote
+    if not reads_from_primary():
+        cached = user_cache.get(user_id)
+        if cached is not None:
+            return cached_user_response(cached)
+    # Taken before the read so an update committed meanwhile invalidates this fill
+    cache_token = user_cache.read_token(user_id)
+
     try:
-        # Retrieve the user record
-        user = db.query(UserTable).filter(UserTable.id == user_id).first()
+        # Retrieve the user and its type-specific data in one query
+        user = get_user_with_data(user_id, db)
         if not user:
             raise HTTPException(status_code=404, detail="User not found")
         
-        # Fetch type-specific data based on the user type
-        if user.type == RegistrationType.SOCIAL_MEDIA:
-            user_data = db.query(SocialMediaData).filter(SocialMediaData.id == user.social_media_id).first()
-        elif user.type == RegistrationType.PROJECT_MANAGEMENT:
-            user_data = db.query(PlatformRegistrationData).filter(PlatformRegistrationData.id == user.platform_registration_id).first()
-        elif user.type == RegistrationType.COMMON_SIGNUP:
-            user_data = db.query(BasicSignupData).filter(BasicSignupData.id == user.basic_signup_id).first()
-        else:
-            raise HTTPException(status_code=400, detail="Unsupported registration type")
+        user_data = user.user_specific_data
         
         # If no user data is found, raise an error
         if not user_data:
             raise HTTPException(status_code=404, detail=f"No data found for user type {user.type}")
         
         # Prepare the response with the user and user-specific data
-        response = {
-            "id": user.id,
-            "type": user.type,
-            "user_data": user_data
-        }
-        
-        return response
+        result = user_response(user, user_data)
+        # Only primary reads fill the cache, a replica's may predate a write and be served to everyone
+        if db.info.get("replica") is None:
+            user_cache.set(user_id, result.model_dump(mode="json"), cache_token)
+
+        response.headers["ETag"] = user_etag(user_data.version)
+        return result
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"Error fetching user data: {e}")
+
+
+@router.get("/users/", response_model=Union[UserPage, UserBatch])
+def get_users(
+    ids: Optional[str] = Query(None, description="Comma-separated user ids, lists users when omitted"),
+    after_id: int = Query(0, ge=0, description="Keyset cursor: the next_cursor of the previous page"),
+    limit: int = Query(100, ge=1, le=MAX_PAGE_SIZE),
+    type: Optional[RegistrationTypeEnum] = None,
+    created_after: Optional[datetime] = None,
+    db: Session = Depends(get_read_db),
+):
+    if ids is None:
+        return list_users_page(after_id, limit, type, created_after, db)
+
+    try:
+        user_ids = [int(user_id) for user_id in ids.split(",") if user_id.strip()]
+    except ValueError:
+        raise HTTPException(status_code=400, detail="ids must be a comma-separated list of integers")
+    if len(user_ids) > MAX_BATCH_IDS:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_BATCH_IDS} ids can be fetched at once")
+
+    try:
+        users = get_users_by_ids(user_ids, db)
+    except SQLAlchemyError as e:
+        raise HTTPException(status_code=400, detail=f"Error fetching user data: {e}")
+
+    # Results follow the request order, unknown ids get an explicit marker
+    results = []
+    for user_id in user_ids:
+        user = users.get(user_id)
+        user_data = user.user_specific_data if user else None
+        if user_data is None:
+            results.append(MissingUser(id=user_id))
+        else:
+            results.append(FoundUser(id=user.id, type=user.type.value, user_data=user_data_response(user.type, user_data)))
+    return UserBatch(users=results)
+
+
+def list_users_page(after_id: int, limit: int, reg_type: Optional[RegistrationTypeEnum], created_after: Optional[datetime], db: Session):
+    try:
+        users = list_users(
+            db,
+            after_id=after_id,
+            limit=limit,
+            reg_type=RegistrationType(reg_type.value) if reg_type else None,
+            created_after=created_after,
+        )
+    except SQLAlchemyError as e:
+        raise HTTPException(status_code=400, detail=f"Error listing users: {e}")
+
+    results = [
+        UserListItem(
+            id=user.id,
+            type=user.type.value,
+            created_at=user.created_at,
+            user_data=user_data_response(user.type, user.user_specific_data),
+        )
+        for user in users
+    ]
+    # A full page means there may be more rows after the last id
+    next_cursor = users[-1].id if len(users) == limit else None
+    return UserPage(users=results, next_cursor=next_cursor)
+
+
+@router.get("/users/search/", response_model=SearchPage)
+def search_users(
+    q: str = Query(..., max_length=MAX_SEARCH_LENGTH, description="Part of a name or hashtag, or the start of an email"),
+    fields: Optional[str] = Query(None, description="Comma-separated subset of name, email, hashtag; all by default"),
+    type: Optional[RegistrationTypeEnum] = None,
+    cursor: Optional[str] = Query(None, description="Keyset cursor: the next_cursor of the previous page"),
+    limit: int = Query(20, ge=1, le=MAX_SEARCH_PAGE_SIZE),
+    db: Session = Depends(get_read_db),
+):
+    term = search_text(q)
+    if len(term) < MIN_SEARCH_LENGTH:
+        raise HTTPException(status_code=400, detail=f"q must have at least {MIN_SEARCH_LENGTH} characters")
+    search_fields = SEARCH_FIELDS if fields is None else tuple(field.strip() for field in fields.split(",") if field.strip())
+    if not search_fields or not set(search_fields) <= set(SEARCH_FIELDS):
+        raise HTTPException(status_code=400, detail=f"fields must be a comma-separated subset of {', '.join(SEARCH_FIELDS)}")
+    try:
+        after = parse_search_cursor(cursor)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="cursor must be a next_cursor returned by GET /users/search")
+
+    try:
+        # Ranked page of (user_id, type, rank) from the search indexes, then the user data of just that page
+        matches = db.execute(search_query(
+            term, search_fields, RegistrationType(type.value) if type else None, after, limit
+        )).all()
+        users = get_users_by_ids([match.user_id for match in matches], db)
+    except SQLAlchemyError as e:
+        raise HTTPException(status_code=400, detail=f"Error searching users: {e}")
+
+    results = []
+    for match in matches:
+        user = users.get(match.user_id)
+        user_data = user.user_specific_data if user else None
+        if user_data is not None:
+            results.append(SearchResult(
+                id=user.id, type=user.type.value, rank=match.rank, user_data=user_data_response(user.type, user_data)
+            ))
+    # A full page means there may be more matches after the last one
+    next_cursor = search_cursor(matches[-1].rank, matches[-1].user_id) if len(matches) == limit else None
+    return SearchPage(results=results, next_cursor=next_cursor)
+
+
+def export_value(value):
+    if isinstance(value, RegistrationType):
+        return value.value
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    return value
+
+
+def stream_users_export(export_format: str, reg_type: Optional[RegistrationType] = None, created_after: Optional[datetime] = None):
+    # Own session: the response body is produced after the request dependencies are gone.
+    # yield_per streams rows from a server-side cursor, so memory stays flat for any export size.
+    with SessionLocal(info={"replica_reads": True}) as db:
+        result = db.execute(
+            export_users_query(reg_type, created_after).execution_options(yield_per=EXPORT_CHUNK_SIZE)
+        )
+        if export_format == "csv":
+            buffer = io.StringIO()
+            writer = csv.writer(buffer)
+            writer.writerow(EXPORT_COLUMNS)
+            for rows in result.partitions():
+                writer.writerows([[export_value(value) for value in row] for row in rows])
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+            yield buffer.getvalue()
+        else:
+            for rows in result.partitions():
+                yield "".join(
+                    json.dumps(dict(zip(EXPORT_COLUMNS, map(export_value, row)))) + "\n" for row in rows
+                )
+
+
+@router.get("/users/export/")
+def export_users(
+    format: str = Query("ndjson", pattern="^(ndjson|csv)$"),
+    type: Optional[RegistrationTypeEnum] = None,
+    created_after: Optional[datetime] = None,
+):
+    media_type = "text/csv" if format == "csv" else "application/x-ndjson"
+    return StreamingResponse(
+        stream_users_export(format, RegistrationType(type.value) if type else None, created_after),
+        media_type=media_type,
+        headers={"Content-Disposition": f"attachment; filename=users.{format}"},
+    )
+
+
+@router.post("/users/purge/")
+def purge_users_route(data: PurgeRequest):
+    # Bulk delete by ids or by filter, in batches that each commit on their own
+    filters = (data.type, data.created_after, data.created_before)
+    if (data.ids is None) == all(value is None for value in filters):
+        raise HTTPException(status_code=400, detail="Provide either ids or at least one of type, created_after, created_before")
+    if data.ids is not None and len(data.ids) > MAX_PURGE_IDS:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_PURGE_IDS} ids can be purged at once")
+
+    deleted = batches = 0
+    try:
+        for batch in purge_users(
+            data.ids, RegistrationType(data.type.value) if data.type else None, data.created_after, data.created_before
+        ):
+            deleted += len(batch)
+            batches += 1
+    except SQLAlchemyError as e:
+        # Batches already committed stay deleted, the response says how far it got
+        raise HTTPException(status_code=400, detail=f"Error purging users after {deleted} deletions: {e}")
+    return {"deleted": deleted, "batches": batches}
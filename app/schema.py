@@ -1,7 +1,9 @@
-from pydantic import BaseModel,Field
-from datetime import date
+from pydantic import BaseModel,Field, ValidationError
+from datetime import date, datetime
 from enum import Enum
-from typing import Optional
+from typing import List, Literal, Optional, Union
+
+from .validation import FieldValidationError, errors_detail, field_error, schema_errors, validate_record
 
 # Enum for registration types
 class RegistrationTypeEnum(str, Enum):
@@ -39,6 +41,17 @@ class BasicSignup(BaseModel):
     class Config:
         from_attributes = True
 
+class PurgeRequest(BaseModel):
+    # Either explicit ids or at least one filter
+    ids: Optional[List[int]] = Field(None, description="Users to delete")
+    type: Optional[RegistrationTypeEnum] = Field(None, description="Delete users of this registration type")
+    created_after: Optional[datetime] = Field(None, description="Delete users created after this time")
+    created_before: Optional[datetime] = Field(None, description="Delete users created before this time")
+
+class LoginRequest(BaseModel):
+    email: str = Field(..., description="Email used for platform registration")
+    password: str = Field(..., min_length=1, description="Password is required")
+
 # Base schema
 class UserBase(BaseModel):
     type: RegistrationTypeEnum
@@ -46,11 +59,199 @@ class UserBase(BaseModel):
     class Config:
         from_attributes = True
 
-# Response schema
+# user_data of each registration type. Filled from a detail row with from_attributes, which reads
+# exactly these columns: the password hash and version are left out and relationships never load.
+class SocialMediaUserData(BaseModel):
+    id: int
+    first_name: str
+    last_name: str
+    mobile_number: str
+    hashtag: Optional[str]
+
+    class Config:
+        from_attributes = True
+
+class PlatformRegistrationUserData(BaseModel):
+    id: int
+    first_name: str
+    last_name: str
+    email: str
+    company_name: Optional[str]
+
+    class Config:
+        from_attributes = True
+
+class BasicSignupUserData(BaseModel):
+    id: int
+    first_name: str
+    last_name: str
+    mobile_number: str
+    dob: Optional[date]
+
+    class Config:
+        from_attributes = True
+
+USER_DATA_MODELS = {
+    RegistrationTypeEnum.SOCIAL_MEDIA: SocialMediaUserData,
+    RegistrationTypeEnum.PROJECT_MANAGEMENT: PlatformRegistrationUserData,
+    RegistrationTypeEnum.COMMON_SIGNUP: BasicSignupUserData,
+}
+
+# Every field is required (nullable ones too), so a user_data payload matches one member only
+UserData = Union[SocialMediaUserData, PlatformRegistrationUserData, BasicSignupUserData]
+
+# Response schemas
+class RegistrationResponse(BaseModel):
+    id: int
+    type: RegistrationTypeEnum
+    user_data: UserData
+
 class UserResponse(BaseModel):
     id: int
     type: RegistrationTypeEnum
-    user_data: dict
+    version: int
+    user_data: UserData
+
+class UserListItem(BaseModel):
+    id: int
+    type: RegistrationTypeEnum
+    created_at: datetime
+    user_data: UserData
+
+class UserPage(BaseModel):
+    users: List[UserListItem]
+    next_cursor: Optional[int]
+
+class FoundUser(BaseModel):
+    id: int
+    found: Literal[True] = True
+    type: RegistrationTypeEnum
+    user_data: UserData
+
+class MissingUser(BaseModel):
+    id: int
+    found: Literal[False] = False
+
+class UserBatch(BaseModel):
+    # In the order of the requested ids
+    users: List[Union[FoundUser, MissingUser]]
+
+class SearchResult(BaseModel):
+    id: int
+    type: RegistrationTypeEnum
+    # 0 exact match, 1 prefix match, 2 substring match
+    rank: int
+    user_data: UserData
+
+class SearchPage(BaseModel):
+    results: List[SearchResult]
+    next_cursor: Optional[str]
+
+
+# Registration dispatch: pick the schema from the payload keys in one pass instead of
+# validating against every schema in turn
+REGISTRATION_MODELS = {
+    RegistrationTypeEnum.SOCIAL_MEDIA: SocialMediaSignup,
+    RegistrationTypeEnum.PROJECT_MANAGEMENT: PlatformRegistration,
+    RegistrationTypeEnum.COMMON_SIGNUP: BasicSignup,
+}
+
+# Keys that only one registration type carries, checked in this order
+DISCRIMINATOR_KEYS = (
+    ("hashtag", RegistrationTypeEnum.SOCIAL_MEDIA),
+    ("email", RegistrationTypeEnum.PROJECT_MANAGEMENT),
+    ("password", RegistrationTypeEnum.PROJECT_MANAGEMENT),
+    ("dob", RegistrationTypeEnum.COMMON_SIGNUP),
+)
+
+
+class RegistrationDispatchError(FieldValidationError):
+    pass
+
+
+def infer_registration_type(data: dict) -> Optional[RegistrationTypeEnum]:
+    # An explicit "type" wins, otherwise the first discriminating key present decides
+    explicit = data.get("type")
+    if explicit is not None:
+        try:
+            return RegistrationTypeEnum(explicit)
+        except ValueError:
+            message = f"Invalid registration type {explicit!r}, expected one of {[t.value for t in RegistrationTypeEnum]}"
+            raise RegistrationDispatchError(message, [field_error("type", message)])
+    for key, reg_type in DISCRIMINATOR_KEYS:
+        if key in data:
+            return reg_type
+    return None
+
+
+def parse_registration(data: dict, check_fields: bool = True):
+    # check_fields=False leaves the field checks to the caller, bulk imports run them over the whole batch
+    reg_type = infer_registration_type(data)
+    if reg_type is None:
+        message = "Invalid registration type: provide 'type' or one of 'hashtag', 'email'/'password' or 'dob'"
+        raise RegistrationDispatchError(message, [field_error("type", message)])
+    try:
+        valid_data = REGISTRATION_MODELS[reg_type].model_validate(data)
+    except ValidationError as e:
+        errors = schema_errors(e)
+        raise RegistrationDispatchError(f"Invalid {reg_type.value} registration: {errors_detail(errors)}", errors)
+    if check_fields:
+        errors = validate_record(valid_data.model_dump())
+        if errors:
+            raise RegistrationDispatchError(f"Invalid {reg_type.value} registration: {errors_detail(errors)}", errors)
+    return reg_type, valid_data
+
+
+# Partial models for PUT /update_user: every field is optional, but a field that is sent must be
+# valid (non-nullable columns reject null) and fields of other registration types are rejected
+class SocialMediaUpdate(BaseModel):
+    first_name: str = Field(None, min_length=1)
+    last_name: str = Field(None, min_length=1)
+    mobile_number: str = Field(None)
+    hashtag: Optional[str] = Field(None, min_length=1)
 
     class Config:
-        from_attributes = True
+        extra = "forbid"
+
+class PlatformRegistrationUpdate(BaseModel):
+    first_name: str = Field(None, min_length=1)
+    last_name: str = Field(None, min_length=1)
+    email: str = Field(None)
+    password: str = Field(None, min_length=6)
+    company_name: Optional[str] = Field(None, min_length=1)
+
+    class Config:
+        extra = "forbid"
+
+class BasicSignupUpdate(BaseModel):
+    mobile_number: str = Field(None)
+    first_name: str = Field(None, min_length=1)
+    last_name: str = Field(None, min_length=1)
+    dob: Optional[date] = Field(None)
+
+    class Config:
+        extra = "forbid"
+
+
+UPDATE_MODELS = {
+    RegistrationTypeEnum.SOCIAL_MEDIA: SocialMediaUpdate,
+    RegistrationTypeEnum.PROJECT_MANAGEMENT: PlatformRegistrationUpdate,
+    RegistrationTypeEnum.COMMON_SIGNUP: BasicSignupUpdate,
+}
+
+
+class UpdateValidationError(FieldValidationError):
+    pass
+
+
+def parse_update(reg_type: RegistrationTypeEnum, data: dict):
+    # Only the fields present in the request, validated against the user's registration type
+    try:
+        values = UPDATE_MODELS[reg_type].model_validate(data).model_dump(exclude_unset=True)
+    except ValidationError as e:
+        errors = schema_errors(e)
+        raise UpdateValidationError(f"Invalid {reg_type.value} update: {errors_detail(errors)}", errors)
+    errors = validate_record(values)
+    if errors:
+        raise UpdateValidationError(f"Invalid {reg_type.value} update: {errors_detail(errors)}", errors)
+    return values
@@ -0,0 +1,117 @@
+"""User search over names, email prefixes and hashtags, across every registration type.
+
+Matches come from the user_search table (one lowercased row per user) and are ranked in tiers:
+    0  the whole name, first or last name, email or hashtag equals the query
+    1  the name, last name, email or hashtag starts with it
+    2  the name or hashtag contains it
+then by user id, which makes (rank, user id) a stable keyset cursor.
+"""
+from typing import Optional
+
+from sqlalchemy import case, or_, select, tuple_, update
+
+from .contacts import normalize_email
+from .models import UserSearch
+
+# Shorter queries have no trigram to look up and would match a large part of the table
+MIN_SEARCH_LENGTH = 3
+MAX_SEARCH_LENGTH = 100
+
+SEARCH_FIELDS = ("name", "email", "hashtag")
+
+# Detail columns copied into user_search
+SEARCHABLE_COLUMNS = ("first_name", "last_name", "email", "hashtag")
+
+
+def search_text(value: str):
+    # Lowercase with single spaces, hashtags without their "#": "  #Summer  Sale" -> "summer sale"
+    return " ".join(value.strip().lstrip("#").split()).lower()
+
+
+def search_value(column: str, value: Optional[str]):
+    if value is None:
+        return None
+    if column == "email":
+        return normalize_email(value)
+    return search_text(value)
+
+
+def search_values(reg_type, values: dict):
+    # Columns of a new user's search row, values holds the detail columns of its type
+    return {"type": reg_type, **{column: search_value(column, values.get(column)) for column in SEARCHABLE_COLUMNS}}
+
+
+def search_row(user_id: int, reg_type, values: dict):
+    # For Core multi-row inserts
+    return {"user_id": user_id, **search_values(reg_type, values)}
+
+
+def search_entry(reg_type, values: dict):
+    # Attached to a new UserTable through its search_entry relationship
+    return UserSearch(**search_values(reg_type, values))
+
+
+def search_update(user_id: int, values: dict):
+    # UPDATE keeping the user's search row in step with changed names, email or hashtag, None if unchanged
+    changed = {column: search_value(column, values[column]) for column in SEARCHABLE_COLUMNS if column in values}
+    if not changed:
+        return None
+    return update(UserSearch).where(UserSearch.user_id == user_id).values(changed)
+
+
+def like_pattern(term: str, prefix_only: bool = False):
+    # LIKE pattern matching term literally, with backslash as the escape character
+    escaped = term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return f"{escaped}%" if prefix_only else f"%{escaped}%"
+
+
+# user_search columns each search field ranks on: (equal to the query, starting with it)
+RANK_COLUMNS = {
+    "name": (("name", "first_name", "last_name"), ("name", "last_name")),
+    "email": (("email",), ("email",)),
+    "hashtag": (("hashtag",), ("hashtag",)),
+}
+
+
+def search_rank(term: str, fields):
+    equal, starts = [], []
+    for field in fields:
+        equal_columns, prefix_columns = RANK_COLUMNS[field]
+        equal += [getattr(UserSearch, column) == term for column in equal_columns]
+        starts += [getattr(UserSearch, column).like(like_pattern(term, prefix_only=True), escape="\\") for column in prefix_columns]
+    return case((or_(*equal), 0), (or_(*starts), 1), else_=2)
+
+
+def search_query(term: str, fields=SEARCH_FIELDS, reg_type=None, after=None, limit: int = 20):
+    # (user_id, type, rank) of one page of matches. On Postgres each field condition is served by its
+    # own index (trigram GIN for name and hashtag, pattern_ops B-tree for email) in one bitmap scan,
+    # ranking and sorting only touch the matching rows.
+    s = UserSearch
+    conditions = []
+    if "name" in fields:
+        conditions.append(s.name.like(like_pattern(term), escape="\\"))
+    if "email" in fields:
+        conditions.append(s.email.like(like_pattern(term, prefix_only=True), escape="\\"))
+    if "hashtag" in fields:
+        conditions.append(s.hashtag.like(like_pattern(term), escape="\\"))
+
+    matches = select(s.user_id, s.type, search_rank(term, fields).label("rank")).where(or_(*conditions))
+    if reg_type is not None:
+        matches = matches.where(s.type == reg_type)
+    matches = matches.subquery("matches")
+    stmt = select(matches)
+    if after is not None:
+        stmt = stmt.where(tuple_(matches.c.rank, matches.c.user_id) > tuple_(*after))
+    return stmt.order_by(matches.c.rank, matches.c.user_id).limit(limit)
+
+
+def search_cursor(rank: int, user_id: int):
+    return f"{rank}:{user_id}"
+
+
+def parse_search_cursor(cursor: Optional[str]):
+    # (rank, user_id) after which the next page starts, raises ValueError on a malformed cursor
+    if cursor is None:
+        return None
+    rank, _, user_id = cursor.partition(":")
+    return int(rank), int(user_id)
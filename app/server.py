@@ -0,0 +1,144 @@
+"""Production entry point: N worker processes serving app.main:app.
+
+    python -m app.server --workers 4 --port 8000
+    python -m app.server --server gunicorn --workers 8    # gunicorn master, uvicorn workers
+
+uvloop and httptools are used when installed (pip install uvloop httptools), asyncio and h11
+otherwise. With DB_CONNECTION_BUDGET set, every worker's pools are sized so that all workers
+together never hold more Postgres connections than the budget; startup fails when the budget
+can't give each worker a connection.
+
+On SIGTERM (or SIGINT) each worker fails /ready, keeps serving for SHUTDOWN_DRAIN_SECONDS, stops
+accepting, waits up to --graceful-timeout for in-flight requests, then waits for checked-out
+connections and closes its pools.
+
+Run migrations once before starting the workers: python -m app.bootstrap migrate
+"""
+import argparse
+import importlib.util
+import logging
+import os
+import shutil
+import sys
+
+logger = logging.getLogger(__name__)
+
+APP = "app.main:app"
+
+
+def installed(module):
+    return importlib.util.find_spec(module) is not None
+
+
+def gunicorn_worker_class():
+    # uvicorn's bundled gunicorn worker moved to the uvicorn-worker package
+    return "uvicorn_worker.UvicornWorker" if installed("uvicorn_worker") else "uvicorn.workers.UvicornWorker"
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, default=int(os.getenv("WEB_CONCURRENCY") or os.cpu_count() or 1))
+    parser.add_argument("--host", default=os.getenv("HOST", "0.0.0.0"))
+    parser.add_argument("--port", type=int, default=int(os.getenv("PORT", "8000")))
+    parser.add_argument("--server", choices=("uvicorn", "gunicorn"), default=os.getenv("SERVER", "uvicorn"))
+    parser.add_argument("--graceful-timeout", type=int, default=int(os.getenv("GRACEFUL_TIMEOUT", "30")),
+                        help="Seconds in-flight requests get to finish on shutdown")
+    parser.add_argument("--keep-alive", type=int, default=int(os.getenv("KEEP_ALIVE", "5")),
+                        help="Seconds an idle keep-alive connection stays open")
+    parser.add_argument("--backlog", type=int, default=2048)
+    parser.add_argument("--limit-concurrency", type=int, default=None,
+                        help="Answer 503 above this many concurrent connections per worker")
+    parser.add_argument("--access-log", action="store_true", help="Log every request (the app already records metrics)")
+    parser.add_argument("--proxy-headers", action="store_true", help="Trust X-Forwarded-* from --forwarded-allow-ips")
+    parser.add_argument("--forwarded-allow-ips", default=os.getenv("FORWARDED_ALLOW_IPS", "127.0.0.1"))
+    return parser.parse_args(argv)
+
+
+def configure_workers(workers):
+    # Exported before any worker imports the app: app.database sizes its pools from WEB_CONCURRENCY
+    os.environ["WEB_CONCURRENCY"] = str(workers)
+    # Each worker starts its own password hashing pool, share the CPUs between them
+    os.environ.setdefault("PASSWORD_HASH_WORKERS", str(max(1, (os.cpu_count() or 1) // workers)))
+
+    from app.database import DB_CONNECTION_BUDGET, DB_EXTERNAL_POOLER, DB_MODE, pool_limits
+
+    # Connection plan of the whole server, raises ValueError when the budget is too small
+    engines = 2 if DB_MODE == "async" else 1
+    if DB_EXTERNAL_POOLER:
+        return {"pool": "NullPool", "engines": engines}
+    pool_size, max_overflow = pool_limits(workers)
+    return {
+        "engines": engines,
+        "pool_size": pool_size,
+        "max_overflow": max_overflow,
+        "max_connections": workers * engines * (pool_size + max_overflow),
+        "budget": DB_CONNECTION_BUDGET or None,
+    }
+
+
+def run_uvicorn(args):
+    import uvicorn
+
+    uvicorn.run(
+        APP,
+        host=args.host,
+        port=args.port,
+        workers=args.workers,
+        loop="uvloop" if installed("uvloop") else "asyncio",
+        http="httptools" if installed("httptools") else "h11",
+        backlog=args.backlog,
+        limit_concurrency=args.limit_concurrency,
+        timeout_keep_alive=args.keep_alive,
+        timeout_graceful_shutdown=args.graceful_timeout,
+        access_log=args.access_log,
+        proxy_headers=args.proxy_headers,
+        forwarded_allow_ips=args.forwarded_allow_ips,
+    )
+
+
+def run_gunicorn(args):
+    gunicorn = shutil.which("gunicorn")
+    if gunicorn is None:
+        sys.exit("--server gunicorn needs gunicorn installed (pip install gunicorn uvicorn-worker)")
+    command = [
+        gunicorn, APP,
+        "--worker-class", gunicorn_worker_class(),
+        "--workers", str(args.workers),
+        "--bind", f"{args.host}:{args.port}",
+        "--backlog", str(args.backlog),
+        "--keep-alive", str(args.keep_alive),
+        "--graceful-timeout", str(args.graceful_timeout),
+        "--forwarded-allow-ips", args.forwarded_allow_ips,
+    ]
+    if args.access_log:
+        command += ["--access-logfile", "-"]
+    # The gunicorn master replaces this process and gets the signals directly
+    os.execv(gunicorn, command)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    try:
+        plan = configure_workers(args.workers)
+    except ValueError as e:
+        sys.exit(str(e))
+
+    from app.instrumentation import configure_logging
+
+    configure_logging()
+    logger.info("server_starting", extra={
+        "server": args.server,
+        "workers": args.workers,
+        "bind": f"{args.host}:{args.port}",
+        "loop": "uvloop" if installed("uvloop") else "asyncio",
+        "http": "httptools" if installed("httptools") else "h11",
+        **plan,
+    })
+    if args.server == "gunicorn":
+        run_gunicorn(args)
+    else:
+        run_uvicorn(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""Field checks of the registration data, beyond what the pydantic schemas express.
+
+The schemas parse and type every payload; the checks here (mobile number length, email format)
+run once, on the parsed values, before anything reaches the database. Bulk imports run them a
+column at a time over the whole batch: one precompiled pattern, one pass per field. Errors are
+structured, {"field": ..., "message": ...}, and errors_detail joins them into the one-line
+message the routes return.
+"""
+import re
+
+from pydantic import ValidationError
+
+MOBILE_NUMBER_LENGTH = 10
+EMAIL_PATTERN = re.compile(r'^[\w\.-]+@[\w\.-]+\.\w+$')
+
+
+def invalid_mobile_numbers(values):
+    # Indexes of the mobile numbers that are not MOBILE_NUMBER_LENGTH characters long
+    return [index for index, length in enumerate(map(len, values)) if length != MOBILE_NUMBER_LENGTH]
+
+
+def invalid_emails(values):
+    return [index for index, match in enumerate(map(EMAIL_PATTERN.match, values)) if match is None]
+
+
+# Column check and error message per field, whatever the registration type
+FIELD_CHECKS = {
+    "mobile_number": (invalid_mobile_numbers, "Invalid mobile number length"),
+    "email": (invalid_emails, "Invalid email format"),
+}
+
+
+class FieldValidationError(ValueError):
+    # Carries the per-field errors along with the one-line message
+    def __init__(self, message: str, errors=()):
+        super().__init__(message)
+        self.errors = list(errors)
+
+
+def field_error(field: str, message: str):
+    return {"field": field, "message": message}
+
+
+def validate_records(records):
+    # Errors of the invalid records (dicts of field values) by index, valid records have no entry.
+    # Each check runs once over the column of its field, fields a record doesn't have (None) are skipped.
+    errors = {}
+    for field, (check, message) in FIELD_CHECKS.items():
+        column = [record.get(field) for record in records]
+        missing = column.count(None)
+        if missing == len(column):
+            continue
+        positions = None
+        if missing:
+            positions = [index for index, value in enumerate(column) if value is not None]
+            column = [column[index] for index in positions]
+        for index in check(column):
+            errors.setdefault(index if positions is None else positions[index], []).append(field_error(field, message))
+    return errors
+
+
+def validate_record(record: dict):
+    # Errors of a single record, without building columns
+    errors = []
+    for field, (check, message) in FIELD_CHECKS.items():
+        value = record.get(field)
+        if value is not None and check((value,)):
+            errors.append(field_error(field, message))
+    return errors
+
+
+def schema_errors(e: ValidationError):
+    # pydantic's errors in the same structure
+    return [field_error(".".join(str(part) for part in error["loc"]), error["msg"]) for error in e.errors()]
+
+
+def errors_detail(errors):
+    return "; ".join(f"{error['field']}: {error['message']}" for error in errors)
@@ -0,0 +1,45 @@
+"""Microbenchmark of registration classification cost per registration type.
+
+Compares the old trial validation (SocialMediaSignup, then PlatformRegistration, then
+BasicSignup, catching ValidationError) with the one-pass dispatch in app.schema.
+
+Usage:
+    python -m benchmarks.bench_classify --number 20000
+"""
+import argparse
+import timeit
+
+from pydantic import ValidationError
+
+from app.schema import BasicSignup, PlatformRegistration, SocialMediaSignup, parse_registration
+
+PAYLOADS = {
+    "SOCIAL_MEDIA": {"first_name": "a", "last_name": "b", "mobile_number": "1234567890", "hashtag": "x"},
+    "PROJECT_MANAGEMENT": {"first_name": "a", "last_name": "b", "email": "a@b.io", "password": "secret1"},
+    "COMMON_SIGNUP": {"first_name": "a", "last_name": "b", "mobile_number": "1234567890", "dob": "2000-01-01"},
+}
+
+
+def trial_validation(data):
+    for model in (SocialMediaSignup, PlatformRegistration, BasicSignup):
+        try:
+            return model(**data)
+        except ValidationError:
+            pass
+    return None
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--number", type=int, default=20000)
+    args = parser.parse_args()
+
+    print(f"{'type':<20}{'trial (us)':>12}{'dispatch (us)':>15}")
+    for name, data in PAYLOADS.items():
+        trial = timeit.timeit(lambda: trial_validation(data), number=args.number)
+        dispatch = timeit.timeit(lambda: parse_registration(data), number=args.number)
+        print(f"{name:<20}{trial / args.number * 1e6:>12.2f}{dispatch / args.number * 1e6:>15.2f}")
+
+
+if __name__ == "__main__":
+    main()
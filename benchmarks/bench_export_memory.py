@@ -0,0 +1,89 @@
+"""Memory profile of the streaming user export.
+
+Seeds --users social media signups with multi-row inserts, then drains stream_users_export and
+samples the process RSS as it goes. RSS should stay flat whatever the number of exported users;
+with --budget-mb the run fails when the peak grows more than that over the baseline.
+
+Usage:
+    DATABASE_URL=sqlite:///bench.db python -m benchmarks.bench_export_memory --users 1000000 --format csv
+"""
+import argparse
+import resource
+import sys
+import time
+
+from sqlalchemy import func, insert, select
+
+from app.database import SessionLocal
+from app.bootstrap import migrate
+from app.models import RegistrationType, SocialMediaData, UserTable
+from app.routes import stream_users_export
+
+SEED_BATCH = 10000
+
+
+def rss_mb():
+    with open("/proc/self/status") as status:
+        for line in status:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) / 1024
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def seed(users):
+    with SessionLocal() as db:
+        existing = db.scalar(select(func.count()).select_from(UserTable))
+        for start in range(existing, users, SEED_BATCH):
+            count = min(SEED_BATCH, users - start)
+            detail_ids = db.execute(
+                insert(SocialMediaData).returning(SocialMediaData.id, sort_by_parameter_order=True),
+                [
+                    {"mobile_number": f"{9000000000 + start + i}", "first_name": "bench", "last_name": "user", "hashtag": "export"}
+                    for i in range(count)
+                ],
+            ).scalars().all()
+            db.execute(
+                insert(UserTable),
+                [{"type": RegistrationType.SOCIAL_MEDIA, "social_media_id": detail_id} for detail_id in detail_ids],
+            )
+            db.commit()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=100000)
+    parser.add_argument("--format", choices=["ndjson", "csv"], default="ndjson")
+    parser.add_argument("--samples", type=int, default=10)
+    parser.add_argument("--budget-mb", type=float, help="Fail when peak RSS grows more than this over the baseline")
+    args = parser.parse_args()
+
+    migrate()
+
+    seed(args.users)
+
+    baseline = rss_mb()
+    peak = baseline
+    exported_bytes = 0
+    chunks = 0
+    started = time.perf_counter()
+    sample_every = max(1, args.users // 1000 // args.samples)
+    for chunk in stream_users_export(args.format):
+        exported_bytes += len(chunk)
+        chunks += 1
+        peak = max(peak, rss_mb())
+        if chunks % sample_every == 0:
+            print(f"chunk {chunks:>7}  exported {exported_bytes / 2 ** 20:>9.1f} MiB  rss {rss_mb():>7.1f} MiB")
+    elapsed = time.perf_counter() - started
+
+    print(f"users:        {args.users}")
+    print(f"exported:     {exported_bytes / 2 ** 20:.1f} MiB in {elapsed:.1f}s")
+    print(f"rss baseline: {baseline:.1f} MiB")
+    print(f"rss peak:     {peak:.1f} MiB (+{peak - baseline:.1f} MiB)")
+    if args.budget_mb is not None:
+        if peak - baseline > args.budget_mb:
+            sys.exit(f"FAIL: RSS grew {peak - baseline:.1f} MiB during the export, over the {args.budget_mb:.0f} MiB budget")
+        print(f"OK: within the {args.budget_mb:.0f} MiB budget")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+"""Password hashing throughput, for sizing PASSWORD_HASH_WORKERS.
+
+Reports scrypt hashes per second on one core (inline) and through the process pool for each
+worker count, with p50/p99 latency of a single hash while the pool is saturated.
+
+For the effect on registration latency compare
+    PASSWORD_HASH_WORKERS=0 python -m benchmarks.bench_register --type platform
+with a pooled run of the same command.
+
+Usage:
+    PASSWORD_SCRYPT_N=16384 python -m benchmarks.bench_passwords --hashes 200 --workers 1 2 4
+"""
+import argparse
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from app import passwords
+from benchmarks.common import percentile
+
+
+def timed_hash(_):
+    begin = time.perf_counter()
+    passwords.hash_password("correct horse battery staple")
+    return time.perf_counter() - begin
+
+
+def run(workers, hashes):
+    passwords.shutdown_executor()
+    passwords.PASSWORD_HASH_WORKERS = workers
+    passwords.hash_password("warm up")  # starts the pool outside the measurement
+
+    # As many concurrent callers as workers keeps the pool saturated, like concurrent signups
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as callers:
+        latencies = list(callers.map(timed_hash, range(hashes)))
+    elapsed = time.perf_counter() - started
+    passwords.shutdown_executor()
+    return hashes / elapsed, latencies
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--hashes", type=int, default=200)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, os.cpu_count() or 1])
+    args = parser.parse_args()
+
+    print(f"scrypt n={passwords.SCRYPT_N} r={passwords.SCRYPT_R} p={passwords.SCRYPT_P}, {os.cpu_count()} cpus")
+    print(f"{'workers':<10}{'hashes/s':>10}{'hashes/s/worker':>17}{'p50 (ms)':>10}{'p99 (ms)':>10}")
+    for workers in [0] + sorted(set(args.workers)):
+        rate, latencies = run(workers, args.hashes)
+        label = "inline" if workers == 0 else str(workers)
+        print(
+            f"{label:<10}{rate:>10.1f}{rate / max(1, workers):>17.1f}"
+            f"{percentile(latencies, 50) * 1000:>10.1f}{percentile(latencies, 99) * 1000:>10.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+"""Benchmark POST /add_user: SQL round trips per registration and p50/p99 latency.
+
+Usage:
+    DATABASE_URL=sqlite:///bench.db python -m benchmarks.bench_register --users 2000
+
+Run it on two checkouts against the same DATABASE_URL to compare write paths.
+"""
+import argparse
+import time
+import uuid
+
+from fastapi.testclient import TestClient
+from sqlalchemy import event
+
+from app import database
+from app.bootstrap import migrate
+from app.main import app
+from benchmarks.common import percentile
+
+
+TYPES = {"social": 0, "platform": 1, "basic": 2}
+
+
+def payload(i):
+    # Rotate through the three registration types with unique contact keys
+    suffix = uuid.uuid4().int % 10 ** 9
+    if i % 3 == 0:
+        return {"first_name": "a", "last_name": "b", "mobile_number": f"1{suffix:09d}", "hashtag": "bench"}
+    if i % 3 == 1:
+        return {"first_name": "a", "last_name": "b", "email": f"{uuid.uuid4().hex}@bench.io", "password": "secret1"}
+    return {"first_name": "a", "last_name": "b", "mobile_number": f"2{suffix:09d}", "dob": "2000-01-01"}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--type", choices=["mixed", *TYPES], default="mixed")
+    args = parser.parse_args()
+
+    migrate()
+    engine = database.engine
+
+    counters = {"statements": 0, "commits": 0}
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def count_statement(*_):
+        counters["statements"] += 1
+
+    @event.listens_for(engine, "commit")
+    def count_commit(*_):
+        counters["commits"] += 1
+
+    latencies = []
+    with TestClient(app) as client:
+        started = time.perf_counter()
+        for i in range(args.users):
+            begin = time.perf_counter()
+            response = client.post("/add_user/", json=payload(i if args.type == "mixed" else TYPES[args.type]))
+            latencies.append(time.perf_counter() - begin)
+            assert response.status_code == 200, response.text
+        elapsed = time.perf_counter() - started
+
+    print(f"registrations:        {args.users}")
+    print(f"statements/request:   {counters['statements'] / args.users:.2f}")
+    print(f"commits/request:      {counters['commits'] / args.users:.2f}")
+    print(f"throughput (req/s):   {args.users / elapsed:.1f}")
+    print(f"p50 latency (ms):     {percentile(latencies, 50) * 1000:.2f}")
+    print(f"p99 latency (ms):     {percentile(latencies, 99) * 1000:.2f}")
+
+
+if __name__ == "__main__":
+    main()
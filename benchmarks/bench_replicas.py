@@ -0,0 +1,105 @@
+"""Read routing with DATABASE_REPLICA_URLS: where a mixed workload's queries go, and whether every
+client reads its own writes.
+
+Seeds --users users on the primary and, when the replicas are SQLite files, copies the primary
+into each of them. The copies never see later writes, which makes them replicas with unbounded
+lag: a client that reads a user it has just registered gets it only if the read was routed to the
+primary. --clients clients each keep their own cookies and send --requests requests in total,
+--write-share of them POST /add_user followed right away by GET /get_user of the new user, the
+rest GET /get_user of a seeded user. Reports requests by outcome, the read-your-writes misses
+(must be 0) and GET /replica_metrics/: statements per target, reads per replica, sticky reads.
+
+Usage:
+    DATABASE_URL=sqlite:///./bench_primary.db \\
+    DATABASE_REPLICA_URLS=sqlite:///./bench_replica1.db,sqlite:///./bench_replica2.db \\
+        python -m benchmarks.bench_replicas --users 10000 --requests 5000 --write-share 0.1
+"""
+import argparse
+import json
+import os
+import random
+import sqlite3
+import time
+from collections import Counter
+
+from sqlalchemy.engine import make_url
+
+from benchmarks.common import percentile, seed_users
+
+
+def copy_sqlite(primary_url, replica_url):
+    # Snapshot of the primary file with the backup API, consistent even while it is open
+    source = sqlite3.connect(make_url(primary_url).database)
+    target = sqlite3.connect(make_url(replica_url).database)
+    with target:
+        source.backup(target)
+    source.close()
+    target.close()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=10000)
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--clients", type=int, default=1000, help="Clients, each with its own cookie jar")
+    parser.add_argument("--write-share", type=float, default=0.1, help="Share of requests that register a user")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    # Every read has to reach the database
+    os.environ["USER_CACHE_BACKEND"] = "none"
+
+    from fastapi.testclient import TestClient
+    from sqlalchemy import select
+
+    from app.bootstrap import migrate
+    from app.database import DATABASE_REPLICA_URLS, DATABASE_URL, SessionLocal
+    from app.models import UserTable
+
+    if not DATABASE_REPLICA_URLS:
+        raise SystemExit("Set DATABASE_REPLICA_URLS to one or more replicas of DATABASE_URL")
+    migrate()
+    seed_users(args.users)
+    with SessionLocal() as db:
+        user_ids = db.execute(select(UserTable.id).limit(args.users)).scalars().all()
+    for url in DATABASE_REPLICA_URLS:
+        if make_url(url).get_backend_name() == "sqlite":
+            copy_sqlite(DATABASE_URL, url)
+
+    # Engines were created by migrate(), the app lifespan starts the replica health checks
+    from app.main import app
+
+    rng = random.Random(args.seed)
+    outcomes, latencies = Counter(), []
+    with TestClient(app) as server:
+        clients = [TestClient(app) for _ in range(args.clients)]
+        begin = time.perf_counter()
+        for i in range(args.requests):
+            client = rng.choice(clients)
+            started = time.perf_counter()
+            if rng.random() < args.write_share:
+                response = client.post("/add_user/", json={
+                    "first_name": "Replica", "last_name": f"Bench{i}", "mobile_number": f"{6000000000 + i}", "hashtag": "bench",
+                })
+                if response.status_code != 200:
+                    outcomes[f"add_{response.status_code}"] += 1
+                    continue
+                outcomes["add_200"] += 1
+                # Read-your-writes: the new user exists on the primary only
+                response = client.get(f"/get_user/{response.json()['id']}/")
+                outcomes["own_read_200" if response.status_code == 200 else "own_read_miss"] += 1
+            else:
+                response = client.get(f"/get_user/{rng.choice(user_ids)}/")
+                outcomes[f"read_{response.status_code}"] += 1
+            latencies.append(time.perf_counter() - started)
+        elapsed = time.perf_counter() - begin
+        metrics = server.get("/replica_metrics/").json()
+
+    print(f"{args.requests} requests in {elapsed:.1f} s, p50 {percentile(latencies, 50) * 1000:.2f} ms, "
+          f"p99 {percentile(latencies, 99) * 1000:.2f} ms")
+    print("outcomes:", dict(sorted(outcomes.items())))
+    print("read-your-writes misses:", outcomes["own_read_miss"])
+    print(json.dumps(metrics, indent=2))
+
+
+if __name__ == "__main__":
+    main()
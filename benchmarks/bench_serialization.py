@@ -0,0 +1,142 @@
+"""Response serialization cost: jsonable_encoder over ORM rows against the typed response models.
+
+Loads users once, then times only the step from loaded rows to response bytes, for one user
+(GET /get_user), an id batch (GET /users?ids=...) and a listing page (GET /users):
+    encoder   the previous path: jsonable_encoder on every detail row, FastAPI's jsonable_encoder
+              pass over the whole payload and JSONResponse's json.dumps
+    typed     response models filled with from_attributes, validated and dumped to JSON by
+              pydantic, as FastAPI does for a route with a response_model
+Cache hits are timed apart: the stored dict rendered by JSONResponse and by FastJSONResponse.
+
+Usage:
+    DATABASE_URL=sqlite:///serialization.db python -m benchmarks.bench_serialization --batch-size 1000
+"""
+import argparse
+import json
+import random
+import timeit
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from pydantic import TypeAdapter
+from sqlalchemy import select
+
+from app.bootstrap import migrate
+from app.database import SessionLocal
+from app.models import UserTable
+from app.repository import get_user_with_data, get_users_by_ids, list_users
+from app.responses import FastJSONResponse, orjson
+from app.routes import user_data_response, user_response
+from app.schema import FoundUser, UserBatch, UserListItem, UserPage, UserResponse
+from benchmarks.common import seed_users
+
+LEGACY_HIDDEN_FIELDS = {"password", "version"}
+
+
+def legacy_user_data(user_data):
+    return jsonable_encoder(user_data, exclude=LEGACY_HIDDEN_FIELDS)
+
+
+def legacy_render(content):
+    # No response_model: FastAPI runs jsonable_encoder on the return value, then JSONResponse renders it
+    return JSONResponse(jsonable_encoder(content)).body
+
+
+def typed_render(adapter, content):
+    # response_model with the default response class: validate, then dump straight to JSON bytes
+    return adapter.dump_json(adapter.validate_python(content))
+
+
+def encoder_single(user):
+    user_data = user.user_specific_data
+    return legacy_render(jsonable_encoder({
+        "id": user.id, "type": user.type, "version": user_data.version, "user_data": legacy_user_data(user_data)
+    }))
+
+
+def encoder_batch(users):
+    return legacy_render({"users": jsonable_encoder([
+        {"id": user.id, "found": True, "type": user.type, "user_data": legacy_user_data(user.user_specific_data)}
+        for user in users
+    ])})
+
+
+def encoder_page(users):
+    return legacy_render({"users": jsonable_encoder([
+        {"id": user.id, "type": user.type, "created_at": user.created_at, "user_data": legacy_user_data(user.user_specific_data)}
+        for user in users
+    ]), "next_cursor": None})
+
+
+SINGLE_ADAPTER = TypeAdapter(UserResponse)
+BATCH_ADAPTER = TypeAdapter(UserBatch)
+PAGE_ADAPTER = TypeAdapter(UserPage)
+
+
+def typed_single(user):
+    return typed_render(SINGLE_ADAPTER, user_response(user, user.user_specific_data))
+
+
+def typed_batch(users):
+    return typed_render(BATCH_ADAPTER, UserBatch(users=[
+        FoundUser(id=user.id, type=user.type.value, user_data=user_data_response(user.type, user.user_specific_data))
+        for user in users
+    ]))
+
+
+def typed_page(users):
+    return typed_render(PAGE_ADAPTER, UserPage(users=[
+        UserListItem(
+            id=user.id,
+            type=user.type.value,
+            created_at=user.created_at,
+            user_data=user_data_response(user.type, user.user_specific_data),
+        )
+        for user in users
+    ], next_cursor=None))
+
+
+def report(label, encoder, typed, number):
+    encoder_seconds = timeit.timeit(encoder, number=number) / number
+    typed_seconds = timeit.timeit(typed, number=number) / number
+    print(f"{label:<28}{encoder_seconds * 1e6:>14.1f}{typed_seconds * 1e6:>14.1f}{encoder_seconds / typed_seconds:>9.1f}x")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=3000)
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--number", type=int, default=20, help="Repetitions of the batch and page payloads")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    migrate()
+    seed_users(max(args.users, args.batch_size), random.Random(args.seed))
+
+    with SessionLocal() as db:
+        ids = db.execute(select(UserTable.id)).scalars().all()
+        rng = random.Random(args.seed)
+        singles = [get_user_with_data(user_id, db) for user_id in rng.sample(ids, 3)]
+        batch = list(get_users_by_ids(rng.sample(ids, args.batch_size), db).values())
+        page = list_users(db, limit=args.batch_size)
+
+        # Both paths produce the same document, only the key order differs
+        assert json.loads(typed_page(page)) == json.loads(encoder_page(page))
+        assert json.loads(typed_batch(batch)) == json.loads(encoder_batch(batch))
+
+        print(f"{'payload':<28}{'encoder (us)':>14}{'typed (us)':>14}{'speedup':>10}")
+        for user in singles:
+            report(f"single {user.type.value.lower()}", lambda: encoder_single(user), lambda: typed_single(user), args.number * 50)
+        report(f"batch x{len(batch)}", lambda: encoder_batch(batch), lambda: typed_batch(batch), args.number)
+        report(f"page x{len(page)}", lambda: encoder_page(page), lambda: typed_page(page), args.number)
+
+        cached = jsonable_encoder(user_response(singles[0], singles[0].user_specific_data))
+        cached_page = json.loads(typed_page(page))
+        print(f"\n{'cache hit':<28}{'JSONResponse':>14}{'FastJSON':>14}{'speedup':>10}"
+              f"  ({'orjson' if orjson else 'orjson not installed, json.dumps'})")
+        report("single", lambda: legacy_render(cached), lambda: FastJSONResponse(cached).body, args.number * 50)
+        report(f"page x{len(page)}", lambda: legacy_render(cached_page), lambda: FastJSONResponse(cached_page).body, args.number)
+
+
+if __name__ == "__main__":
+    main()
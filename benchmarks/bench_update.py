@@ -0,0 +1,127 @@
+"""Concurrent writers against PUT /update_user: throughput and lost updates.
+
+Phase 1 (throughput): --concurrency clients update first_name of random seeded users for
+--duration seconds.
+Phase 2 (lost updates): --writers clients each append --appends tokens to the hashtag of one
+social media user with read-modify-write (GET, then PUT If-Match with the ETag, retried on 412).
+Every token must be in the final hashtag; servers without ETag support lose some. The run exits
+non-zero when any token is lost or any update fails.
+
+Usage:
+    DATABASE_URL=sqlite:///bench.db python -m benchmarks.bench_update --users 10000 --duration 20
+"""
+import argparse
+import asyncio
+import os
+import random
+import subprocess
+import sys
+import time
+
+import httpx
+
+from benchmarks.common import percentile, seed_users
+
+
+async def update_worker(client, rng, users, deadline, latencies, errors):
+    while time.perf_counter() < deadline:
+        begin = time.perf_counter()
+        response = await client.put(f"/update_user/{rng.randint(1, users)}/", json={"first_name": f"w{rng.randrange(10 ** 6)}"})
+        latencies.append(time.perf_counter() - begin)
+        if response.status_code != 200:
+            errors.append(response.status_code)
+
+
+async def append_worker(client, user_id, writer, appends, counters):
+    for n in range(appends):
+        while True:
+            current = await client.get(f"/get_user/{user_id}/")
+            etag = current.headers.get("etag")
+            hashtag = current.json()["user_data"]["hashtag"]
+            headers = {"If-Match": etag} if etag else {}
+            response = await client.put(
+                f"/update_user/{user_id}/", json={"hashtag": f"{hashtag},w{writer}-{n}"}, headers=headers
+            )
+            if response.status_code == 412:
+                counters["conflicts"] += 1
+                continue
+            response.raise_for_status()
+            break
+
+
+async def drive(base_url, args):
+    limits = httpx.Limits(max_connections=max(args.concurrency, args.writers))
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=60) as client:
+        latencies, errors = [], []
+        started = time.perf_counter()
+        deadline = started + args.duration
+        await asyncio.gather(*(
+            update_worker(client, random.Random(index), args.users, deadline, latencies, errors)
+            for index in range(args.concurrency)
+        ))
+        elapsed = time.perf_counter() - started
+
+        # Seeded user 1 (index 0) is a social media signup
+        user_id = 1
+        await client.put(f"/update_user/{user_id}/", json={"hashtag": "start"})
+        counters = {"conflicts": 0}
+        await asyncio.gather(*(
+            append_worker(client, user_id, writer, args.appends, counters) for writer in range(args.writers)
+        ))
+        final = (await client.get(f"/get_user/{user_id}/")).json()["user_data"]["hashtag"].split(",")
+        return latencies, errors, elapsed, final, counters
+
+
+def wait_until_ready(base_url, timeout=60):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            httpx.get(f"{base_url}/docs")
+            return
+        except httpx.TransportError:
+            time.sleep(0.2)
+    raise RuntimeError(f"Server at {base_url} did not start")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=10000)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--duration", type=float, default=20)
+    parser.add_argument("--writers", type=int, default=8)
+    parser.add_argument("--appends", type=int, default=10)
+    parser.add_argument("--port", type=int, default=8767)
+    args = parser.parse_args()
+
+    from app.bootstrap import migrate
+    migrate()
+    seed_users(args.users)
+
+    base_url = f"http://127.0.0.1:{args.port}"
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(args.port), "--log-level", "warning"],
+        env=os.environ.copy(),
+        stdout=subprocess.DEVNULL,
+    )
+    try:
+        wait_until_ready(base_url)
+        latencies, errors, elapsed, final, counters = asyncio.run(drive(base_url, args))
+    finally:
+        server.terminate()
+        server.wait()
+
+    expected = {f"w{writer}-{n}" for writer in range(args.writers) for n in range(args.appends)}
+    lost = expected - set(final)
+    print(f"updates:            {len(latencies)}  errors: {len(errors)}")
+    print(f"throughput (req/s): {len(latencies) / elapsed:.1f}")
+    for pct in (50, 99):
+        print(f"p{pct} latency (ms):   {percentile(latencies, pct) * 1000:.2f}")
+    print(f"appends:            {len(expected)}  conflicts retried: {counters['conflicts']}  lost: {len(lost)}")
+    if lost:
+        sys.exit(f"FAIL: {len(lost)} of {len(expected)} concurrent appends were lost")
+    if errors:
+        sys.exit(f"FAIL: {len(errors)} updates failed, statuses {sorted(set(errors))}")
+
+
+if __name__ == "__main__":
+    main()
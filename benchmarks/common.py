@@ -0,0 +1,95 @@
+"""Helpers shared by the benchmark scripts: percentiles and bulk seeding of the user tables."""
+import random
+from datetime import date
+
+from sqlalchemy import func, insert, select
+
+SEED_BATCH = 10000
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def summarize(latencies, elapsed, errors=0):
+    if not latencies:
+        return {"count": 0, "errors": errors}
+    return {
+        "count": len(latencies),
+        "errors": errors,
+        "throughput": len(latencies) / elapsed if elapsed else 0.0,
+        "mean_ms": sum(latencies) / len(latencies) * 1000,
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p90_ms": percentile(latencies, 90) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+        "max_ms": max(latencies) * 1000,
+    }
+
+
+def seeded_mobile(i):
+    return f"{7000000000 + i}"
+
+
+def seeded_email(i):
+    return f"seed{i}@bench.io"
+
+
+def seed_users(total, rng=None, batch=SEED_BATCH, progress=False):
+    """Insert users until the tables hold `total`, rotating the three registration types.
+
+    Rows are written with multi-row INSERTs, bypassing the API, and user i always gets the same
+    contact key so repeated runs against the same database are comparable.
+    """
+    from app.contacts import contact_key
+    from app.database import SessionLocal
+    from app.models import (
+        BasicSignupData, ContactKey, PlatformRegistrationData, RegistrationType, SocialMediaData, UserSearch, UserTable,
+    )
+    from app.passwords import hash_password
+    from app.search import search_row
+
+    rng = rng or random.Random(0)
+    password_hash = hash_password("benchmark")
+    with SessionLocal() as db:
+        existing = db.scalar(select(func.count()).select_from(UserTable))
+        for start in range(existing, total, batch):
+            indexes = range(start, min(total, start + batch))
+            by_type = {0: [], 1: [], 2: []}
+            for i in indexes:
+                by_type[i % 3].append(i)
+
+            for kind, model, reg_type, foreign_key, rows in (
+                ("mobile_number", SocialMediaData, RegistrationType.SOCIAL_MEDIA, "social_media_id", [
+                    {"mobile_number": seeded_mobile(i), "first_name": f"first{i}", "last_name": f"last{i}",
+                     "hashtag": f"tag{rng.randrange(1000)}"} for i in by_type[0]
+                ]),
+                ("email", PlatformRegistrationData, RegistrationType.PROJECT_MANAGEMENT, "platform_registration_id", [
+                    {"email": seeded_email(i), "first_name": f"first{i}", "last_name": f"last{i}",
+                     "password": password_hash, "company_name": f"company{rng.randrange(1000)}"} for i in by_type[1]
+                ]),
+                ("mobile_number", BasicSignupData, RegistrationType.COMMON_SIGNUP, "basic_signup_id", [
+                    {"mobile_number": seeded_mobile(i), "first_name": f"first{i}", "last_name": f"last{i}",
+                     "dob": date(1970 + rng.randrange(40), 1 + rng.randrange(12), 1 + rng.randrange(28))} for i in by_type[2]
+                ]),
+            ):
+                if not rows:
+                    continue
+                detail_ids = db.execute(
+                    insert(model).returning(model.id, sort_by_parameter_order=True), rows
+                ).scalars().all()
+                user_ids = db.execute(
+                    insert(UserTable).returning(UserTable.id, sort_by_parameter_order=True),
+                    [{"type": reg_type, foreign_key: detail_id} for detail_id in detail_ids],
+                ).scalars().all()
+                db.execute(insert(ContactKey), [
+                    {"key": contact_key(kind, row[kind]), "kind": kind, "user_id": user_id}
+                    for row, user_id in zip(rows, user_ids)
+                ])
+                db.execute(insert(UserSearch), [search_row(user_id, reg_type, row) for row, user_id in zip(rows, user_ids)])
+            db.commit()
+            if progress:
+                print(f"seeded {indexes.stop}/{total}", end="\r", flush=True)
+        if progress:
+            print()
+        return db.scalar(select(func.count()).select_from(UserTable))
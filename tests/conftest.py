@@ -0,0 +1,68 @@
+"""Shared setup of the test suite: a throwaway SQLite database and one app client for the session.
+
+The app reads its configuration from the environment at import time, so it is set here, before
+any test module imports app. TEST_DATABASE_URL runs the suite against another (empty) database
+instead, e.g. Postgres for the paths SQLite doesn't take.
+"""
+import itertools
+import os
+import tempfile
+
+import pytest
+from sqlalchemy import event
+
+TEST_DIR = tempfile.mkdtemp(prefix="unisign-tests-")
+os.environ.update({
+    "DATABASE_URL": os.getenv("TEST_DATABASE_URL", f"sqlite:///{TEST_DIR}/test.db"),
+    "DB_MIGRATE_ON_STARTUP": "1",
+    "PASSWORD_HASH_WORKERS": "0",
+    "USER_CACHE_BACKEND": "none",
+    "LOG_LEVEL": "WARNING",
+})
+
+CONTACT_NUMBERS = itertools.count(1)
+
+
+@pytest.fixture(scope="session")
+def client():
+    from fastapi.testclient import TestClient
+
+    from app.main import app
+
+    with TestClient(app) as test_client:
+        yield test_client
+
+
+@pytest.fixture
+def register(client):
+    # POST /add_user with contact details no other test uses, returns the new user id
+    def register_user(reg_type="SOCIAL_MEDIA", **fields):
+        n = next(CONTACT_NUMBERS)
+        payload = {"type": reg_type, "first_name": "Test", "last_name": f"User{n}"}
+        if reg_type == "SOCIAL_MEDIA":
+            payload.update(mobile_number=f"{8000000000 + n}", hashtag="test")
+        elif reg_type == "PROJECT_MANAGEMENT":
+            payload.update(email=f"user{n}@example.com", password="secret123")
+        else:
+            payload.update(mobile_number=f"{8000000000 + n}", dob="1990-01-01")
+        payload.update(fields)
+        response = client.post("/add_user/", json=payload)
+        assert response.status_code == 200, response.text
+        return response.json()["id"]
+
+    return register_user
+
+
+@pytest.fixture
+def statements(client):
+    # SQL statements sent to the primary while the fixture is active
+    from app import database
+
+    executed = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        executed.append(statement)
+
+    event.listen(database.engine, "before_cursor_execute", before_cursor_execute)
+    yield executed
+    event.remove(database.engine, "before_cursor_execute", before_cursor_execute)
@@ -0,0 +1,141 @@
+import pytest
+
+from app import routes
+from app.database import SessionLocal, get_db
+
+from conftest import CONTACT_NUMBERS
+
+
+def social(**fields):
+    n = next(CONTACT_NUMBERS)
+    return {"type": "SOCIAL_MEDIA", "first_name": "Bulk", "last_name": f"User{n}", "mobile_number": f"{8000000000 + n}",
+            "hashtag": "bulk", **fields}
+
+
+def platform(**fields):
+    n = next(CONTACT_NUMBERS)
+    return {"type": "PROJECT_MANAGEMENT", "first_name": "Bulk", "last_name": f"User{n}", "email": f"bulk{n}@example.com",
+            "password": "secret123", **fields}
+
+
+def add_users(client, rows):
+    response = client.post("/add_users/", json=rows)
+    assert response.status_code == 200, response.text
+    return response.json()
+
+
+def test_mixed_batch_reports_each_row(client):
+    rows = [social(), platform(email="not-an-email"), social(mobile_number="123"), platform(), {"first_name": "Nobody"}]
+
+    body = add_users(client, rows)
+
+    assert [result["status"] for result in body["results"]] == ["created", "error", "error", "created", "error"]
+    assert (body["created"], body["failed"]) == (2, 3)
+    assert [result["index"] for result in body["results"]] == list(range(5))
+    assert [error["field"] for error in body["results"][1]["errors"]] == ["email"]
+    assert [error["field"] for error in body["results"][2]["errors"]] == ["mobile_number"]
+    for result in body["results"]:
+        if result["status"] == "created":
+            assert client.get(f"/get_user/{result['id']}/").status_code == 200
+
+
+def test_invalid_rows_report_their_field_errors(client):
+    rows = [
+        social(mobile_number="1"),
+        social(),
+        platform(email="bad"),
+        {"type": "COMMON_SIGNUP", "first_name": "Bulk", "last_name": "User", "mobile_number": "12345678901", "dob": "1990-01-01"},
+        {"type": "SOCIAL_MEDIA", "first_name": "Bulk", "mobile_number": "1234567890"},
+        platform(email="also@bad"),
+    ]
+
+    body = add_users(client, rows)
+
+    errors = {result["index"]: result["errors"] for result in body["results"] if result["status"] == "error"}
+    assert errors == {
+        0: [{"field": "mobile_number", "message": "Invalid mobile number length"}],
+        2: [{"field": "email", "message": "Invalid email format"}],
+        3: [{"field": "mobile_number", "message": "Invalid mobile number length"}],
+        4: [{"field": "last_name", "message": "Field required"}, {"field": "hashtag", "message": "Field required"}],
+        5: [{"field": "email", "message": "Invalid email format"}],
+    }
+    assert body["results"][0]["detail"] == "Invalid SOCIAL_MEDIA registration: mobile_number: Invalid mobile number length"
+    assert body["results"][1]["status"] == "created"
+
+
+def test_duplicates_in_the_batch_and_in_the_database(client, register):
+    first, registered = social(), social()
+    register(mobile_number=registered["mobile_number"])
+    email = platform()
+
+    body = add_users(client, [
+        first,
+        social(mobile_number=first["mobile_number"]),  # same contact as row 0
+        registered,  # already registered before the batch
+        email,
+        platform(email=email["email"].upper()),  # emails are compared normalized
+    ])
+
+    statuses = [(result["status"], result.get("detail")) for result in body["results"]]
+    assert statuses == [
+        ("created", None),
+        ("error", "Duplicate mobile_number in request"),
+        ("error", "User with this mobile number already exists"),
+        ("created", None),
+        ("error", "Duplicate email in request"),
+    ]
+
+
+def test_contact_taken_after_the_lookup_rejects_only_its_row(client, register, monkeypatch):
+    taken, free = social(), social()
+    register(mobile_number=taken["mobile_number"])
+    lookups = []
+    find_existing_keys = routes.find_existing_keys
+
+    def late_find_existing_keys(*args):
+        # The first lookup misses the user, as if it had been committed right after it
+        lookups.append(args)
+        return set() if len(lookups) == 1 else find_existing_keys(*args)
+
+    monkeypatch.setattr(routes, "find_existing_keys", late_find_existing_keys)
+
+    body = add_users(client, [taken, free])
+
+    assert len(lookups) == 2
+    assert [result["status"] for result in body["results"]] == ["error", "created"]
+    assert body["results"][0]["detail"] == "User with this mobile number already exists"
+
+
+def test_passwords_are_hashed_outside_the_transaction(client, monkeypatch):
+    sessions = []
+
+    def session():
+        db = SessionLocal()
+        sessions.append(db)
+        try:
+            yield db
+        finally:
+            db.close()
+
+    hash_passwords = routes.hash_passwords
+    in_transaction = []
+
+    def checking_hash_passwords(passwords):
+        in_transaction.append(sessions[0].in_transaction())
+        return hash_passwords(passwords)
+
+    monkeypatch.setitem(client.app.dependency_overrides, get_db, session)
+    monkeypatch.setattr(routes, "hash_passwords", checking_hash_passwords)
+
+    body = add_users(client, [platform(), platform()])
+
+    assert body["created"] == 2
+    assert in_transaction == [False]
+
+
+def test_batch_size_is_capped(client, monkeypatch):
+    monkeypatch.setattr(routes, "MAX_BULK_USERS", 2)
+
+    response = client.post("/add_users/", json=[social(), social(), social()])
+
+    assert response.status_code == 413
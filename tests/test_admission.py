@@ -0,0 +1,129 @@
+import threading
+import uuid
+
+import pytest
+
+from app import admission
+from app.database import SessionLocal
+from app.models import SocialMediaData
+
+from conftest import CONTACT_NUMBERS
+
+
+def social(**fields):
+    n = next(CONTACT_NUMBERS)
+    return {"type": "SOCIAL_MEDIA", "first_name": "Admission", "last_name": f"User{n}", "mobile_number": f"{8000000000 + n}",
+            "hashtag": "admission", **fields}
+
+
+def registered(mobile_number):
+    with SessionLocal() as db:
+        return db.query(SocialMediaData).filter_by(mobile_number=mobile_number).count()
+
+
+@pytest.fixture
+def rate_limiter(monkeypatch):
+    # Per-worker buckets that don't refill during the test
+    limiter = admission.MemoryRateLimiter()
+    monkeypatch.setattr(admission, "rate_limiter", limiter)
+    monkeypatch.setattr(admission, "RATE_LIMIT_IP_RATE", 0.001)
+    monkeypatch.setattr(admission, "RATE_LIMIT_CONTACT_RATE", 0.001)
+    return limiter
+
+
+def test_idempotency_key_replays_the_first_response(client):
+    payload, key = social(), str(uuid.uuid4())
+
+    first = client.post("/add_user/", json=payload, headers={"Idempotency-Key": key})
+    retry = client.post("/add_user/", json=payload, headers={"Idempotency-Key": key})
+
+    assert first.status_code == retry.status_code == 200
+    assert retry.json() == first.json()
+    assert retry.headers["Idempotent-Replayed"] == "true"
+    assert "Idempotent-Replayed" not in first.headers
+    assert registered(payload["mobile_number"]) == 1
+
+
+def test_idempotency_key_replays_a_rejection(client, register):
+    payload, key = social(), str(uuid.uuid4())
+    register(mobile_number=payload["mobile_number"])
+
+    first = client.post("/add_user/", json=payload, headers={"Idempotency-Key": key})
+    retry = client.post("/add_user/", json=payload, headers={"Idempotency-Key": key})
+
+    assert first.status_code == retry.status_code == 400
+    assert retry.json() == first.json()
+    assert retry.headers["Idempotent-Replayed"] == "true"
+
+
+def test_idempotency_key_with_a_different_body_is_rejected(client):
+    payload, key = social(), str(uuid.uuid4())
+    client.post("/add_user/", json=payload, headers={"Idempotency-Key": key})
+
+    response = client.post("/add_user/", json=social(), headers={"Idempotency-Key": key})
+
+    assert response.status_code == 422
+    assert response.json()["detail"] == "Idempotency-Key was already used with a different request body"
+
+
+def test_empty_client_bucket_answers_429(client, rate_limiter, monkeypatch):
+    monkeypatch.setattr(admission, "RATE_LIMIT_IP_BURST", 2)
+
+    payloads = [social() for _ in range(3)]
+
+    responses = [client.post("/add_user/", json=payload) for payload in payloads]
+
+    assert [response.status_code for response in responses] == [200, 200, 429]
+    assert int(responses[2].headers["Retry-After"]) > 0
+    assert registered(payloads[2]["mobile_number"]) == 0
+
+
+def test_empty_contact_bucket_answers_429_and_releases_the_key(client, rate_limiter, monkeypatch):
+    monkeypatch.setattr(admission, "RATE_LIMIT_CONTACT_BURST", 1)
+    payload, key = social(), str(uuid.uuid4())
+    client.post("/add_user/", json=payload)
+
+    limited = client.post("/add_user/", json=payload, headers={"Idempotency-Key": key})
+    rate_limiter._buckets.clear()
+    retry = client.post("/add_user/", json=payload, headers={"Idempotency-Key": key})
+
+    assert limited.status_code == 429
+    # The 429 was not recorded, the retry ran for real (and met the existing user)
+    assert retry.status_code == 400
+    assert "Idempotent-Replayed" not in retry.headers
+
+
+def test_single_flight_shares_one_registration_between_identical_requests(client, monkeypatch):
+    copies = 4
+    single_flight = admission.SingleFlight()
+    monkeypatch.setattr(admission, "single_flight", single_flight)
+    joined, waiting = threading.Semaphore(0), []
+    join = single_flight._join
+
+    def counting_join(key, fingerprint):
+        flight, leading = join(key, fingerprint)
+        if leading:
+            # The leader waits until every copy is in flight, so none of them can run on its own
+            for _ in range(copies - 1):
+                joined.acquire(timeout=10)
+        else:
+            waiting.append(key)
+            joined.release()
+        return flight, leading
+
+    monkeypatch.setattr(single_flight, "_join", counting_join)
+    payload, responses = social(), [None] * copies
+
+    def post(i):
+        responses[i] = client.post("/add_user/", json=payload)
+
+    threads = [threading.Thread(target=post, args=(i,)) for i in range(copies)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(timeout=30)
+
+    assert len(waiting) == copies - 1
+    assert [response.status_code for response in responses] == [200] * copies
+    assert len({response.json()["id"] for response in responses}) == 1
+    assert registered(payload["mobile_number"]) == 1
@@ -0,0 +1,90 @@
+import pytest
+from sqlalchemy import func, select
+from sqlalchemy.dialects import postgresql
+
+from app import purge, repository, routes
+from app.cache import LRUCache
+from app.database import SessionLocal
+from app.models import BasicSignupData, ContactKey, PlatformRegistrationData, SocialMediaData, User, UserSearch, UserTable
+
+DETAIL_TABLES = (
+    ("SOCIAL_MEDIA", SocialMediaData, "social_media_id"),
+    ("PROJECT_MANAGEMENT", PlatformRegistrationData, "platform_registration_id"),
+    ("COMMON_SIGNUP", BasicSignupData, "basic_signup_id"),
+)
+
+
+@pytest.fixture(params=["returning", "cte"])
+def delete_path(request, client, monkeypatch):
+    # DELETE ... RETURNING plus one DELETE per table, or the single Postgres statement with CTEs
+    from app import database
+
+    if request.param == "cte" and database.engine.dialect.name != "postgresql":
+        pytest.skip("data-modifying CTEs need Postgres (TEST_DATABASE_URL)")
+    monkeypatch.setattr(repository, "uses_delete_cte", lambda db: request.param == "cte")
+    # Users are written to both layouts, so the users row has to go too
+    monkeypatch.setattr(repository, "DUAL_WRITE", True)
+    monkeypatch.setattr(routes, "DUAL_WRITE", True)
+    cache = LRUCache()
+    monkeypatch.setattr(routes, "user_cache", cache)
+    monkeypatch.setattr(purge, "user_cache", cache)
+    return cache
+
+
+@pytest.fixture
+def users(client, register):
+    # One cached user per registration type, with the detail row id of each
+    registered = []
+    for reg_type, model, foreign_key in DETAIL_TABLES:
+        user_id = register(reg_type)
+        assert client.get(f"/get_user/{user_id}/").status_code == 200
+        with SessionLocal() as db:
+            registered.append((user_id, model, getattr(db.get(UserTable, user_id), foreign_key)))
+    return registered
+
+
+def leftovers(user_id, model, detail_id):
+    # Rows of the user still in each table
+    with SessionLocal() as db:
+        return {
+            table: db.scalar(select(func.count()).select_from(table).where(condition))
+            for table, condition in (
+                (UserTable, UserTable.id == user_id),
+                (model, model.id == detail_id),
+                (ContactKey, ContactKey.user_id == user_id),
+                (UserSearch, UserSearch.user_id == user_id),
+                (User, User.id == user_id),
+            )
+        }
+
+
+def assert_gone(client, cache, users):
+    for user_id, model, detail_id in users:
+        assert set(leftovers(user_id, model, detail_id).values()) == {0}, (user_id, leftovers(user_id, model, detail_id))
+        assert cache.get(user_id) is None
+        assert client.get(f"/get_user/{user_id}/").status_code == 404
+
+
+def test_delete_user_removes_every_row(client, delete_path, users):
+    for user_id, _, _ in users:
+        assert delete_path.get(user_id) is not None
+        assert client.delete(f"/delete_user/{user_id}/").status_code == 200
+
+    assert_gone(client, delete_path, users)
+
+
+def test_purge_removes_every_row(client, delete_path, users):
+    response = client.post("/users/purge/", json={"ids": [user_id for user_id, _, _ in users]})
+
+    assert response.status_code == 200, response.text
+    assert response.json() == {"deleted": 3, "batches": 1}
+    assert_gone(client, delete_path, users)
+
+
+def test_delete_cte_covers_every_table(monkeypatch):
+    # Runs on SQLite too: the Postgres statement deletes from each table the RETURNING path does
+    monkeypatch.setattr(repository, "DUAL_WRITE", True)
+    sql = str(repository.delete_users_cte(UserTable.id == 1).compile(dialect=postgresql.dialect()))
+    for table in ("user_table", "social_media_data", "platform_registration_data", "basic_signup_data",
+                  "contact_keys", "user_search", "users"):
+        assert f"DELETE FROM {table} " in sql, table
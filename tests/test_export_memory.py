@@ -0,0 +1,19 @@
+import os
+import pathlib
+import subprocess
+import sys
+
+ROOT = pathlib.Path(__file__).resolve().parent.parent
+
+
+def test_export_memory_stays_flat(tmp_path):
+    # Own process and database: RSS of the test process says nothing about the export. A
+    # materialized export of 50000 users grows it by tens of MiB, a streamed one by a few.
+    env = {**os.environ, "DATABASE_URL": f"sqlite:///{tmp_path}/export.db"}
+    for export_format in ("ndjson", "csv"):
+        result = subprocess.run(
+            [sys.executable, "-m", "benchmarks.bench_export_memory", "--users", "50000",
+             "--format", export_format, "--budget-mb", "10"],
+            cwd=ROOT, env=env, capture_output=True, text=True, timeout=300,
+        )
+        assert result.returncode == 0, result.stdout + result.stderr
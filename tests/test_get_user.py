@@ -0,0 +1,25 @@
+import os
+import subprocess
+import sys
+
+MISSING_USER_ASYNC = """
+from fastapi.testclient import TestClient
+from app.main import app
+with TestClient(app) as client:
+    response = client.get("/get_user/999999/")
+assert response.status_code == 404, (response.status_code, response.text)
+"""
+
+
+def test_missing_user_is_404(client):
+    response = client.get("/get_user/999999/")
+
+    assert response.status_code == 404
+    assert response.json()["detail"] == "User not found"
+
+
+def test_missing_user_is_404_in_async_mode(tmp_path):
+    # Fresh interpreter: DB_MODE is read when app.main is imported
+    env = {**os.environ, "DB_MODE": "async", "DATABASE_URL": f"sqlite:///{tmp_path}/async.db"}
+    result = subprocess.run([sys.executable, "-c", MISSING_USER_ASYNC], env=env, capture_output=True, text=True)
+    assert result.returncode == 0, result.stderr
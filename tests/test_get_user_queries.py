@@ -0,0 +1,25 @@
+import pytest
+
+from app import repository
+
+
+@pytest.fixture(params=["split", "unified"])
+def storage(request, monkeypatch):
+    # Users are written to both layouts (dual write), reads come from the one under test
+    monkeypatch.setattr(repository, "READ_UNIFIED", request.param == "unified")
+    monkeypatch.setattr("app.routes.DUAL_WRITE", True)
+    return request.param
+
+
+@pytest.mark.parametrize("reg_type", ["SOCIAL_MEDIA", "PROJECT_MANAGEMENT", "COMMON_SIGNUP"])
+def test_get_user_is_one_select(client, register, statements, storage, reg_type):
+    user_id = register(reg_type)
+    statements.clear()
+
+    response = client.get(f"/get_user/{user_id}/")
+
+    assert response.status_code == 200, response.text
+    assert response.json()["type"] == reg_type
+    assert len(statements) == 1, statements
+    assert statements[0].lstrip().upper().startswith("SELECT")
+    assert ("FROM users" in statements[0]) == (storage == "unified")
@@ -0,0 +1,60 @@
+import pytest
+
+from app import repository
+from app.models import BasicSignupData, PlatformRegistrationData, RegistrationType, SocialMediaData, UserTable
+from app.repository import UNIFIED_INSERT, UNIFIED_MODELS, unified_row
+
+# Per type: more than the 500 keys selectinload puts in one IN list
+PER_TYPE = 700
+
+
+@pytest.fixture(scope="module")
+def many_users(client):
+    # Rows written straight to both layouts, the API would take a while for this many
+    from app.database import SessionLocal
+
+    users = []
+    for n in range(PER_TYPE):
+        users += [
+            UserTable(type=RegistrationType.SOCIAL_MEDIA, social_media_data=SocialMediaData(
+                mobile_number=f"{6000000000 + n}", first_name="Batch", last_name=f"Social{n}", hashtag="batch")),
+            UserTable(type=RegistrationType.PROJECT_MANAGEMENT, platform_registration_data=PlatformRegistrationData(
+                email=f"batch{n}@example.com", first_name="Batch", last_name=f"Platform{n}", password="x", company_name="Batch")),
+            UserTable(type=RegistrationType.COMMON_SIGNUP, basic_signup_data=BasicSignupData(
+                mobile_number=f"{6100000000 + n}", first_name="Batch", last_name=f"Basic{n}")),
+        ]
+    with SessionLocal() as db:
+        db.add_all(users)
+        db.flush()
+        # One executemany per type: the rows of a type share their columns
+        for reg_type, model in UNIFIED_MODELS.items():
+            db.execute(UNIFIED_INSERT, [
+                unified_row(user.id, reg_type, user.user_specific_data.id, {
+                    field: getattr(user.user_specific_data, field) for field in model.detail_fields
+                })
+                for user in users if user.type == reg_type
+            ])
+        db.commit()
+        return [user.id for user in users]
+
+
+@pytest.fixture(params=["split", "unified"])
+def storage(request, monkeypatch):
+    monkeypatch.setattr(repository, "READ_UNIFIED", request.param == "unified")
+    return request.param
+
+
+def test_get_users_is_one_select_per_table(client, many_users, statements, storage):
+    # Unknown ids cost nothing extra: they come back as missing
+    ids = many_users + [10 ** 9]
+    statements.clear()
+
+    response = client.get("/users/", params={"ids": ",".join(map(str, ids))})
+
+    assert response.status_code == 200, response.text
+    users = response.json()["users"]
+    assert [user["id"] for user in users] == ids
+    assert sum(user.get("found", True) is False for user in users) == 1
+    assert all(user["user_data"]["first_name"] == "Batch" for user in users[:-1])
+    # users, or user_table plus one per detail table
+    assert len(statements) == (1 if storage == "unified" else 4), statements
@@ -0,0 +1,14 @@
+import pathlib
+import subprocess
+import sys
+
+ROOT = pathlib.Path(__file__).resolve().parent.parent
+
+
+def test_import_time_within_budget():
+    # The budget check itself lives in the benchmark script: a fresh interpreter per run, database unreachable
+    result = subprocess.run(
+        [sys.executable, "-m", "benchmarks.check_import_time", "--runs", "3"],
+        cwd=ROOT, capture_output=True, text=True, timeout=120,
+    )
+    assert result.returncode == 0, result.stdout + result.stderr
@@ -0,0 +1,31 @@
+import logging
+import subprocess
+import sys
+
+from app.instrumentation import configure_logging
+
+IMPORT_KEEPS_HANDLERS = """
+import logging
+handler = logging.StreamHandler()
+logging.getLogger().addHandler(handler)
+import app.main
+assert logging.getLogger().handlers == [handler], logging.getLogger().handlers
+"""
+
+
+def test_importing_the_app_leaves_logging_alone():
+    # Fresh interpreter: app.main is already imported in this one
+    result = subprocess.run([sys.executable, "-c", IMPORT_KEEPS_HANDLERS], capture_output=True, text=True)
+    assert result.returncode == 0, result.stderr
+
+
+def test_configure_logging_keeps_existing_handlers():
+    root = logging.getLogger()
+    handler = logging.NullHandler()
+    root.addHandler(handler)
+    try:
+        handlers = list(root.handlers)
+        configure_logging()
+        assert root.handlers == handlers
+    finally:
+        root.removeHandler(handler)
@@ -0,0 +1,14 @@
+def test_login_matches_email_case_insensitively(client, register):
+    register("PROJECT_MANAGEMENT", email="Mixed.Case@Example.com", password="secret123")
+
+    for email in ("Mixed.Case@Example.com", "mixed.case@example.com", "  MIXED.CASE@EXAMPLE.COM "):
+        response = client.post("/login/", json={"email": email, "password": "secret123"})
+        assert response.status_code == 200, (email, response.text)
+
+
+def test_login_rejects_wrong_password(client, register):
+    register("PROJECT_MANAGEMENT", email="wrong.password@example.com", password="secret123")
+
+    response = client.post("/login/", json={"email": "wrong.password@example.com", "password": "secret124"})
+
+    assert response.status_code == 401
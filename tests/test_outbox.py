@@ -0,0 +1,65 @@
+from datetime import datetime, timezone
+
+import pytest
+from sqlalchemy import delete, select
+
+from app.outbox import OutboxDispatcher, QueueSink
+
+
+@pytest.fixture
+def outbox(client):
+    from app.database import SessionLocal
+    from app.models import OutboxEvent
+
+    def add_events(count):
+        with SessionLocal() as db:
+            events = [OutboxEvent(event_type="test", payload={"n": n}) for n in range(count)]
+            db.add_all(events)
+            db.commit()
+            return [event.id for event in events]
+
+    def rows():
+        with SessionLocal() as db:
+            return {event.id: event for event in db.execute(select(OutboxEvent)).scalars()}
+
+    with SessionLocal() as db:
+        db.execute(delete(OutboxEvent))
+        db.commit()
+    yield add_events, rows
+
+
+def test_event_ids_are_never_reused(outbox):
+    add_events, rows = outbox
+    delivered = add_events(3)
+    OutboxDispatcher(QueueSink()).drain()
+    assert rows() == {}
+
+    # SQLite without AUTOINCREMENT would start over from the highest id left, which is none here
+    assert min(add_events(1)) > max(delivered)
+
+
+def test_delivery_runs_outside_the_claim_transaction(outbox):
+    add_events, rows = outbox
+    event_ids = add_events(2)
+    seen = []
+
+    class CheckingSink:
+        def deliver(self, message):
+            # The claim is committed: another connection sees the lease, and can write (SQLite
+            # would answer "database is locked" while the claiming transaction is open)
+            event = rows()[message["id"]]
+            seen.append(event.available_at.replace(tzinfo=timezone.utc) > datetime.now(timezone.utc))
+            add_events(1)
+            if message["id"] == event_ids[1]:
+                raise ConnectionError("sink down")
+
+    dispatcher = OutboxDispatcher(CheckingSink(), batch_size=2)
+    assert dispatcher.dispatch_batch() == 2
+    assert seen == [True, True]
+
+    left = rows()
+    assert event_ids[0] not in left
+    failed = left[event_ids[1]]
+    assert failed.attempts == 1
+    assert failed.last_error == "ConnectionError: sink down"
+    assert dispatcher.stats() == {"delivered": 1, "failed": 1, "dead": 0}
@@ -0,0 +1,111 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.sql.dml import UpdateBase
+
+from app.cache import LRUCache
+from app.models import UserTable
+from app.replicas import ReplicaRoutingMiddleware, ReplicaSet, ReplicaTarget, RoutingState, current_routing_state
+from app.repository import delete_users, delete_users_async
+from benchmarks.bench_replicas import copy_sqlite
+
+
+@pytest.fixture
+def stale_replica(client, register, monkeypatch, tmp_path):
+    # A user, then a SQLite copy of the primary that never sees later writes: a replica lagging forever
+    from app import database, routes
+
+    if database.engine.dialect.name != "sqlite":
+        pytest.skip("the stale replica is a copy of the SQLite primary")
+    user_id = register(first_name="Before")
+    replica_url = f"sqlite:///{tmp_path}/replica.db"
+    copy_sqlite(str(database.engine.url), replica_url)
+    replica = ReplicaTarget("replica1", create_engine(replica_url))
+    monkeypatch.setattr(database, "replicas", ReplicaSet([replica]))
+    cache = LRUCache()
+    monkeypatch.setattr(routes, "user_cache", cache)
+    yield user_id, cache
+    replica.engine.dispose()
+
+
+def first_name(response):
+    assert response.status_code == 200, response.text
+    return response.json()["user_data"]["first_name"]
+
+
+def test_writer_reads_its_write_past_stale_replica_and_cache(client, stale_replica):
+    user_id, cache = stale_replica
+    # Separate cookie jars; the app's lifespan already runs under the session client
+    app = ReplicaRoutingMiddleware(client.app)
+    writer, reader = TestClient(app), TestClient(app)
+
+    response = writer.put(f"/update_user/{user_id}/", json={"first_name": "After"})
+    assert response.status_code == 200, response.text
+    assert "db_primary_until" in writer.cookies
+
+    # Another client reads the replica: stale, and kept out of the cache
+    assert first_name(reader.get(f"/get_user/{user_id}/")) == "Before"
+    assert cache.get(user_id) is None
+
+    # The writer reads the primary, even past a cached copy its write's invalidation missed
+    stale = reader.get(f"/get_user/{user_id}/").json()
+    cache.set(user_id, stale, cache.read_token(user_id))
+    assert first_name(writer.get(f"/get_user/{user_id}/")) == "After"
+
+    # A primary read fills the cache, which then serves the fresh copy to everyone
+    cache.invalidate(user_id)
+    assert first_name(writer.get(f"/get_user/{user_id}/")) == "After"
+    assert cache.get(user_id)["user_data"]["first_name"] == "After"
+    assert first_name(reader.get(f"/get_user/{user_id}/")) == "After"
+
+
+def test_delete_sets_the_sticky_cookie(client, stale_replica):
+    user_id, cache = stale_replica
+    app = ReplicaRoutingMiddleware(client.app)
+    deleter = TestClient(app)
+
+    response = deleter.delete(f"/delete_user/{user_id}/")
+    assert response.status_code == 200, response.text
+    assert "db_primary_until" in deleter.cookies
+    # The replica still has the user, the client that deleted it reads the primary
+    assert deleter.get(f"/get_user/{user_id}/").status_code == 404
+
+
+class PostgresSession:
+    # Just enough of a Postgres session to run delete_users down its CTE path
+    def __init__(self):
+        self.statements = []
+
+    def get_bind(self):
+        return SimpleNamespace(dialect=SimpleNamespace(name="postgresql"))
+
+    def execute(self, statement):
+        self.statements.append(statement)
+        return SimpleNamespace(scalars=lambda: SimpleNamespace(all=lambda: [1]))
+
+
+class AsyncPostgresSession(PostgresSession):
+    async def execute(self, statement):
+        return super().execute(statement)
+
+
+@pytest.mark.parametrize("asynchronous", [False, True], ids=["sync", "async"])
+def test_cte_delete_marks_the_write(asynchronous):
+    # On Postgres the delete is a SELECT with data-modifying CTEs, which get_bind does not see as a write
+    state = RoutingState()
+    token = current_routing_state.set(state)
+    try:
+        if asynchronous:
+            session = AsyncPostgresSession()
+            assert asyncio.run(delete_users_async(session, UserTable.id == 1)) == [1]
+        else:
+            session = PostgresSession()
+            assert delete_users(session, UserTable.id == 1) == [1]
+    finally:
+        current_routing_state.reset(token)
+
+    assert not isinstance(session.statements[0], UpdateBase)
+    assert state.wrote
@@ -0,0 +1,71 @@
+import uuid
+
+import pytest
+
+
+@pytest.fixture
+def term():
+    # A query no other test's users match
+    return f"srch{uuid.uuid4().hex[:8]}"
+
+
+def search(client, q, **params):
+    response = client.get("/users/search/", params={"q": q, **params})
+    assert response.status_code == 200, response.text
+    return response.json()
+
+
+def test_results_are_ranked_exact_then_prefix_then_substring(client, register, term):
+    last_name_prefix = register(last_name=f"{term}son")
+    first_name_equal = register(first_name=term)
+    name_substring = register(first_name="Jo", last_name=f"ab{term}")
+    hashtag_equal = register(hashtag=f"#{term.upper()}")
+    email_prefix = register("PROJECT_MANAGEMENT", email=f"{term}.e@example.com")
+
+    page = search(client, term)
+
+    assert [(result["id"], result["rank"]) for result in page["results"]] == [
+        (first_name_equal, 0),
+        (hashtag_equal, 0),
+        (last_name_prefix, 1),
+        (email_prefix, 1),
+        (name_substring, 2),
+    ]
+    assert page["next_cursor"] is None
+
+
+def test_cursor_pages_through_every_match_once(client, register, term):
+    for i in range(3):
+        register(first_name=term)
+        register(last_name=f"{term}{i}")
+        register(last_name=f"x{term}{i}")
+    everything = [result["id"] for result in search(client, term, limit=100)["results"]]
+
+    seen, cursor = [], None
+    while True:
+        page = search(client, term, limit=2, **({"cursor": cursor} if cursor else {}))
+        seen += [result["id"] for result in page["results"]]
+        cursor = page["next_cursor"]
+        if cursor is None:
+            break
+
+    assert len(everything) == 9
+    assert seen == everything
+
+
+def test_malformed_cursor_is_rejected(client, term):
+    response = client.get("/users/search/", params={"q": term, "cursor": "not-a-cursor"})
+
+    assert response.status_code == 400
+
+
+@pytest.mark.parametrize("wildcard", ["%", "_"])
+def test_like_wildcards_in_the_query_match_literally(client, register, term, wildcard):
+    literal = register(last_name=f"{term}{wildcard}ab")
+    register(last_name=f"{term}xab")
+    register(hashtag=f"{term}xab")
+    register("PROJECT_MANAGEMENT", email=f"{term}xab@example.com")
+
+    page = search(client, f"{term}{wildcard}ab")
+
+    assert [result["id"] for result in page["results"]] == [literal]
@@ -0,0 +1,24 @@
+import os
+import pathlib
+import socket
+import subprocess
+import sys
+
+ROOT = pathlib.Path(__file__).resolve().parent.parent
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def test_concurrent_updates_lose_nothing(tmp_path):
+    # The benchmark at a small scale against a real uvicorn server: it fails on any lost append or failed update
+    env = {**os.environ, "DATABASE_URL": f"sqlite:///{tmp_path}/update.db"}
+    result = subprocess.run(
+        [sys.executable, "-m", "benchmarks.bench_update", "--users", "50", "--duration", "2",
+         "--concurrency", "4", "--writers", "4", "--appends", "5", "--port", str(free_port())],
+        cwd=ROOT, env=env, capture_output=True, text=True, timeout=300,
+    )
+    assert result.returncode == 0, result.stdout + result.stderr[-4000:]
@@ -0,0 +1,92 @@
+import pytest
+
+from app import routes
+from app.cache import FakeRedis, LRUCache, RedisCache
+from app.database import SessionLocal
+from app.models import SocialMediaData, UserTable
+
+
+class FlakyRedis(FakeRedis):
+    # FakeRedis whose writes fail while down is set, reads keep working
+    down = False
+
+    def incr(self, key):
+        if self.down:
+            raise ConnectionError("redis down")
+        return super().incr(key)
+
+
+@pytest.fixture(params=["memory", "fakeredis"])
+def cache(request, monkeypatch):
+    cache = LRUCache() if request.param == "memory" else RedisCache(FlakyRedis())
+    monkeypatch.setattr(routes, "user_cache", cache)
+    return cache
+
+
+def first_name(client, user_id):
+    response = client.get(f"/get_user/{user_id}/")
+    assert response.status_code == 200, response.text
+    return response.json()["user_data"]["first_name"]
+
+
+def test_update_invalidates(client, register, cache):
+    user_id = register(first_name="Before")
+    assert first_name(client, user_id) == "Before"
+    assert cache.get(user_id) is not None
+
+    assert client.put(f"/update_user/{user_id}/", json={"first_name": "After"}).status_code == 200
+
+    assert cache.get(user_id) is None
+    assert first_name(client, user_id) == "After"
+
+
+def test_delete_invalidates(client, register, cache):
+    user_id = register()
+    first_name(client, user_id)
+
+    assert client.delete(f"/delete_user/{user_id}/").status_code == 200
+
+    assert cache.get(user_id) is None
+    assert client.get(f"/get_user/{user_id}/").status_code == 404
+
+
+def test_fill_racing_an_update_is_dropped(client, register, cache, monkeypatch):
+    user_id = register(first_name="Before")
+    get_user_with_data = routes.get_user_with_data
+
+    def read_then_update(requested_id, db):
+        # The read sees the old row, then an update commits and invalidates before the fill
+        user = get_user_with_data(requested_id, db)
+        with SessionLocal() as other:
+            detail_id = other.get(UserTable, requested_id).social_media_id
+            other.get(SocialMediaData, detail_id).first_name = "After"
+            other.commit()
+        cache.invalidate(requested_id)
+        return user
+
+    monkeypatch.setattr(routes, "get_user_with_data", read_then_update)
+    assert first_name(client, user_id) == "Before"
+    monkeypatch.setattr(routes, "get_user_with_data", get_user_with_data)
+
+    assert cache.get(user_id) is None
+    assert first_name(client, user_id) == "After"
+
+
+def test_failed_invalidation_never_serves_the_old_value(client, register, monkeypatch):
+    redis = FlakyRedis()
+    cache = RedisCache(redis)
+    monkeypatch.setattr(routes, "user_cache", cache)
+    user_id = register(first_name="Before")
+    assert first_name(client, user_id) == "Before"
+
+    redis.down = True
+    assert client.put(f"/update_user/{user_id}/", json={"first_name": "After"}).status_code == 200
+    # The stale entry is still in Redis, reads bypass it and are not cached
+    assert first_name(client, user_id) == "After"
+    assert first_name(client, user_id) == "After"
+    assert cache.stats()["pending_invalidations"] == 1
+
+    redis.down = False
+    assert first_name(client, user_id) == "After"
+    assert cache.stats()["pending_invalidations"] == 0
+    assert cache.get(user_id)["user_data"]["first_name"] == "After"
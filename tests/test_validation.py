@@ -0,0 +1,27 @@
+from app.validation import field_error, validate_record, validate_records
+
+MOBILE = field_error("mobile_number", "Invalid mobile number length")
+EMAIL = field_error("email", "Invalid email format")
+
+
+def test_batch_errors_are_listed_per_row_and_field():
+    records = [
+        {"mobile_number": "1234567890", "email": "ok@example.com"},
+        {"mobile_number": "123", "email": "ok@example.com"},
+        {"mobile_number": "1234567890", "email": "not-an-email"},
+        {"mobile_number": "12345678901", "email": "@example.com"},
+        {"email": "missing-mobile"},
+        {"mobile_number": "1"},
+        {},
+    ]
+
+    errors = validate_records(records)
+
+    assert errors == {1: [MOBILE], 2: [EMAIL], 3: [MOBILE, EMAIL], 4: [EMAIL], 5: [MOBILE]}
+    # The column checks agree with the single-record ones
+    assert {index: validate_record(record) for index, record in enumerate(records) if validate_record(record)} == errors
+
+
+def test_batch_without_a_field_skips_its_check():
+    assert validate_records([{"first_name": "A"}, {"first_name": "B"}]) == {}
+    assert validate_records([]) == {}
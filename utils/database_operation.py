@@ -1,6 +1,10 @@
+import logging
+
 import psycopg2
 from psycopg2.extensions import ISOLATION_LEVEL_AUTOCOMMIT
 
+logger = logging.getLogger(__name__)
+
 def create_database(admin_url: str, database_name: str):
     try:
         conn = psycopg2.connect(admin_url)
@@ -12,11 +16,11 @@ def create_database(admin_url: str, database_name: str):
 
         if not exists:
             cursor.execute(f"CREATE DATABASE {database_name};")
-            print(f"Database '{database_name}' created successfully.")
+            logger.info("Database '%s' created successfully.", database_name)
         else:
-            print(f"Database '{database_name}' already exists.")
+            logger.info("Database '%s' already exists.", database_name)
 
         cursor.close()
         conn.close()
     except Exception as e:
-        print(f"Error while creating the database: {e}")
+        logger.error("Error while creating the database: %s", e)